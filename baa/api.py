@@ -0,0 +1,495 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import Any, Awaitable, Callable, Collection, TypeVar
+
+from baa.arlo_api import ArloClient
+from baa.attendee_parser import butter
+from baa.cache import MetadataCache
+from baa.classes import ArloRegistration, Attendee, Meeting
+from baa.helpers import CredentialProvider
+from baa.exceptions import (
+    ApiCommunicationFailure,
+    AttendeeFileProcessingError,
+    EventNotFound,
+    SessionNotFound,
+)
+from baa.matching import AmbiguousMatch, AttendeeIndex, FuzzyMatch, FuzzyMatcher
+from baa.scheduler import DEFAULT_MAX_CONCURRENCY, WriteResult, WriteScheduler
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Errors that stop one attendee file from being processed, without stopping the others processed with it
+ATTENDEE_FILE_ERRORS = (
+    EventNotFound,
+    SessionNotFound,
+    ApiCommunicationFailure,
+    AttendeeFileProcessingError,
+)
+
+
+@dataclass
+class AttendanceResult:
+    """
+    Outcome of updating attendance from an attendee file or a parsed meeting. Error is set if the file could not be processed, when it is one of several files processed together.
+
+    Registrations are matched to attendees by name or email, and their attendance is updated, left unchanged if Arlo already records it, or failed to update. In a dry run, updated registrations are the ones that would be updated. Timings are the seconds taken by each step, which overlap as they run concurrently.
+    """
+
+    attendee_file: Path | None = None
+    platform: str | None = None
+    event_code: str | None = None
+    session_date: datetime | None = None
+    event_name: str | None = None
+    session_name: str | None = None
+    registrations: list[ArloRegistration] = field(default_factory=list)
+    failed_updates: list[WriteResult] = field(default_factory=list)
+    not_attempted: list[ArloRegistration] = field(default_factory=list)
+    ambiguous_matches: list[AmbiguousMatch] = field(default_factory=list)
+    fuzzy_matches: list[FuzzyMatch] = field(default_factory=list)
+    unregistered_attendees: list[Attendee] = field(default_factory=list)
+    matched: list[ArloRegistration] = field(default_factory=list)
+    unmatched_attendees: list[Attendee] = field(default_factory=list)
+    timings: dict[str, float] = field(default_factory=dict)
+    error: Exception | None = None
+
+    @property
+    def updated(self) -> list[ArloRegistration]:
+        """Registrations with attendance changed in Arlo"""
+        return [
+            reg
+            for reg in self.registrations
+            if reg.attendance_registered is not None and reg.attendance_changed
+        ]
+
+    @property
+    def unchanged(self) -> list[ArloRegistration]:
+        """Registrations with attendance already recorded in Arlo"""
+        return [
+            reg
+            for reg in self.registrations
+            if reg.attendance_registered is not None and not reg.attendance_changed
+        ]
+
+    @property
+    def failed(self) -> list[ArloRegistration]:
+        """Registrations with attendance that could not be updated in Arlo"""
+        return [reg for reg in self.registrations if reg.attendance_registered is None]
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert the outcome to a JSON serialisable dict, with the status of each registration and a summary of the attendance changed"""
+
+        def person(attendee: Attendee) -> dict[str, str]:
+            return {"name": attendee.name, "email": attendee.email}
+
+        def registration(reg: ArloRegistration) -> dict[str, Any]:
+            if reg.attendance_registered is None:
+                status = "failed"
+            else:
+                status = "changed" if reg.attendance_changed else "unchanged"
+            return {
+                **person(reg),
+                "attendance": reg.target_attendance.value,
+                "previous_attendance": (
+                    reg.current_attendance.value if reg.current_attendance else None
+                ),
+                "status": status,
+            }
+
+        changed, unchanged, failed = count_attendance(self.registrations)
+        return {
+            "attendee_file": (
+                str(self.attendee_file) if self.attendee_file is not None else None
+            ),
+            "platform": self.platform,
+            "event_code": self.event_code,
+            "session_date": (
+                self.session_date.isoformat() if self.session_date else None
+            ),
+            "event_name": self.event_name,
+            "session_name": self.session_name,
+            "summary": {
+                "changed": changed,
+                "unchanged": unchanged,
+                "failed": failed,
+                "not_attempted": len(self.not_attempted),
+                "matched": len(self.matched),
+                "unmatched_attendees": len(self.unmatched_attendees),
+                "unregistered_attendees": len(self.unregistered_attendees),
+            },
+            "registrations": [registration(reg) for reg in self.registrations],
+            "not_attempted": [person(reg) for reg in self.not_attempted],
+            "ambiguous_matches": [
+                {
+                    "registration": person(match.registration),
+                    "attendees": [person(attendee) for attendee in match.attendees],
+                }
+                for match in self.ambiguous_matches
+            ],
+            "fuzzy_matches": [
+                {
+                    "registration": person(match.registration),
+                    "attendee": person(match.attendee),
+                    "score": match.score,
+                }
+                for match in self.fuzzy_matches
+            ],
+            "unmatched_attendees": [
+                person(attendee) for attendee in self.unmatched_attendees
+            ],
+            "unregistered_attendees": [
+                person(attendee) for attendee in self.unregistered_attendees
+            ],
+            "timings": self.timings,
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+
+def create_arlo_client(
+    platform: str,
+    cache_ttl: int,
+    refresh_cache: bool,
+    max_concurrency: int,
+    credential_provider: CredentialProvider | None,
+) -> ArloClient:
+    """Create the ArloClient of a platform, with a metadata cache unless cache_ttl is 0"""
+    cache = (
+        MetadataCache(platform, ttl=timedelta(hours=cache_ttl), refresh=refresh_cache)
+        if cache_ttl > 0
+        else None
+    )
+    try:
+        return ArloClient(
+            platform,
+            cache=cache,
+            max_concurrency=max_concurrency,
+            credential_provider=credential_provider,
+        )
+    except Exception:
+        if cache is not None:
+            cache.close()
+        raise
+
+
+def count_attendance(registrations: list[ArloRegistration]) -> tuple[int, int, int]:
+    """Count the registrations with changed, unchanged and failed attendance"""
+    # Unchanged registrations are not updated, so they cannot fail
+    failed = sum(reg.attendance_registered is None for reg in registrations)
+    unchanged = sum(
+        reg.attendance_registered is not None and not reg.attendance_changed
+        for reg in registrations
+    )
+    changed = len(registrations) - failed - unchanged
+    return changed, unchanged, failed
+
+
+async def process_registrations(
+    arlo_client: ArloClient,
+    meeting: Meeting,
+    event_code: str | None,
+    session_date: datetime | None,
+    min_duration: int,
+    skip_absent: bool,
+    dry_run: bool,
+    attendee_index: AttendeeIndex | None = None,
+    fuzzy_matcher: FuzzyMatcher | None = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> tuple[
+    list[ArloRegistration], list[WriteResult], list[tuple[ArloRegistration, Attendee]]
+]:
+    """
+    Match the registrations of a session to the attendees of a meeting, and update their attendance in Arlo.
+
+    Returns:
+        tuple[list[ArloRegistration], list[WriteResult], list[tuple[ArloRegistration, Attendee]]]: The registrations recorded, the attendance updates that did not succeed, and each registration matched to an attendee.
+    """
+    attendee_index = attendee_index or AttendeeIndex(meeting.attendees)
+    registrations = []
+    matches = []
+    scheduler = WriteScheduler(arlo_client, max_concurrency)
+    # Registrations without an exact match, held back until every exact match is known
+    unmatched_registrations = []
+    matched_attendees = set()
+
+    def register_attendance(reg: ArloRegistration, attendee: Attendee) -> None:
+        matches.append((reg, attendee))
+        if attendee.session_duration >= min_duration:
+            attendee.attendance_registered = True
+            reg.attendance_registered = True
+        else:
+            logger.debug(
+                f"Did not meet minimum duration threshold of{min_duration} mins"
+            )
+
+    def record_registration(reg: ArloRegistration) -> None:
+        # Skip absent registrations if flag is set
+        if skip_absent and not reg.attendance_registered:
+            return
+
+        registrations.append(reg)
+
+        # Only send updates that change the attendance recorded in Arlo
+        if not reg.attendance_changed:
+            logger.debug(f"Attendance for {reg} is already {reg.current_attendance}")
+        elif not dry_run:
+            scheduler.submit(reg)
+
+    async with scheduler:
+        # Attendance updates for each page are sent while the next page is downloading
+        async with aclosing(
+            arlo_client.aget_registration_pages(event_code, session_date)
+        ) as pages:
+            async for page in pages:
+                for reg in page:
+                    # Check if registration matches any meeting attendees
+                    if (attendee := attendee_index.match(reg)) is not None:
+                        logger.debug(f"Match found in Arlo for {attendee}")
+                        matched_attendees.add(id(attendee))
+                        register_attendance(reg, attendee)
+                    elif fuzzy_matcher is not None:
+                        unmatched_registrations.append(reg)
+                        continue
+
+                    record_registration(reg)
+
+        if fuzzy_matcher is not None and unmatched_registrations:
+            fuzzy_matches = fuzzy_matcher.match(
+                unmatched_registrations,
+                [
+                    attendee
+                    for attendee in meeting.attendees
+                    if id(attendee) not in matched_attendees
+                ],
+            )
+            suggested_registrations = set()
+            for match in fuzzy_matches:
+                if fuzzy_matcher.suggest_only:
+                    suggested_registrations.add(id(match.registration))
+                else:
+                    register_attendance(match.registration, match.attendee)
+
+            for reg in unmatched_registrations:
+                # Suggested matches are left unchanged so they can be reviewed
+                if id(reg) not in suggested_registrations:
+                    record_registration(reg)
+
+    unsuccessful = []
+    for result in scheduler.results:
+        if not result.success:
+            result.registration.attendance_registered = None
+            unsuccessful.append(result)
+
+    return registrations, unsuccessful, matches
+
+
+async def update_attendance(
+    arlo_client: ArloClient,
+    source: Path | Meeting,
+    event_code: str | None = None,
+    date: datetime | None = None,
+    min_duration: int = 0,
+    skip_absent: bool = False,
+    dry_run: bool = False,
+    fuzzy: str = "off",
+    fuzzy_threshold: float = 0.85,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_session: Callable[[AttendanceResult], None] | None = None,
+    session_dates: Collection[date] | None = None,
+) -> AttendanceResult:
+    """
+    Update Arlo attendance records based on attendees from an attendee file or a parsed meeting, with a client that may be shared with other updates.
+
+    Nothing is printed, the outcome is returned for the caller to report.
+
+    Args:
+        arlo_client (ArloClient): The client used to look up and update registrations.
+        source (Path | Meeting): The attendee file to update attendance from, or a meeting with its attendees. The attendees are marked with whether their attendance was registered.
+        event_code (str, optional): The event code, or None to use the event code of the attendee file or meeting.
+        date (datetime, optional): The session date, or None to use the meeting date of the attendee file or meeting.
+        min_duration (int, optional): Minimum duration (in minutes) for an attendee to be marked as present. Defaults to 0.
+        skip_absent (bool, optional): Only update attendance for present attendees. Defaults to False.
+        dry_run (bool, optional): Match attendees without updating any registration records. Defaults to False.
+        fuzzy (str, optional): Fuzzy matching mode, "off", "suggest" or "apply". Defaults to "off".
+        fuzzy_threshold (float, optional): Minimum similarity score for a fuzzy match. Defaults to 0.85.
+        max_concurrency (int, optional): Maximum number of attendance updates in flight for the file. Defaults to 8.
+        on_session (Callable[[AttendanceResult], None], optional): Called once the event and session names are known, while registrations are being updated.
+        session_dates (Collection[date], optional): Dates of the sessions being updated, when date is None. The meeting date must be one of them.
+
+    Raises:
+        AttendeeFileProcessingError: If the attendee file cannot be parsed.
+        EventNotFound: If the event cannot be found in Arlo.
+        SessionNotFound: If the session cannot be found in Arlo, or the meeting date is not one of session_dates.
+        ApiCommunicationFailure: If the Arlo API cannot be reached.
+        AuthenticationFailed: If authentication to the Arlo API fails.
+
+    Returns:
+        AttendanceResult: The outcome of updating attendance.
+    """
+    start = timer()
+    attendee_file = source if isinstance(source, Path) else None
+    logger.info(f"Processing attendees in {attendee_file or 'meeting'}")
+    result = AttendanceResult(attendee_file)
+
+    async def timed(step: str, awaitable: Awaitable[T]) -> T:
+        step_start = timer()
+        value = await awaitable
+        result.timings[step] = timer() - step_start
+        return value
+
+    def lookup_names(event_code: str, session_date: datetime) -> asyncio.Task:
+        return asyncio.create_task(
+            timed(
+                "lookup",
+                asyncio.gather(
+                    arlo_client.aget_event_name(event_code),
+                    arlo_client.aget_session_name(event_code, session_date),
+                ),
+            )
+        )
+
+    names = processing = None
+    try:
+        # Resolving the event and session doesn't depend on the attendee file when both are given, so it starts while the file is parsed
+        if event_code is not None and date is not None:
+            names = lookup_names(event_code, date)
+        if attendee_file is not None:
+            meeting = await timed(
+                "parse",
+                asyncio.to_thread(butter.get_attendees, attendee_file, event_code),
+            )
+        else:
+            meeting = source
+        result.event_code = event_code = event_code or meeting.event_code
+        result.session_date = session_date = date or meeting.start_date
+        if date is None and session_dates is not None:
+            if session_date.date() not in session_dates:
+                raise SessionNotFound(
+                    f"🚨 The meeting date in {attendee_file.name if attendee_file else 'the meeting'} ({session_date.strftime('%Y-%m-%d')}) is not one of the dates given"
+                )
+        if names is None:
+            names = lookup_names(event_code, session_date)
+
+        attendee_index = AttendeeIndex(meeting.attendees)
+        fuzzy_matcher = (
+            FuzzyMatcher(fuzzy_threshold, suggest_only=fuzzy == "suggest")
+            if fuzzy != "off"
+            else None
+        )
+        # Registrations are fetched as soon as the session is known, while the event and session names are looked up
+        processing = asyncio.create_task(
+            timed(
+                "registrations",
+                process_registrations(
+                    arlo_client,
+                    meeting,
+                    event_code,
+                    session_date,
+                    min_duration,
+                    skip_absent,
+                    dry_run,
+                    attendee_index,
+                    fuzzy_matcher,
+                    max_concurrency,
+                ),
+            )
+        )
+        result.event_name, result.session_name = await names
+        if on_session is not None:
+            on_session(result)
+
+        result.registrations, unsuccessful, matches = await processing
+    finally:
+        # Lookups still running after an error are cancelled, and errors of finished lookups are retrieved
+        tasks = [task for task in (names, processing) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    result.failed_updates = [update for update in unsuccessful if update.attempted]
+    result.not_attempted = [
+        update.registration for update in unsuccessful if not update.attempted
+    ]
+    result.ambiguous_matches = attendee_index.ambiguous_matches
+    if fuzzy_matcher is not None:
+        result.fuzzy_matches = fuzzy_matcher.matches
+    result.matched = [reg for reg, _ in matches]
+    matched_attendees = {id(attendee) for _, attendee in matches}
+    result.unmatched_attendees = [
+        atnd for atnd in meeting.attendees if id(atnd) not in matched_attendees
+    ]
+    result.unregistered_attendees = [
+        atnd for atnd in meeting.attendees if not atnd.attendance_registered
+    ]
+    result.timings["total"] = timer() - start
+    return result
+
+
+async def update_attendee_files(
+    arlo_client: ArloClient,
+    attendee_files: list[Path],
+    event_code: str | None,
+    dates: list[datetime],
+    min_duration: int,
+    skip_absent: bool,
+    dry_run: bool,
+    fuzzy: str = "off",
+    fuzzy_threshold: float = 0.85,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> list[AttendanceResult]:
+    """
+    Update Arlo attendance records from several attendee files concurrently, with one ArloClient.
+
+    A file that cannot be processed does not stop the others, its error is set on its result instead.
+
+    Returns:
+        list[AttendanceResult]: The outcome of each attendee file, in the order given.
+    """
+    session_dates = (
+        {session_date.date() for session_date in dates} if len(dates) > 1 else None
+    )
+
+    async def update(attendee_file: Path) -> AttendanceResult:
+        try:
+            result = await update_attendance(
+                arlo_client,
+                attendee_file,
+                event_code,
+                dates[0] if len(dates) == 1 else None,
+                min_duration,
+                skip_absent,
+                dry_run,
+                fuzzy,
+                fuzzy_threshold,
+                max_concurrency,
+                session_dates=session_dates,
+            )
+        except ATTENDEE_FILE_ERRORS as e:
+            logger.error(f"Unable to process {attendee_file}: {e!r}")
+            result = AttendanceResult(attendee_file, error=e)
+        result.platform = arlo_client.platform
+        return result
+
+    preconnect = asyncio.create_task(arlo_client.preconnect())
+    # Sessions of files being parsed are resolved in the meantime, and their own lookups wait for it
+    sessions = (
+        asyncio.create_task(arlo_client.aget_sessions_on_dates(event_code, dates))
+        if event_code is not None and len(dates) > 1
+        else None
+    )
+    updates = [
+        asyncio.ensure_future(update(attendee_file)) for attendee_file in attendee_files
+    ]
+    try:
+        return await asyncio.gather(*updates)
+    finally:
+        # Errors resolving the sessions are reported by the files using them. Errors failing every file, such as authentication failing, stop the other files
+        tasks = [task for task in (preconnect, sessions, *updates) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
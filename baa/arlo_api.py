@@ -1,15 +1,18 @@
+import asyncio
 import logging
 import httpx
 from lxml import etree
-from copy import deepcopy
-from datetime import datetime
-from typing import Iterator
-
-from baa.helpers import (
-    get_keyring_credentials,
-    remove_keyring_credentials,
-)
-from baa.classes import AttendanceStatus, ArloRegistration
+from collections import Counter, deque
+from datetime import date, datetime, timedelta
+from functools import partial
+from timeit import default_timer as timer
+from contextlib import aclosing, suppress
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, TypeVar
+
+from baa.helpers import CredentialProvider
+from baa.cache import CachedResponse, MetadataCache
+from baa.resilience import AdaptiveLimiter, CircuitBreaker, RetryPolicy
+from baa.classes import AttendanceStatus, ArloEvent, ArloRegistration, ArloSession
 from baa.exceptions import (
     AuthenticationFailed,
     ApiCommunicationFailure,
@@ -19,6 +22,81 @@ from baa.exceptions import (
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+DEFAULT_MAX_PREFETCH = 4
+DEFAULT_MAX_CONCURRENCY = 8
+# Registrations are expanded with their parent registration and contact, so each page is fetched in one request
+REGISTRATION_EXPAND = "EventSessionRegistration,EventSessionRegistration/ParentRegistration,EventSessionRegistration/ParentRegistration/Contact"
+# Upper bound for the adaptive number of pages fetched concurrently
+MAX_READ_CONCURRENCY = 16
+# Idle connections are kept open between the metadata lookups, registration pages and attendance updates of a run
+KEEPALIVE_EXPIRY = 30.0
+
+
+def _page_offset(href: str) -> tuple[str | None, str | None]:
+    """Get the skip and top parameters of a paginated URL"""
+    params = httpx.URL(href).params
+    return (params.get("skip"), params.get("top"))
+
+
+def _parse_attendance(attendance: str | None) -> AttendanceStatus | None:
+    """Get the AttendanceStatus of an Attendance value, or None if it is missing or not recognised"""
+    try:
+        return AttendanceStatus(attendance)
+    except ValueError:
+        return None
+
+
+def _parse_registrations(page: etree._Element) -> list[ArloRegistration]:
+    """Get the registrations on a page of EventSessionRegistrations, excluding cancelled registrations"""
+    registrations = []
+    for reg in page.iterfind(".//Contact"):
+        status = reg.getparent().getparent().find("./Status").text
+        if status == "Cancelled":
+            continue
+
+        first_name = reg.find("./FirstName").text
+        last_name = reg.find("./LastName").text
+        email = reg.find("./Email").text
+        # Traverse back up to the event session registration, and the Link with its href
+        session_reg = reg.getparent().getparent().getparent().getparent()
+        reg_href = session_reg.getparent().get("href")
+
+        registrations.append(
+            ArloRegistration(
+                name=f"{first_name} {last_name}",
+                email=email,
+                reg_href=reg_href,
+                current_attendance=_parse_attendance(
+                    session_reg.findtext("./Attendance")
+                ),
+            )
+        )
+
+    return registrations
+
+
+def _session_date_filter(first: date, last: date) -> str:
+    """
+    Get the filter query option for EventSessions starting between two dates.
+
+    The window is widened by a day either side so sessions are not missed due to timezone offsets, the exact dates are matched afterwards.
+    """
+    window_start = (first - timedelta(days=1)).strftime("%Y-%m-%dT00:00:00Z")
+    window_end = (last + timedelta(days=2)).strftime("%Y-%m-%dT00:00:00Z")
+    return f"StartDateTime ge datetime('{window_start}') and StartDateTime lt datetime('{window_end}')"
+
+
+class _CredentialAuth(httpx.Auth):
+    """HTTP Basic authentication with the Arlo credentials of a CredentialProvider, which are only read when the first request is sent"""
+
+    def __init__(self, credential_provider: CredentialProvider):
+        self.credential_provider = credential_provider
+
+    def auth_flow(self, request: httpx.Request) -> Iterator[httpx.Request]:
+        yield from httpx.BasicAuth(*self.credential_provider.get()).auth_flow(request)
+
 
 class ArloClient:
     """
@@ -28,114 +106,615 @@ class ArloClient:
     to manage Events, EventSessions, and EventSessionRegistrations within the Arlo training managament platform.
     """
 
-    def __init__(self, platform: str):
+    def __init__(
+        self,
+        platform: str,
+        cache: MetadataCache | None = None,
+        max_prefetch: int = DEFAULT_MAX_PREFETCH,
+        retry_policy: RetryPolicy | None = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        circuit_breaker: CircuitBreaker | None = None,
+        http2: bool = True,
+        credential_provider: CredentialProvider | None = None,
+    ):
         """
         Initialize the ArloClient.
 
         Args:
             platform (str): The platform subdomain (e.g., "myarlo") for API requests.
+            cache (MetadataCache, optional): Persistent cache for Event and EventSession lookups. The client takes ownership and closes it.
+            max_prefetch (int, optional): Initial number of pages of results fetched concurrently, adapted to Arlo's responses. Prefetching is disabled if 1 or less. Defaults to 4.
+            retry_policy (RetryPolicy, optional): Policy for retrying GET requests and attendance updates that fail with a transient error. Defaults to RetryPolicy().
+            max_concurrency (int, optional): Maximum number of attendance updates in flight, adapted below this to Arlo's responses. Defaults to 8.
+            circuit_breaker (CircuitBreaker, optional): Circuit breaker shared by every request, which stops sending requests while the Arlo API is failing. Defaults to CircuitBreaker().
+            http2 (bool, optional): Negotiate HTTP/2 with Arlo, so requests in flight share one connection. Defaults to True.
+            credential_provider (CredentialProvider, optional): Provides the credentials used to authenticate to the Arlo API. Defaults to CredentialProvider().
         """
+        self.platform = platform
         self.base_url = f"https://{platform}.arlo.co/api/2012-02-01/auth/resources"
-        auth = httpx.BasicAuth(*get_keyring_credentials())
-        self.client = httpx.Client(auth=auth)
-        self.async_client = httpx.AsyncClient(auth=auth, http2=True)
-        self.event_cache: dict[str, etree._Element] = {}
-        self.session_cache: dict[str, etree._Element] = {}
+        self.credential_provider = credential_provider or CredentialProvider()
+        self.auth = _CredentialAuth(self.credential_provider)
+        # Over HTTP/1.1 each request in flight needs its own connection, so the pool allows every read and write to be in flight at once
+        self.limits = httpx.Limits(
+            max_connections=MAX_READ_CONCURRENCY + max_concurrency,
+            max_keepalive_connections=MAX_READ_CONCURRENCY + max_concurrency,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        self.async_client = httpx.AsyncClient(
+            auth=self.auth, http2=http2, limits=self.limits
+        )
+        self.event_index: dict[str, ArloEvent] = {}
+        self.event_catalogue_indexed = False
+        # Key = EventID, Value = Sessions of the event keyed by SessionID
+        self.session_index: dict[str, dict[str, ArloSession]] = {}
+        self.session_listing_indexed: set[str] = set()
+        self.cache = cache
+        self.response_cache_stats: Counter[str] = Counter()
+        self.max_prefetch = max_prefetch
+        # Key = Lookup, Value = Task of the lookup, while in progress
+        self.pending_lookups: dict[tuple, asyncio.Task] = {}
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.read_limiter = AdaptiveLimiter(
+            "Read",
+            max_limit=max(max_prefetch, MAX_READ_CONCURRENCY),
+            initial=max(1, max_prefetch),
+        )
+        self.write_limiter = AdaptiveLimiter("Write", max_limit=max_concurrency)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
         logger.debug(f"Initialising ArloClient for {self.base_url}")
 
-    def _get_response(self, url: str, params: dict = None) -> httpx.Response:
+    async def _aget_response(
+        self, url: str, params: dict = None, revalidate: bool = False
+    ) -> httpx.Response:
         """
-        Sends a GET request to the specified URL and handles authentication errors.
+        Sends a GET request to the specified URL and handles authentication errors, sharing the HTTP/2 connection pool used for attendance updates. Transient failures are retried with the client's retry policy.
+
+        If a metadata cache is configured, responses are stored with their ETag and Last-Modified validators. Cached responses within the TTL are reused without a request, otherwise they are revalidated with a conditional request and reused if the API responds with 304 Not Modified.
 
         Args:
             url (str): The URL to send the request to.
             params (dict, optional): Query parameters for the request.
+            revalidate (bool, optional): Always revalidate cached responses, even if they are within the TTL. Defaults to False.
 
         Raises:
             AuthenticationFailed: If authentication fails.
-            ApiCommunicationFailure: If the API response is not 200 OK.
+            ApiCommunicationFailure: If the API response is not 200 OK, or the request could not be sent once retries are exhausted.
+            CircuitOpen: If the request was not sent because the Arlo API is failing.
 
         Returns:
-            requests.Response: The response from the API.
+            httpx.Response: The response from the API.
         """
-        res = self.client.get(url, params=params)
+        cache_key, cached, headers = self._prepare_request(url, params)
+        if cached is not None and self._is_fresh(cached, revalidate):
+            self._count_response_cache("hit", cache_key)
+            return httpx.Response(200, content=cached.body)
+
+        try:
+            res = await self.retry_policy.asend(
+                "GET",
+                url,
+                partial(
+                    self.read_limiter.asend,
+                    partial(
+                        self.circuit_breaker.asend,
+                        partial(
+                            self.async_client.get, url, params=params, headers=headers
+                        ),
+                    ),
+                ),
+            )
+        except httpx.TransportError as e:
+            raise ApiCommunicationFailure(
+                "🚨 Unable to communicate with the Arlo API"
+            ) from e
+        return self._handle_response(res, cache_key, cached)
+
+    def _prepare_request(
+        self, url: str, params: dict | None
+    ) -> tuple[str | None, CachedResponse | None, dict]:
+        """
+        Looks up the cached response for a GET request, and the conditional request headers to revalidate it.
+
+        Returns:
+            tuple[str | None, CachedResponse | None, dict]: The cache key, the cached response if any, and the request headers.
+        """
+        if self.cache is None:
+            return (None, None, {})
+
+        headers = {}
+        cache_key = str(httpx.URL(url).copy_merge_params(params or {}))
+        cached = self.cache.get_response(cache_key)
+        if cached is not None:
+            if cached.etag is not None:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified is not None:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        return (cache_key, cached, headers)
+
+    def _is_fresh(self, cached: CachedResponse, revalidate: bool) -> bool:
+        """Whether a cached response can be reused without revalidating it"""
+        return (
+            not revalidate
+            and not self.cache.refresh
+            and cached.is_fresh(self.cache.ttl)
+        )
+
+    def _handle_response(
+        self,
+        res: httpx.Response,
+        cache_key: str | None,
+        cached: CachedResponse | None,
+    ) -> httpx.Response:
+        """
+        Handles the response to a GET request, reusing the cached response if it was not modified, and storing successful responses in the cache.
+
+        Raises:
+            AuthenticationFailed: If authentication fails.
+            ApiCommunicationFailure: If the API response is not 200 OK.
+        """
+        if res.status_code == 304 and cached is not None:
+            self.cache.touch_response(cache_key)
+            self._count_response_cache("revalidated", cache_key)
+            return httpx.Response(200, content=cached.body)
+
         if res.status_code == 401:
-            remove_keyring_credentials()
+            self.credential_provider.invalidate()
             raise AuthenticationFailed(
                 "🚨 Authentication to the Arlo API failed. Ensure you have provided the correct credentials"
             )
         elif not res.is_success:
-            raise ApiCommunicationFailure("🚨 Unable to communicate with the Arlo API")
+            raise ApiCommunicationFailure(
+                "🚨 Unable to communicate with the Arlo API", status=res.status_code
+            )
+
+        if self.cache is not None:
+            self.cache.set_response(
+                cache_key,
+                res.headers.get("ETag"),
+                res.headers.get("Last-Modified"),
+                res.content,
+            )
+            self._count_response_cache("miss", cache_key)
 
         return res
 
-    def _append_paginated(self, root: etree._Element) -> etree._Element:
+    def _count_response_cache(self, outcome: str, url: str) -> None:
+        """Count a response cache hit, miss or revalidation"""
+        self.response_cache_stats[outcome] += 1
+        logger.debug(f"Response cache {outcome} for {url}")
+
+    def _next_page_urls(self, next_href: str, total_count: int | None) -> list[str]:
         """
-        Fetches additional pages of results and appends to the root element if the API indicates more pages are available (Link element with rel atrribute set to next)
+        Extrapolates the URLs of the following pages from the skip and top parameters of the next page link, so they can be fetched concurrently.
+
+        If the total number of results is known, the URLs of all remaining pages are returned. Otherwise a window of pages the size of the current read concurrency limit is returned, as the last page is not known in advance.
 
         Args:
-            root (etree._Element): The root element to append results to.
+            next_href (str): The href of the next page link.
+            total_count (int | None): The total number of results, if exposed by the API.
 
         Returns:
-            etree._Element: The updated root element with appended paginated results.
+            list[str]: The URLs of the pages to fetch, starting with the next page.
         """
-        next_link = root.find("./Link[@rel='next']")
+        next_url = httpx.URL(next_href)
+        try:
+            skip = int(next_url.params["skip"])
+            top = int(next_url.params["top"])
+        except (KeyError, ValueError):
+            return [next_href]
+
+        if self.max_prefetch <= 1 or top <= 0:
+            return [next_href]
+
+        window = self.read_limiter.limit
+        end = total_count if total_count is not None else skip + top * window
+        return [next_href] + [
+            str(next_url.copy_merge_params({"skip": page_skip}))
+            for page_skip in range(skip + top, end, top)
+        ]
+
+    def _index_event_page(self, page: etree._Element) -> None:
+        """Adds a compact record of each Event on a page to the event index"""
+        events = []
+        for event in page.iterfind(".//Event"):
+            code = event.findtext("./Code")
+            if code is None:
+                continue
 
-        while next_link is not None:
-            res = self._get_response(next_link.get("href"))
+            events.append(
+                ArloEvent(
+                    event_id=event.findtext("./EventID"),
+                    code=code,
+                    name=event.findtext("./Name"),
+                )
+            )
 
-            next_page = etree.fromstring(res.content)
-            for elem in next_page:
-                # Copy element as appending will reparent the node
-                root.append(deepcopy(elem))
+        self.event_index.update((event.code, event) for event in events)
+        if self.cache is not None:
+            self.cache.set_events(events)
 
-            next_link = next_page.find("./Link[@rel='next']")
+    def _index_session_page(self, event_id: str, page: etree._Element) -> None:
+        """Adds a compact record of each EventSession on a page to the session index of the Event"""
+        sessions = self.session_index.setdefault(event_id, {})
+        for session in page.iterfind(".//EventSession"):
+            start = session.findtext("./StartDateTime")
+            if start is None:
+                continue
+
+            session_id = session.findtext("./SessionID")
+            sessions[session_id] = ArloSession(
+                session_id=session_id,
+                event_id=event_id,
+                name=session.findtext("./Name"),
+                # Only the local date and time are kept, e.g. 2024-01-01T18:30:00 from 2024-01-01T18:30:00.0000000+01:00
+                start=datetime.strptime(start[:19], "%Y-%m-%dT%H:%M:%S"),
+            )
 
-        return root
+    def _sessions_on(self, event_id: str, session_date: date) -> list[ArloSession]:
+        """Get the indexed sessions of an Event starting on a date, ordered by start."""
+        return sorted(
+            (
+                session
+                for session in self.session_index.get(event_id, {}).values()
+                if session.start.date() == session_date
+            ),
+            key=lambda session: session.start,
+        )
+
+    def _cached_sessions(self, event_id: str, session_date: date) -> list[ArloSession]:
+        """Get the sessions of an Event on a date from the metadata cache, adding them to the session index"""
+        if self.cache is None:
+            return []
 
-    def _get_event_tree(self, event_code: str) -> etree._Element:
+        sessions = self.cache.get_sessions(event_id, session_date)
+        self.session_index.setdefault(event_id, {}).update(
+            (session.session_id, session) for session in sessions
+        )
+        return sessions
+
+    async def _shared_lookup(self, key: tuple, lookup: Callable[[], Awaitable[T]]) -> T:
         """
-        Retrieves the Events XML tree for a specific event code.
+        Runs a lookup once for concurrent callers with the same key, so the event name, session name and registrations can be looked up concurrently without requesting the same Event or EventSessions more than once.
 
         Args:
-            event_code (str): The event code to retrieve.
+            key (tuple): Identifies the lookup.
+            lookup (Callable[[], Awaitable[T]]): Runs the lookup.
+
+        Returns:
+            T: The result of the lookup.
+        """
+        if (task := self.pending_lookups.get(key)) is None:
+            task = asyncio.ensure_future(lookup())
+            self.pending_lookups[key] = task
+            task.add_done_callback(lambda _: self.pending_lookups.pop(key, None))
+
+        # One caller being cancelled does not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    async def _afetch_pages(
+        self, urls: list[str], revalidate: bool = False
+    ) -> AsyncIterator[etree._Element]:
+        """
+        Fetches pages concurrently, and yields them in order. At most as many pages as the read limiter allows in flight are fetched ahead of the page being consumed, and each response is dropped once its page is yielded, so only the pages in the look-ahead window are held in memory.
+
+        Args:
+            urls (list[str]): The URLs of the pages to fetch.
+            revalidate (bool, optional): Always revalidate cached pages, even if they are within the TTL. Defaults to False.
+
+        Yields:
+            etree._Element: The root element of each page.
+        """
+        remaining = iter(urls)
+        tasks: deque[asyncio.Future[httpx.Response]] = deque()
+        try:
+            while True:
+                while len(tasks) < max(1, self.read_limiter.limit) and (
+                    url := next(remaining, None)
+                ):
+                    tasks.append(
+                        asyncio.ensure_future(
+                            self._aget_response(url, revalidate=revalidate)
+                        )
+                    )
+                if not tasks:
+                    return
+
+                page = etree.fromstring((await tasks.popleft()).content)
+                yield page
+                del page
+        finally:
+            # Speculatively fetched pages past the last page are not needed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _aget_pages(
+        self, url: str, params: dict = None, revalidate: bool = False
+    ) -> AsyncIterator[etree._Element]:
+        """
+        Sends a GET request for the first page of results, and returns an async iterator over it and any additional pages the API indicates are available (Link element with rel atrribute set to next)
+
+        The first page is requested immediately so API errors are raised by this call, additional pages are only requested once the iterator is consumed.
+
+        Args:
+            url (str): The URL to send the request to.
+            params (dict, optional): Query parameters for the request.
+            revalidate (bool, optional): Always revalidate cached pages, even if they are within the TTL. Defaults to False.
+
+        Returns:
+            AsyncIterator[etree._Element]: The root element of each page, in order.
+        """
+        res = await self._aget_response(url, params=params, revalidate=revalidate)
+        return self._aiter_pages(etree.fromstring(res.content), revalidate)
+
+    async def _aiter_pages(
+        self, first_page: etree._Element, revalidate: bool = False
+    ) -> AsyncIterator[etree._Element]:
+        """
+        Yields the first page of results, followed by each additional page as it arrives. Pages are not retained, so each page can be discarded once consumed.
+
+        When the next page link has skip and top parameters, the following pages are prefetched concurrently while earlier pages are being processed, and yielded in order.
+
+        Args:
+            first_page (etree._Element): The root element of the first page.
+            revalidate (bool, optional): Always revalidate cached pages, even if they are within the TTL. Defaults to False.
+
+        Yields:
+            etree._Element: The root element of each page.
+        """
+        next_link = first_page.find("./Link[@rel='next']")
+        total_count = first_page.findtext("./TotalCount")
+        total_count = int(total_count) if total_count is not None else None
+        yield first_page
+        del first_page
+
+        while next_link is not None:
+            urls = self._next_page_urls(next_link.get("href"), total_count)
+            async with aclosing(self._afetch_pages(urls, revalidate)) as pages:
+                i = 0
+                async for next_page in pages:
+                    next_link = next_page.find("./Link[@rel='next']")
+                    yield next_page
+                    del next_page
+
+                    # Stop at the last page, or if the API did not link to the extrapolated page
+                    if next_link is None or (
+                        i + 1 < len(urls)
+                        and _page_offset(next_link.get("href"))
+                        != _page_offset(urls[i + 1])
+                    ):
+                        break
+                    i += 1
+
+    async def _aget_filtered_pages(
+        self, url: str, params: dict, lookup: str
+    ) -> AsyncIterator[etree._Element] | None:
+        """
+        Sends a GET request using the API's filter query option, which some platforms reject.
+
+        Args:
+            url (str): The URL to send the request to.
+            params (dict): Query parameters for the request, including the filter.
+            lookup (str): What is being looked up, used for logging.
 
         Raises:
-            EventNotFound: If the event cannot be found.
+            ApiCommunicationFailure: If the request failed for any other reason than the API rejecting the filter, such as a server error.
 
         Returns:
-            etree._Element: The event tree.
+            AsyncIterator[etree._Element] | None: The pages of filtered results, or None if the API rejected the filter.
         """
-        if event_code in self.event_cache:
-            return self.event_cache[event_code]
+        try:
+            return await self._aget_pages(url, params=params)
+        except ApiCommunicationFailure as e:
+            # Platforms without the filter query option respond with a client error such as 400 Bad Request
+            if e.status is None or not 400 <= e.status < 500:
+                raise
+            logger.debug(f"Filtered lookup for {lookup} was rejected with {e.status}")
+            return None
+
+    async def _aget_event(self, event_code: str) -> ArloEvent | None:
+        """
+        Retrieves the indexed Event for a specific event code.
 
-        res = self._get_response(f"{self.base_url}/events", params={"expand": "Event"})
-        event_tree = self._append_paginated(root=etree.fromstring(res.content))
-        self.event_cache[event_code] = event_tree
-        return event_tree
+        The metadata cache is checked first, then the filtered lookup is tried. If the API rejects the filter or does not return the event, the full event catalogue is indexed instead, which happens at most once per client.
 
-    def _get_session_tree(self, event_id: str) -> etree._Element:
+        Args:
+            event_code (str): The event code to retrieve.
+
+        Returns:
+            ArloEvent | None: The event, or None if no event exists with the code.
+        """
+        if event_code in self.event_index:
+            return self.event_index[event_code]
+
+        return await self._shared_lookup(
+            ("event", event_code), partial(self._alookup_event, event_code)
+        )
+
+    async def _alookup_event(self, event_code: str) -> ArloEvent | None:
+        if self.cache is not None:
+            if event := self.cache.get_event(event_code):
+                self.event_index[event_code] = event
+                return event
+
+        start = timer()
+        event_pages = await self._aget_filtered_pages(
+            f"{self.base_url}/events",
+            {"expand": "Event", "filter": f"Code eq '{event_code}'"},
+            f"event {event_code}",
+        )
+        if event_pages is not None:
+            async for page in event_pages:
+                self._index_event_page(page)
+            if event_code in self.event_index:
+                logger.debug(
+                    f"Resolved event {event_code} with filtered lookup in {timer() - start} seconds"
+                )
+                return self.event_index[event_code]
+
+        if not self.event_catalogue_indexed:
+            # Lookups of other events waiting for the catalogue share one download
+            await self._shared_lookup(
+                ("event_catalogue",), self._aindex_event_catalogue
+            )
+            logger.debug(
+                f"Indexed full event catalogue ({len(self.event_index)} events) in {timer() - start} seconds"
+            )
+
+        return self.event_index.get(event_code)
+
+    async def _aindex_event_catalogue(self) -> None:
+        # Only the compact event records are kept, not the pages
+        event_pages = await self._aget_pages(
+            f"{self.base_url}/events", params={"expand": "Event"}
+        )
+        async for page in event_pages:
+            self._index_event_page(page)
+        self.event_catalogue_indexed = True
+
+    async def _aget_sessions(
+        self, event_id: str, start_date: datetime
+    ) -> list[ArloSession]:
         """
-        Retrieves the EventSessions XML tree for a specific Event.
+        Retrieves the EventSessions of an Event starting on a date.
+
+        The session index and metadata cache are checked first, then the filtered lookup is tried, falling back to indexing all sessions of the event if the API rejects the filter or returns no sessions on the date.
 
         Args:
             event_id (str): The event ID to retrieve sessions for.
+            start_date (datetime): The start date of the sessions.
+
+        Returns:
+            list[ArloSession]: The sessions on the date, ordered by start.
+        """
+        if sessions := self._sessions_on(event_id, start_date.date()):
+            return sessions
+
+        # A listing of several dates including this one answers the lookup without another request
+        for key, task in list(self.pending_lookups.items()):
+            if key[:2] == ("session_range", event_id) and (
+                key[2] <= start_date.date() <= key[3]
+            ):
+                with suppress(Exception):
+                    await asyncio.shield(task)
+                if sessions := self._sessions_on(event_id, start_date.date()):
+                    return sessions
+
+        return await self._shared_lookup(
+            ("sessions", event_id, start_date.date()),
+            partial(self._alookup_sessions, event_id, start_date),
+        )
+
+    async def _alookup_sessions(
+        self, event_id: str, start_date: datetime
+    ) -> list[ArloSession]:
+        session_date = start_date.date()
+        if sessions := self._cached_sessions(event_id, session_date):
+            return sessions
+
+        if event_id in self.session_listing_indexed:
+            return []
+
+        if await self._aindex_filtered_sessions(event_id, session_date, session_date):
+            if sessions := self._sessions_on(event_id, session_date):
+                if self.cache is not None:
+                    self.cache.set_sessions(sessions)
+                return sessions
+
+        await self._aindex_session_listing_once(event_id)
+        return self._sessions_on(event_id, session_date)
+
+    async def _aindex_filtered_sessions(
+        self, event_id: str, first: date, last: date
+    ) -> bool:
+        """
+        Adds the EventSessions of an Event starting between two dates to the session index, using the API's filter query option.
 
         Returns:
-            etree._Element: The session tree.
+            bool: Whether the sessions were indexed, or False if the API rejected the filter.
         """
-        if event_id in self.session_cache:
-            return self.session_cache[event_id]
+        session_pages = await self._aget_filtered_pages(
+            f"{self.base_url}/events/{event_id}/sessions",
+            {"expand": "EventSession", "filter": _session_date_filter(first, last)},
+            f"sessions of event {event_id}",
+        )
+        if session_pages is None:
+            return False
+
+        async for page in session_pages:
+            self._index_session_page(event_id, page)
+        return True
+
+    async def _aindex_session_listing_once(self, event_id: str) -> None:
+        """Indexes every EventSession of an Event, unless already indexed. Lookups of other dates waiting for the listing share one download."""
+        if event_id not in self.session_listing_indexed:
+            await self._shared_lookup(
+                ("session_listing", event_id),
+                partial(self._aindex_session_listing, event_id),
+            )
 
-        res = self._get_response(
+    async def _aindex_session_listing(self, event_id: str) -> None:
+        session_pages = await self._aget_pages(
             f"{self.base_url}/events/{event_id}/sessions",
             params={"expand": "EventSession"},
         )
-        session_tree = self._append_paginated(root=etree.fromstring(res.content))
-        self.session_cache[event_id] = session_tree
-        return session_tree
+        async for page in session_pages:
+            self._index_session_page(event_id, page)
+        if self.cache is not None:
+            self.cache.set_sessions(self.session_index.get(event_id, {}).values())
+        self.session_listing_indexed.add(event_id)
+
+    async def aget_sessions_on_dates(
+        self, event_code: str, dates: Iterable[datetime]
+    ) -> dict[date, list[ArloSession]]:
+        """
+        Retrieves the EventSessions of an Event on several dates, from one listing of the sessions between the first and last date. Lookups of the sessions on any of the dates while the listing is in progress wait for it, instead of sending their own request.
+
+        Args:
+            event_code (str): The event code to look up.
+            dates (Iterable[datetime]): The start dates of the sessions.
+
+        Returns:
+            dict[date, list[ArloSession]]: The sessions on each date, ordered by start.
+        """
+        event_id = await self._aget_event_id(event_code)
+        session_dates = sorted({start_date.date() for start_date in dates})
+
+        missing = []
+        for session_date in session_dates:
+            if self._sessions_on(event_id, session_date) or self._cached_sessions(
+                event_id, session_date
+            ):
+                continue
+            missing.append(session_date)
+
+        if missing and event_id not in self.session_listing_indexed:
+            await self._shared_lookup(
+                ("session_range", event_id, missing[0], missing[-1]),
+                partial(self._aindex_session_range, event_id, missing[0], missing[-1]),
+            )
+
+        return {
+            session_date: self._sessions_on(event_id, session_date)
+            for session_date in session_dates
+        }
+
+    async def _aindex_session_range(
+        self, event_id: str, first: date, last: date
+    ) -> None:
+        start = timer()
+        if not await self._aindex_filtered_sessions(event_id, first, last):
+            await self._aindex_session_listing_once(event_id)
+            return
+
+        if self.cache is not None:
+            self.cache.set_sessions(self.session_index.get(event_id, {}).values())
+        logger.debug(
+            f"Indexed sessions of event {event_id} from {first} to {last} in {timer() - start} seconds"
+        )
 
-    def _get_event_id(self, event_code: str) -> str:
+    async def _aget_event_id(self, event_code: str) -> str:
         """
         Retrieves the EventID for a given event Code.
 
@@ -148,16 +727,15 @@ class ArloClient:
         Returns:
             str: The event ID.
         """
-        event_tree = self._get_event_tree(event_code)
-        event_id = event_tree.findtext(f".//Code[. ='{event_code}']/../EventID")
-        if event_id is None:
+        event = await self._aget_event(event_code)
+        if event is None:
             raise EventNotFound(
                 f"🚨 Could not find any events corresponding to the event code: {event_code}"
             )
 
-        return event_id
+        return event.event_id
 
-    def _get_session_id(self, event_id: str, start_date: datetime) -> str:
+    async def _aget_session_id(self, event_id: str, start_date: datetime) -> str:
         """
         Retrieves the SessionID corresponding to a StartDate for a given EventID.
 
@@ -171,114 +749,106 @@ class ArloClient:
         Returns:
             str: The session ID.
         """
-        session_tree = self._get_session_tree(event_id)
-        date = start_date.strftime("%Y-%m-%d")
-
-        session_ids = session_tree.xpath(
-            f".//StartDateTime[contains(text(),'{date}')]/preceding-sibling::SessionID/text()"
-        )
-        if len(session_ids) == 0:
-            raise SessionNotFound(f"🚨 No session found on: {date}")
+        sessions = await self._aget_sessions(event_id, start_date)
+        if len(sessions) == 0:
+            raise SessionNotFound(
+                f"🚨 No session found on: {start_date.strftime('%Y-%m-%d')}"
+            )
 
-        return session_ids[0]
+        return sessions[0].session_id
 
-    def _get_registrations_tree(self, session_id: str) -> etree._Element:
+    async def aget_event_name(self, event_code: str) -> str:
         """
-        Retrieves the EventSessionRegistrations tree for a specific EventSession ID.
+        Retrieves the name of an Event given its code.
 
         Args:
-            session_id (str): The session ID to look up.
+            event_code (str): The event code to look up.
 
         Returns:
-            etree._Element: The registrations tree.
+            str: The name of the event, or "Not found" if it does not exist.
         """
-        res = self._get_response(
-            f"{self.base_url}/eventsessions/{session_id}/registrations",
-            params={
-                "expand": "EventSessionRegistration,EventSessionRegistration/ParentRegistration,EventSessionRegistration/ParentRegistration/Contact"
-            },
-        )
-        reg_tree = self._append_paginated(root=etree.fromstring(res.content))
+        event = await self._aget_event(event_code)
 
-        return reg_tree
+        return event.name if event is not None and event.name else "Not found"
 
-    def get_event_name(self, event_code: str) -> str:
+    async def aget_session_name(self, event_code: str, start_date: datetime) -> str:
         """
-        Retrieves the name of an Event given its code.
+        Retrieves the name of an EventSession for a given event code and start date.
 
         Args:
             event_code (str): The event code to look up.
+            start_date (datetime): The start date to match.
 
         Returns:
-            str: The name of the event, or "Not found" if it does not exist.
+            str: The name of the session, or "Not found" if it does not exist.
         """
-        event_tree = self._get_event_tree(event_code)
+        event_id = await self._aget_event_id(event_code)
+        sessions = await self._aget_sessions(event_id, start_date)
 
-        return event_tree.findtext(f".//Code[. ='{event_code}']/../Name") or "Not found"
+        return "Not found" if len(sessions) == 0 else sessions[0].name
 
-    def get_session_name(self, event_code: str, start_date: datetime) -> str:
+    async def _aget_registration_pages(
+        self, session_id: str
+    ) -> AsyncIterator[etree._Element]:
         """
-        Retrieves the name of an EventSession for a given event code and start date.
+        Retrieves the pages of EventSessionRegistrations for a specific EventSession ID.
 
         Args:
-            event_code (str): The event code to look up.
-            start_date (datetime): The start date to match.
+            session_id (str): The session ID to look up.
 
         Returns:
-            str: The name of the session, or "Not found" if it does not exist.
+            AsyncIterator[etree._Element]: The pages of registrations.
         """
-        event_id = self._get_event_id(event_code)
-        session_tree = self._get_session_tree(event_id)
-
-        date = start_date.strftime("%Y-%m-%d")
-        session_names = session_tree.xpath(
-            f".//StartDateTime[contains(text(),'{date}')]/preceding-sibling::Name/text()"
+        return await self._aget_pages(
+            f"{self.base_url}/eventsessions/{session_id}/registrations",
+            params={"expand": REGISTRATION_EXPAND},
+            # Registrations change between runs, so cached pages are only reused when unchanged
+            revalidate=True,
         )
-        return "Not found" if len(session_names) == 0 else session_names[0]
 
-    def get_registrations(
+    async def aget_registration_pages(
         self, event_code: str, session_date: datetime
-    ) -> Iterator[ArloRegistration]:
+    ) -> AsyncIterator[list[ArloRegistration]]:
         """
-        Retrieves registrations for a specific event code and session date.
+        Retrieves registrations for a specific event code and session date, one page at a time. The following pages are fetched while each page is being processed.
 
         Args:
             event_code (str): The event code to look up.
             session_date (datetime): The date of the session.
 
         Yields:
-            ArloRegistration: The registration information for each contact.
+            list[ArloRegistration]: The registration information for each contact on a page of results.
         """
         logger.debug(
             f"Retrieving registrations for event {event_code}, from {session_date}"
         )
-        event_id = self._get_event_id(event_code)
-        session_id = self._get_session_id(event_id, session_date)
-        registrations = self._get_registrations_tree(session_id)
+        event_id = await self._aget_event_id(event_code)
+        session_id = await self._aget_session_id(event_id, session_date)
 
-        for reg in registrations.findall(".//Contact"):
-            status = reg.getparent().getparent().find("./Status").text
-            if status == "Cancelled":
-                continue
+        registration_pages = await self._aget_registration_pages(session_id)
+        async with aclosing(registration_pages) as pages:
+            async for page in pages:
+                yield _parse_registrations(page)
 
-            first_name = reg.find("./FirstName").text
-            last_name = reg.find("./LastName").text
-            email = reg.find("./Email").text
-            # Traverse back up to Link with event session registration href
-            reg_href = (
-                reg.getparent()
-                .getparent()
-                .getparent()
-                .getparent()
-                .getparent()
-                .get("href")
-            )
+    async def aget_registrations(
+        self, event_code: str, session_date: datetime
+    ) -> AsyncIterator[ArloRegistration]:
+        """
+        Retrieves registrations for a specific event code and session date.
 
-            yield ArloRegistration(
-                name=f"{first_name} {last_name}",
-                email=email,
-                reg_href=reg_href,
-            )
+        Args:
+            event_code (str): The event code to look up.
+            session_date (datetime): The date of the session.
+
+        Yields:
+            ArloRegistration: The registration information for each contact.
+        """
+        async with aclosing(
+            self.aget_registration_pages(event_code, session_date)
+        ) as pages:
+            async for registrations in pages:
+                for reg in registrations:
+                    yield reg
 
     async def update_attendance(
         self, session_reg_href: str, attendance: AttendanceStatus
@@ -292,6 +862,9 @@ class ArloClient:
 
         Returns:
             bool: True if the update was successful, otherwise False.
+
+        Raises:
+            CircuitOpen: If the update was not sent because the Arlo API is failing.
         """
         headers = {"Content-Type": "application/xml"}
         payload = f"""<?xml version="1.0" encoding="utf-8"?>
@@ -299,8 +872,22 @@ class ArloClient:
             <replace sel="EventSessionRegistration/Attendance/text()[1]">{attendance.value}</replace>
         </diff>
         """
-        res = await self.async_client.patch(
-            session_reg_href, content=payload, headers=headers
+        # Setting an absolute attendance value is idempotent, so the update is safe to retry
+        res = await self.retry_policy.asend(
+            "PATCH",
+            session_reg_href,
+            partial(
+                self.write_limiter.asend,
+                partial(
+                    self.circuit_breaker.asend,
+                    partial(
+                        self.async_client.patch,
+                        session_reg_href,
+                        content=payload,
+                        headers=headers,
+                    ),
+                ),
+            ),
         )
         if not res.is_success:
             logger.error(
@@ -308,7 +895,31 @@ class ArloClient:
             )
         return res.is_success
 
+    async def preconnect(self) -> None:
+        """
+        Opens a connection to Arlo and reads the credentials ahead of the first request, so the TLS handshake and keyring lookup overlap other work at startup. Failures are left for the first request to report.
+        """
+        start = timer()
+        results = await asyncio.gather(
+            # Sent without credentials, the response is not needed and only opens the connection
+            self.async_client.head(self.base_url, auth=None),
+            asyncio.to_thread(self.credential_provider.get),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.debug(f"Unable to preconnect to Arlo: {result!r}")
+        logger.debug(f"Preconnected to Arlo in {timer() - start} seconds")
+
     async def close(self) -> None:
-        """Close the sync and async httpx clients"""
-        self.client.close()
+        """Close the httpx client and the metadata cache"""
+        if self.cache is not None:
+            logger.debug(
+                f"Response cache: {self.response_cache_stats['hit']} hits, {self.response_cache_stats['miss']} misses, {self.response_cache_stats['revalidated']} revalidated"
+            )
+            self.cache.close()
+        self.read_limiter.log_history()
+        self.write_limiter.log_history()
+        if self.retry_policy.retries:
+            logger.debug(f"Retried requests: {dict(self.retry_policy.retries)}")
         await self.async_client.aclose()
@@ -0,0 +1,303 @@
+import logging
+import os
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable
+
+from baa.classes import ArloEvent, ArloSession
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_TTL = timedelta(hours=24)
+# Entries are deleted when the cache is opened once they are older than this many TTLs (of at least the default TTL), as responses cached for filtered lookups would otherwise accumulate without bound
+PRUNE_AFTER_TTLS = 7
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    platform TEXT NOT NULL,
+    code TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    name TEXT,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (platform, code)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    platform TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    name TEXT,
+    start TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (platform, session_id)
+);
+CREATE INDEX IF NOT EXISTS sessions_event ON sessions (platform, event_id);
+CREATE TABLE IF NOT EXISTS responses (
+    platform TEXT NOT NULL,
+    url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    body BLOB NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (platform, url)
+);
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class CachedResponse:
+    """Body of a cached GET response, with the validators needed to revalidate it."""
+
+    etag: str | None
+    last_modified: str | None
+    body: bytes
+    fetched_at: float
+
+    def is_fresh(self, ttl: timedelta) -> bool:
+        """Check if the response was fetched or revalidated within the TTL."""
+        return time.time() - self.fetched_at < ttl.total_seconds()
+
+
+def get_cache_dir() -> Path:
+    """
+    Get the user cache directory for baa, following the conventions of the operating system.
+
+    Returns:
+        Path: The cache directory. The BAA_CACHE_DIR environment variable takes precedence if set.
+    """
+    if "BAA_CACHE_DIR" in os.environ:
+        return Path(os.environ["BAA_CACHE_DIR"])
+
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+
+    return base / "baa"
+
+
+class MetadataCache:
+    """
+    Persistent cache of Arlo Event and EventSession metadata and GET responses, shared between baa invocations.
+
+    Entries are stored in a SQLite database, which serialises writes from concurrent baa processes. Metadata older than the TTL is ignored when reading, while expired responses are kept so they can be revalidated. Entries of the platform older than PRUNE_AFTER_TTLS TTLs are deleted when the cache is opened.
+    """
+
+    def __init__(
+        self,
+        platform: str,
+        ttl: timedelta = DEFAULT_CACHE_TTL,
+        refresh: bool = False,
+        path: Path | None = None,
+    ):
+        """
+        Initialize the MetadataCache.
+
+        Args:
+            platform (str): The platform subdomain the cached metadata belongs to.
+            ttl (timedelta, optional): How long cached entries remain valid. Defaults to 24 hours.
+            refresh (bool, optional): If set, cached entries are ignored when reading but are still updated. Defaults to False.
+            path (Path, optional): The path of the cache database. Defaults to metadata.sqlite3 in the user cache directory.
+        """
+        self.platform = platform
+        self.ttl = ttl
+        self.refresh = refresh
+        self.path = path or get_cache_dir() / "metadata.sqlite3"
+        # Cached registration responses hold the names and emails of attendees, so only the user can read them. SQLite creates the WAL files with the permissions of the database
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.path.touch(mode=0o600, exist_ok=True)
+        self.path.chmod(0o600)
+
+        # Wait on locks held by other baa processes rather than failing immediately
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        self._prune()
+        logger.debug(f"Using metadata cache {self.path} (TTL {self.ttl})")
+
+    def _prune(self) -> None:
+        """Delete entries of the platform that have not been fetched or revalidated for PRUNE_AFTER_TTLS TTLs."""
+        retention = max(self.ttl, DEFAULT_CACHE_TTL) * PRUNE_AFTER_TTLS
+        oldest_kept = time.time() - retention.total_seconds()
+        with self.conn:
+            pruned = sum(
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE platform = ? AND fetched_at < ?",
+                    (self.platform, oldest_kept),
+                ).rowcount
+                for table in ("events", "sessions", "responses")
+            )
+        if pruned:
+            logger.debug(
+                f"Pruned {pruned} entries older than {retention} from metadata cache"
+            )
+
+    def _oldest_valid(self) -> float:
+        """Get the earliest fetch time for an entry to be valid, as a unix timestamp."""
+        return time.time() - self.ttl.total_seconds()
+
+    def get_event(self, event_code: str) -> ArloEvent | None:
+        """
+        Retrieves a cached Event by its code.
+
+        Args:
+            event_code (str): The event code to look up.
+
+        Returns:
+            ArloEvent | None: The event, or None if it is not cached or has expired.
+        """
+        if self.refresh:
+            return None
+
+        row = self.conn.execute(
+            "SELECT event_id, code, name FROM events WHERE platform = ? AND code = ? AND fetched_at > ?",
+            (self.platform, event_code, self._oldest_valid()),
+        ).fetchone()
+        if row is None:
+            return None
+
+        logger.debug(f"Found event {event_code} in metadata cache")
+        return ArloEvent(event_id=row[0], code=row[1], name=row[2])
+
+    def set_events(self, events: Iterable[ArloEvent]) -> None:
+        """
+        Adds or replaces Events in the cache.
+
+        Args:
+            events (Iterable[ArloEvent]): The events to cache.
+        """
+        fetched_at = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)",
+                (
+                    (self.platform, e.code, e.event_id, e.name, fetched_at)
+                    for e in events
+                ),
+            )
+
+    def get_sessions(self, event_id: str, session_date: date) -> list[ArloSession]:
+        """
+        Retrieves the cached EventSessions of an Event starting on a date.
+
+        Args:
+            event_id (str): The event ID to look up sessions for.
+            session_date (date): The date the sessions start on.
+
+        Returns:
+            list[ArloSession]: The sessions ordered by start, or an empty list if none are cached or they have expired.
+        """
+        if self.refresh:
+            return []
+
+        rows = self.conn.execute(
+            "SELECT session_id, event_id, name, start FROM sessions "
+            "WHERE platform = ? AND event_id = ? AND substr(start, 1, 10) = ? AND fetched_at > ? "
+            "ORDER BY start",
+            (
+                self.platform,
+                event_id,
+                session_date.isoformat(),
+                self._oldest_valid(),
+            ),
+        ).fetchall()
+        if rows:
+            logger.debug(
+                f"Found {len(rows)} sessions of event {event_id} on {session_date} in metadata cache"
+            )
+
+        return [
+            ArloSession(
+                session_id=row[0],
+                event_id=row[1],
+                name=row[2],
+                start=datetime.fromisoformat(row[3]),
+            )
+            for row in rows
+        ]
+
+    def set_sessions(self, sessions: Iterable[ArloSession]) -> None:
+        """
+        Adds or replaces EventSessions in the cache.
+
+        Args:
+            sessions (Iterable[ArloSession]): The sessions to cache.
+        """
+        fetched_at = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        self.platform,
+                        s.session_id,
+                        s.event_id,
+                        s.name,
+                        s.start.isoformat(),
+                        fetched_at,
+                    )
+                    for s in sessions
+                ),
+            )
+
+    def get_response(self, url: str) -> CachedResponse | None:
+        """
+        Retrieves a cached GET response, regardless of whether it has expired.
+
+        Args:
+            url (str): The full URL of the request, including query parameters.
+
+        Returns:
+            CachedResponse | None: The cached response, or None if the URL has not been cached.
+        """
+        row = self.conn.execute(
+            "SELECT etag, last_modified, body, fetched_at FROM responses WHERE platform = ? AND url = ?",
+            (self.platform, url),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return CachedResponse(
+            etag=row[0], last_modified=row[1], body=row[2], fetched_at=row[3]
+        )
+
+    def set_response(
+        self, url: str, etag: str | None, last_modified: str | None, body: bytes
+    ) -> None:
+        """
+        Adds or replaces a cached GET response.
+
+        Args:
+            url (str): The full URL of the request, including query parameters.
+            etag (str | None): The ETag header of the response.
+            last_modified (str | None): The Last-Modified header of the response.
+            body (bytes): The body of the response.
+        """
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (self.platform, url, etag, last_modified, body, time.time()),
+            )
+
+    def touch_response(self, url: str) -> None:
+        """
+        Marks a cached GET response as fetched now, after it was revalidated.
+
+        Args:
+            url (str): The full URL of the request, including query parameters.
+        """
+        with self.conn:
+            self.conn.execute(
+                "UPDATE responses SET fetched_at = ? WHERE platform = ? AND url = ?",
+                (time.time(), self.platform, url),
+            )
+
+    def close(self) -> None:
+        """Close the connection to the cache database"""
+        self.conn.close()
@@ -22,9 +22,24 @@ class ButterAttendee(Attendee):
 
 @dataclass(kw_only=True)
 class ArloRegistration(Attendee):
-    """Attendee class for Arlo registrations with a registration link."""
+    """Attendee class for Arlo registrations with a registration link, and the attendance currently recorded in Arlo if known."""
 
     reg_href: str
+    current_attendance: "AttendanceStatus | None" = None
+
+    @property
+    def target_attendance(self) -> "AttendanceStatus":
+        """The attendance status to record in Arlo, based on whether attendance was registered"""
+        return (
+            AttendanceStatus.ATTENDED
+            if self.attendance_registered
+            else AttendanceStatus.DID_NOT_ATTEND
+        )
+
+    @property
+    def attendance_changed(self) -> bool:
+        """Whether the attendance recorded in Arlo differs from the target attendance"""
+        return self.current_attendance != self.target_attendance
 
     def __eq__(self, other):
         if not isinstance(other, Attendee):
@@ -39,6 +54,25 @@ class ArloRegistration(Attendee):
             return NotImplemented
 
 
+@dataclass(frozen=True, slots=True)
+class ArloEvent:
+    """Compact record of an Arlo Event, used to index events by their code."""
+
+    event_id: str
+    code: str
+    name: str
+
+
+@dataclass(frozen=True, slots=True)
+class ArloSession:
+    """Compact record of an Arlo EventSession. The start datetime is in the local time of the session."""
+
+    session_id: str
+    event_id: str
+    name: str
+    start: datetime
+
+
 @dataclass
 class Meeting:
     """Represents a meeting with an event code, start date, and list of attendees."""
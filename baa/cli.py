@@ -1,21 +1,23 @@
 import click
+import json
 import sys
-import asyncio
 import logging
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Callable
 
-from baa.main import baa
 from baa.log import configure_logger
 from baa.helpers import (
+    ATTENDEE_FILE_SUFFIX,
     banner,
-    has_keyring_credentials,
+    CredentialProvider,
     get_keyring_name,
     set_keyring_credentials,
 )
 from baa.exceptions import (
     EventNotFound,
     AuthenticationFailed,
+    CredentialsNotFound,
     ApiCommunicationFailure,
     AttendeeFileProcessingError,
 )
@@ -23,105 +25,564 @@ from baa.exceptions import (
 logger = logging.getLogger(__name__)
 
 
-@click.command(context_settings={"help_option_names": ["-h", "--help"]})
-@click.argument("attendee_file", type=click.Path(exists=True, path_type=Path))
-@click.option(
-    "-f",
-    "--format",
-    default="butter",
-    type=click.Choice(["butter"], case_sensitive=False),
-    help="The format of the ATTENDEE_FILE. Most virtual meeting platforms allow generating attendance reports in various formats",
+def expand_attendee_files(paths: tuple[Path, ...]) -> list[Path]:
+    """
+    Expand directories in the ATTENDEE_FILES argument to the attendance reports they contain.
+
+    Args:
+        paths (tuple[Path, ...]): Attendee files and directories of attendee files.
+
+    Returns:
+        list[Path]: The attendee files, with each directory's files in name order, without duplicates.
+    """
+    attendee_files = []
+    for path in paths:
+        if path.is_dir():
+            attendee_files.extend(
+                sorted(
+                    file
+                    for file in path.iterdir()
+                    if file.is_file() and file.suffix.lower() == ATTENDEE_FILE_SUFFIX
+                )
+            )
+        else:
+            attendee_files.append(path)
+
+    return list(dict.fromkeys(attendee_files))
+
+
+def read_platform_map(
+    platform_map: Path,
+) -> tuple[dict[str, list[Path]], dict[str, int]]:
+    """
+    Read the attendee files of each platform from a --platform-map file.
+
+    The file is a JSON object with a key for each platform subdomain, and either a list of its attendee files and directories, or an object with the list as "files" and optionally the platform's "max_concurrency". Relative paths are relative to the directory of the file.
+
+    Args:
+        platform_map (Path): The --platform-map file.
+
+    Raises:
+        click.BadParameter: If the file is not valid, or an attendee file does not exist.
+
+    Returns:
+        tuple[dict[str, list[Path]], dict[str, int]]: The attendee files of each platform, and the maximum concurrency of the platforms that set it.
+    """
+
+    def invalid(message: str) -> click.BadParameter:
+        return click.BadParameter(
+            f"{message} in {platform_map}", param_hint="'--platform-map'"
+        )
+
+    try:
+        mapping = json.loads(platform_map.read_text())
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise invalid(f"Unable to read platforms ({e})")
+    if not isinstance(mapping, dict) or not mapping:
+        raise invalid("Expected an object of attendee files by platform")
+
+    platform_files: dict[str, list[Path]] = {}
+    platform_concurrency: dict[str, int] = {}
+    for platform, entry in mapping.items():
+        if isinstance(entry, dict):
+            max_concurrency = entry.get("max_concurrency")
+            if max_concurrency is not None:
+                if not isinstance(max_concurrency, int) or max_concurrency < 1:
+                    raise invalid(
+                        f"Expected a max_concurrency of at least 1 for {platform}"
+                    )
+                platform_concurrency[platform] = max_concurrency
+            entry = entry.get("files")
+        if not isinstance(entry, list) or not all(
+            isinstance(path, str) for path in entry
+        ):
+            raise invalid(f"Expected a list of attendee files for {platform}")
+
+        paths = [platform_map.parent / path for path in entry]
+        for path in paths:
+            if not path.exists():
+                raise invalid(f"Attendee file {path} for {platform} does not exist")
+        platform_files[platform] = expand_attendee_files(tuple(paths))
+
+    return platform_files, platform_concurrency
+
+
+def prompt_for_credentials(
+    credential_providers: dict[str, CredentialProvider], show_platform: bool = False
+) -> None:
+    """
+    Prompt the user for the Arlo credentials of each platform without them, and store them in the keyring.
+
+    Args:
+        credential_providers (dict[str, CredentialProvider]): Provides the credentials of each platform.
+        show_platform (bool, optional): Whether the prompt names the platform the credentials are for.
+    """
+    for platform, credential_provider in credential_providers.items():
+        try:
+            if credential_provider.has_credentials():
+                continue
+        except CredentialsNotFound as e:
+            # Credentials given through a file descriptor that cannot be read are not replaced by a prompt, which would not work in a headless run
+            click.secho(e, fg="red")
+            sys.exit(1)
+        logger.warning(
+            f"Unable to find baa credentials for {platform} in {get_keyring_name()}. Prompting user for Arlo credentials"
+        )
+        click.secho(
+            f"Please enter your Arlo login details{f' for {platform}' if show_platform else ''}, these are solely used to authenticate to the Arlo API. The credentials will be securely stored in your systems keyring service",
+            fg="yellow",
+        )
+        set_keyring_credentials(credential_provider.keyring_user)
+
+
+class DefaultCommandGroup(click.Group):
+    """Group of commands that runs its default command when the arguments don't start with the name of a command or a help option, so `baa FILE` is the same as `baa update FILE`, while `baa -h` lists the commands"""
+
+    def __init__(self, *args, default_command: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if not args or (
+            args[0] not in self.commands and args[0] not in ctx.help_option_names
+        ):
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+# Options of every command that updates attendance
+SHARED_OPTIONS = [
+    click.option(
+        "-f",
+        "--format",
+        default="butter",
+        type=click.Choice(["butter"], case_sensitive=False),
+        help="The format of the attendee files. Most virtual meeting platforms allow generating attendance reports in various formats",
+    ),
+    click.option(
+        "-p",
+        "--platform",
+        default="codefirstgirls",
+        help="Subdomain of the Arlo platform to use for signing into the management system",
+    ),
+    click.option(
+        "--min-duration",
+        type=int,
+        default=0,
+        help="Minimum duration (in minutes) for an attendee to be marked as present",
+    ),
+    click.option(
+        "--skip-absent",
+        is_flag=True,
+        default=False,
+        help="If flag is set, only update attendance for present attendees in the attendee files. Absent attendees will not be updated",
+    ),
+    click.option(
+        "--dry-run",
+        is_flag=True,
+        default=False,
+        help="Simulate changes to be made without updating any registration records. ",
+    ),
+    click.option(
+        "--cache-ttl",
+        type=click.IntRange(min=0),
+        default=24,
+        help="Number of hours that Arlo event and session details are cached for between runs, 0 disables the cache",
+    ),
+    click.option(
+        "--refresh-cache",
+        is_flag=True,
+        default=False,
+        help="Ignore cached Arlo event and session details, and fetch them from the Arlo API",
+    ),
+    click.option(
+        "--fuzzy",
+        default="off",
+        type=click.Choice(["off", "suggest", "apply"], case_sensitive=False),
+        help="Match registrations to attendees with slightly different names or emails, such as nicknames or typos. 'suggest' lists the matches for review without updating them, 'apply' updates attendance from them",
+    ),
+    click.option(
+        "--fuzzy-threshold",
+        type=click.FloatRange(min=0, max=1),
+        default=0.85,
+        help="Minimum similarity score (0 to 1) for a fuzzy match",
+    ),
+    click.option(
+        "--max-concurrency",
+        type=click.IntRange(min=1),
+        default=8,
+        help="Maximum number of attendance updates sent to Arlo at the same time. The number in flight adapts below this to how quickly Arlo is responding",
+    ),
+    click.option(
+        "-v",
+        "--verbose",
+        is_flag=True,
+        default=False,
+        help="Print detailed debug information",
+    ),
+]
+
+
+def shared_options(command: Callable) -> Callable:
+    """Add the SHARED_OPTIONS to a command."""
+    for option in reversed(SHARED_OPTIONS):
+        command = option(command)
+    return command
+
+
+@click.group(
+    cls=DefaultCommandGroup,
+    default_command="update",
+    context_settings={"help_option_names": ["-h", "--help"]},
+)
+def main() -> None:
+    """
+    Automate registering attendees in Arlo with attendance reports from virtual meeting platforms
+
+    Attendance reports given without a command are updated with the update command, e.g. `baa path/to/attendance-report.csv`.
+    """
+
+
+@main.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.argument(
+    "attendee_files",
+    nargs=-1,
+    # Optional with --platform-map, but shown as required as it is for every other run
+    metavar="ATTENDEE_FILES...",
+    type=click.Path(exists=True, path_type=Path),
 )
+@shared_options
 @click.option(
-    "-p",
-    "--platform",
-    default="codefirstgirls",
-    help="Subdomain of the Arlo platform to use for signing into the management system",
+    "--platform-map",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="JSON file of the attendee files to process on each of several Arlo platforms, which are updated concurrently. ATTENDEE_FILES are processed on --platform in addition to these",
 )
 @click.option(
     "-c",
     "--event-code",
-    help="Unique code identifying the Arlo event. Required if it cannot be automatically parsed from the ATTENDEE_FILEE",
+    help="Unique code identifying the Arlo event. Required if it cannot be automatically parsed from the ATTENDEE_FILES",
 )
 @click.option(
     "-d",
     "--date",
+    "dates",
+    multiple=True,
     type=click.DateTime(formats=["%Y-%m-%d"]),
-    help="Date of the meeting in YYYY-MM-DD format. Required if it cannot be automatically parsed from the ATTENDEE_FILE",
+    help="Date of the meeting in YYYY-MM-DD format. Required if it cannot be automatically parsed from the ATTENDEE_FILES. Repeat for the sessions of an event on several dates, each of the ATTENDEE_FILES is then matched to the session on its meeting date",
 )
 @click.option(
-    "--min-duration",
-    type=int,
-    default=0,
-    help="Minimum duration (in minutes) for an attendee to be marked as present",
+    "--date-range",
+    type=(click.DateTime(formats=["%Y-%m-%d"]), click.DateTime(formats=["%Y-%m-%d"])),
+    help="First and last date (inclusive) in YYYY-MM-DD format of the sessions of an event on consecutive days. Each of the ATTENDEE_FILES is matched to the session on its meeting date",
+)
+def update(
+    attendee_files: tuple[Path, ...],
+    format: str,
+    platform: str,
+    platform_map: Path | None,
+    event_code: str | None,
+    dates: tuple[datetime, ...],
+    date_range: tuple[datetime, datetime] | None,
+    min_duration: int,
+    skip_absent: bool,
+    dry_run: bool,
+    cache_ttl: int,
+    refresh_cache: bool,
+    fuzzy: str,
+    fuzzy_threshold: float,
+    max_concurrency: int,
+    verbose: bool,
+) -> None:
+    """Automate registering attendees in Arlo with attendance reports from virtual meeting platforms (ATTENDEE_FILES). See --format for supported platforms
+
+    Several attendance reports, or directories of them, can be given to update every session in one run. Use `baa watch DIRECTORY` to update attendance from reports as they are dropped into a folder
+    """
+    configure_logger(level="DEBUG" if verbose else "CRITICAL")
+
+    if not attendee_files and platform_map is None:
+        raise click.BadParameter(
+            "Missing attendee files", param_hint="'ATTENDEE_FILES'"
+        )
+
+    platform_files, platform_concurrency = (
+        read_platform_map(platform_map) if platform_map is not None else ({}, {})
+    )
+    attendee_files = expand_attendee_files(attendee_files)
+    if attendee_files:
+        platform_files[platform] = list(
+            dict.fromkeys(platform_files.get(platform, []) + attendee_files)
+        )
+    if not any(platform_files.values()):
+        raise click.BadParameter(
+            "No attendee files found in the given directories",
+            param_hint="'ATTENDEE_FILES'",
+        )
+
+    if date_range is not None:
+        first, last = date_range
+        if last < first:
+            raise click.BadParameter(
+                "The last date is before the first date", param_hint="'--date-range'"
+            )
+        dates += tuple(
+            first + timedelta(days=i) for i in range((last - first).days + 1)
+        )
+    dates = sorted(set(dates))
+
+    click.echo(banner())
+
+    # Shared with the Arlo client, so the credentials are only read once
+    credential_provider = CredentialProvider()
+    if platform_map is None:
+        credential_providers = {platform: credential_provider}
+    else:
+        # Platforms without their own credentials share the credentials of every platform
+        credential_providers = {
+            platform: CredentialProvider(
+                platform=platform, fallback=credential_provider
+            )
+            for platform in platform_files
+        }
+
+    prompt_for_credentials(credential_providers, show_platform=platform_map is not None)
+
+    # Imported once the arguments are parsed, so --help and invalid arguments don't pay for importing the Arlo client and its dependencies
+    import asyncio
+    from baa.main import baa, baa_batch, baa_platforms
+
+    options = (
+        min_duration,
+        skip_absent,
+        dry_run,
+        cache_ttl,
+        refresh_cache,
+        fuzzy,
+        fuzzy_threshold,
+        max_concurrency,
+    )
+    try:
+        if platform_map is not None:
+            results = asyncio.run(
+                baa_platforms(
+                    platform_files,
+                    format,
+                    event_code,
+                    dates,
+                    *options,
+                    platform_concurrency=platform_concurrency,
+                    credential_providers=credential_providers,
+                )
+            )
+            if any(
+                result.error is not None
+                for platform_results in results.values()
+                for result in platform_results
+            ):
+                sys.exit(1)
+        elif len(attendee_files) == 1 and len(dates) <= 1:
+            asyncio.run(
+                baa(
+                    attendee_files[0],
+                    format,
+                    platform,
+                    event_code,
+                    dates[0] if dates else None,
+                    *options,
+                    credential_provider=credential_provider,
+                )
+            )
+        else:
+            results = asyncio.run(
+                baa_batch(
+                    attendee_files,
+                    format,
+                    platform,
+                    event_code,
+                    dates,
+                    *options,
+                    credential_provider=credential_provider,
+                )
+            )
+            if any(result.error is not None for result in results):
+                sys.exit(1)
+    except (
+        EventNotFound,
+        AuthenticationFailed,
+        ApiCommunicationFailure,
+        AttendeeFileProcessingError,
+    ) as e:
+        click.secho(e, fg="red")
+        sys.exit(1)
+
+
+@main.command(context_settings={"help_option_names": ["-h", "--help"]})
+@click.argument(
+    "directory",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
 )
+@shared_options
 @click.option(
-    "--skip-absent",
-    is_flag=True,
-    default=False,
-    help="If flag is set, only update attendance for present attendees in ATTENDEE_FILE. Absent attendees will not be updated",
+    "--max-files",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Maximum number of attendee files processed at the same time",
 )
 @click.option(
-    "--dry-run",
-    is_flag=True,
-    default=False,
-    help="Simulate changes to be made without updating any registration records. ",
+    "--poll-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=1.0,
+    help="Number of seconds between checks of DIRECTORY for new attendee files",
 )
 @click.option(
-    "-v",
-    "--verbose",
-    is_flag=True,
-    default=False,
-    help="Print detailed debug information",
-)
-def main(
-    attendee_file: Path,
+    "--settle-time",
+    type=click.FloatRange(min=0),
+    default=2.0,
+    help="Number of seconds an attendee file must be unmodified for before it is processed, so files are not processed while they are being written",
+)
+def watch(
+    directory: Path,
     format: str,
     platform: str,
-    event_code: str | None,
-    date: datetime | None,
     min_duration: int,
     skip_absent: bool,
     dry_run: bool,
+    cache_ttl: int,
+    refresh_cache: bool,
+    fuzzy: str,
+    fuzzy_threshold: float,
+    max_concurrency: int,
     verbose: bool,
+    max_files: int,
+    poll_interval: float,
+    settle_time: float,
 ) -> None:
-    """Automate registering attendees in Arlo with attendance reports from virtual meeting platforms (ATTENDEE_FILE). See --format for supported platforms"""
+    """Update attendance in Arlo from attendance reports as they are dropped into DIRECTORY, until stopped
+
+    The event code and date are parsed from each report. Processed reports are moved to the done subfolder of DIRECTORY, or to the failed subfolder if they could not be processed or some updates failed
+    """
     configure_logger(level="DEBUG" if verbose else "CRITICAL")
 
     click.echo(banner())
 
-    if not has_keyring_credentials():
-        logger.warning(
-            f"Unable to find baa credentials in {get_keyring_name()}. Prompting user for Arlo credentials"
-        )
-        click.secho(
-            f"Please enter your Arlo login details, these are solely used to authenticate to the Arlo API. The credentials will be securely stored in your systems keyring service",
-            fg="yellow",
-        )
-        set_keyring_credentials()
+    # Watching stops if Arlo rejects the credentials, so they are removed from the keyring as for a single update
+    credential_provider = CredentialProvider()
+    prompt_for_credentials({platform: credential_provider})
+
+    import asyncio
+    from baa.main import baa_watch
 
     try:
         asyncio.run(
-            baa(
-                attendee_file,
+            baa_watch(
+                directory,
                 format,
                 platform,
-                event_code,
-                date,
                 min_duration,
                 skip_absent,
                 dry_run,
+                cache_ttl,
+                refresh_cache,
+                fuzzy,
+                fuzzy_threshold,
+                max_concurrency,
+                credential_provider,
+                max_files,
+                poll_interval,
+                settle_time,
             )
         )
-    except (
-        EventNotFound,
-        AuthenticationFailed,
-        ApiCommunicationFailure,
-        AttendeeFileProcessingError,
-    ) as e:
+    except KeyboardInterrupt:
+        click.echo(f"Stopped watching {directory}")
+    except (AuthenticationFailed, CredentialsNotFound) as e:
         click.secho(e, fg="red")
         sys.exit(1)
 
 
+@main.command(context_settings={"help_option_names": ["-h", "--help"]})
+@shared_options
+@click.option(
+    "--host",
+    default="127.0.0.1",
+    help="Address to listen for requests on",
+)
+@click.option(
+    "--port",
+    type=click.IntRange(min=0, max=65535),
+    default=8080,
+    help="Port to listen for requests on",
+)
+@click.option(
+    "--max-jobs",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Maximum number of attendance reports processed at the same time",
+)
+@click.option(
+    "--max-queue",
+    type=click.IntRange(min=1),
+    default=100,
+    help="Maximum number of attendance reports waiting to be processed, further reports are rejected until some are processed",
+)
+def serve(
+    format: str,
+    platform: str,
+    min_duration: int,
+    skip_absent: bool,
+    dry_run: bool,
+    cache_ttl: int,
+    refresh_cache: bool,
+    fuzzy: str,
+    fuzzy_threshold: float,
+    max_concurrency: int,
+    verbose: bool,
+    host: str,
+    port: int,
+    max_jobs: int,
+    max_queue: int,
+) -> None:
+    """Update attendance in Arlo from attendance reports uploaded over HTTP, until stopped
+
+    POST a report to /jobs, with options in the query string named after the options of baa, e.g. /jobs?event-code=CK24ABC&dry-run. Add wait to respond once the report is processed. GET /jobs/{id} for the result of a report, and /status for the number of reports queued and processed. The options given here are the defaults for every report
+    """
+    configure_logger(level="DEBUG" if verbose else "CRITICAL")
+
+    click.echo(banner())
+
+    # Credentials stay in the keyring if Arlo rejects them while running, so later reports can use them once Arlo accepts them again
+    credential_provider = CredentialProvider(remove_rejected=False)
+    prompt_for_credentials({platform: credential_provider})
+
+    import asyncio
+    from baa.server import JobOptions, baa_serve
+
+    defaults = JobOptions(
+        min_duration=min_duration,
+        skip_absent=skip_absent,
+        dry_run=dry_run,
+        fuzzy=fuzzy,
+        fuzzy_threshold=fuzzy_threshold,
+    )
+    try:
+        asyncio.run(
+            baa_serve(
+                platform,
+                defaults,
+                host,
+                port,
+                cache_ttl,
+                refresh_cache,
+                max_concurrency,
+                credential_provider,
+                max_jobs,
+                max_queue,
+            )
+        )
+    except KeyboardInterrupt:
+        click.echo("Stopped serving")
+    except OSError as e:
+        click.secho(f"🚨 Unable to listen on {host}:{port}: {e}", fg="red")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
@@ -37,6 +37,11 @@ class ApiCommunicationFailure(Exception):
     Raised when making a request to the Arlo API, and the response HTTP code is not 200.
     """
 
+    def __init__(self, *args, status: int | None = None):
+        super().__init__(*args)
+        # HTTP code of the response, or None if no response was received
+        self.status = status
+
 
 class AttendeeFileProcessingError(Exception):
     """
@@ -45,3 +50,24 @@ class AttendeeFileProcessingError(Exception):
     Raised when the attendee file is not in the expected format,
     or when there are errors during the parsing of its contents.
     """
+
+
+class CircuitOpen(ApiCommunicationFailure):
+    """
+    Exception for requests that were not sent because the Arlo API is failing.
+
+    Raised by the circuit breaker of an ArloClient, after a large share of recent requests failed with a server error or could not connect, until a probe request succeeds.
+    """
+
+
+class HttpError(Exception):
+    """
+    Exception for HTTP requests that cannot be served, with the status code of the response.
+
+    Raised by the AttendanceServer when a request is malformed, does not match an endpoint, or is rejected because too many attendee reports are waiting.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
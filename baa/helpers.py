@@ -1,7 +1,7 @@
 import base64
 import click
 import os
-import keyring
+import threading
 from threading import Thread
 from itertools import cycle
 import time
@@ -23,8 +23,16 @@ BAA_BANNER = [
     "       🐑 Basic Arlo Assistant 🐑          ",
 ]
 
+# keyring is imported by the functions using it, as loading its backends slows down starting the CLI
 BAA_KEYRING_DOMAIN = "Basic Arlo Assistant"
 BAA_KEYRING_USER = "Arlo Credentials"
+# Credentials for headless runs, used instead of the keyring
+BAA_USERNAME_ENV = "BAA_ARLO_USERNAME"
+BAA_PASSWORD_ENV = "BAA_ARLO_PASSWORD"
+# File descriptor to read the username and password from, one per line
+BAA_CREDENTIALS_FD_ENV = "BAA_CREDENTIALS_FD"
+# Extension of attendance reports found in directories of attendee files
+ATTENDEE_FILE_SUFFIX = ".csv"
 
 
 def banner() -> str:
@@ -64,51 +72,232 @@ def b64decode_str(msg: str, encoding: str = "utf-8") -> str:
     return msg_bytes.decode(encoding)
 
 
-def has_keyring_credentials() -> bool:
+def has_keyring_credentials(user: str = BAA_KEYRING_USER) -> bool:
     """Check if credentials exist in the keyring."""
-    return keyring.get_password(BAA_KEYRING_DOMAIN, BAA_KEYRING_USER) is not None
+    import keyring
 
+    return keyring.get_password(BAA_KEYRING_DOMAIN, user) is not None
 
-def set_keyring_credentials() -> None:
+
+def set_keyring_credentials(user: str = BAA_KEYRING_USER) -> None:
     """Prompt the user for credentials and store them in the keyring."""
+    import keyring
+
     keyring.set_password(
         BAA_KEYRING_DOMAIN,
-        BAA_KEYRING_USER,
+        user,
         f"{b64encode_str(click.prompt('Username'))};{b64encode_str(click.prompt('Password', hide_input=True, confirmation_prompt=True))}",
     )
 
 
 def get_keyring_name() -> str:
     """Get the current keyring name."""
+    import keyring
+
     return keyring.get_keyring().name
 
 
-def get_keyring_credentials() -> tuple[str, str]:
+def get_keyring_credentials(user: str = BAA_KEYRING_USER) -> tuple[str, str]:
     """
     Retrieve and decode credentials from the keyring.
 
+    Args:
+        user (str, optional): The keyring entry to retrieve. Defaults to the entry shared by every platform.
+
     Raises:
         CredentialsNotFound: If no credentials are found in the keyring.
 
     Returns:
         tuple[str, str]: A tuple containing the username and password for the Arlo platform.
     """
-    if not has_keyring_credentials():
+    import keyring
+
+    credentials = keyring.get_password(BAA_KEYRING_DOMAIN, user)
+    if credentials is None:
         raise CredentialsNotFound(
             f"🚨 Could not find Arlo credentials in the keyring service ({get_keyring_name()})"
         )
 
-    return tuple(
-        map(
-            b64decode_str,
-            keyring.get_password(BAA_KEYRING_DOMAIN, BAA_KEYRING_USER).split(";"),
-        )
-    )
+    return tuple(map(b64decode_str, credentials.split(";")))
 
 
-def remove_keyring_credentials() -> None:
+def remove_keyring_credentials(user: str = BAA_KEYRING_USER) -> None:
     """Remove stored credentials from the keyring."""
-    keyring.delete_password(BAA_KEYRING_DOMAIN, BAA_KEYRING_USER)
+    import keyring
+
+    keyring.delete_password(BAA_KEYRING_DOMAIN, user)
+
+
+# Credentials read from each file descriptor, or the error reading it, as the descriptor is closed once read and its number may be reused
+_fd_credentials: dict[str, tuple[str, str] | CredentialsNotFound] = {}
+_fd_lock = threading.Lock()
+
+
+def read_credentials_fd(fd: str) -> tuple[str, str]:
+    """
+    Read the username and password from a file descriptor, one per line. The descriptor is only read once per process, later calls get the same credentials.
+
+    Args:
+        fd (str): The number of the file descriptor.
+
+    Raises:
+        CredentialsNotFound: If the file descriptor cannot be read, or does not hold a username and password.
+
+    Returns:
+        tuple[str, str]: A tuple containing the username and password for the Arlo platform.
+    """
+    with _fd_lock:
+        if fd not in _fd_credentials:
+            try:
+                with os.fdopen(int(fd)) as credentials_file:
+                    lines = credentials_file.read().splitlines()
+            except (OSError, ValueError) as e:
+                _fd_credentials[fd] = CredentialsNotFound(
+                    f"🚨 Unable to read Arlo credentials from file descriptor {fd}: {e}"
+                )
+            else:
+                _fd_credentials[fd] = (
+                    (lines[0], lines[1])
+                    if len(lines) >= 2
+                    else CredentialsNotFound(
+                        f"🚨 Expected a username and password on separate lines from file descriptor {fd}"
+                    )
+                )
+
+        credentials = _fd_credentials[fd]
+    if isinstance(credentials, CredentialsNotFound):
+        raise credentials
+    return credentials
+
+
+def platform_env_suffix(platform: str) -> str:
+    """Get the suffix of the environment variables holding the credentials for a platform, e.g. MY_ARLO for my-arlo"""
+    return "".join(char if char.isalnum() else "_" for char in platform.upper())
+
+
+class CredentialProvider:
+    """
+    Provides the Arlo credentials, which are read once and kept in memory until invalidated.
+
+    Credentials are read from the BAA_ARLO_USERNAME and BAA_ARLO_PASSWORD environment variables if both are set, otherwise from the file descriptor in BAA_CREDENTIALS_FD if it is set, otherwise from the keyring.
+
+    A provider for a specific platform first reads the BAA_ARLO_USERNAME_<PLATFORM> and BAA_ARLO_PASSWORD_<PLATFORM> environment variables, then the platform's own keyring entry, and otherwise uses the credentials of its fallback provider.
+    """
+
+    def __init__(
+        self,
+        environ: dict[str, str] | None = None,
+        platform: str | None = None,
+        fallback: "CredentialProvider | None" = None,
+        remove_rejected: bool = True,
+    ):
+        """
+        Initialize the CredentialProvider.
+
+        Args:
+            environ (dict[str, str], optional): Environment variables to read credentials from. Defaults to os.environ.
+            platform (str, optional): The platform subdomain the credentials are for, or None for the credentials shared by every platform.
+            fallback (CredentialProvider, optional): Provides the credentials for a platform without its own. Shared between the providers of several platforms, so its credentials are only read once.
+            remove_rejected (bool, optional): Remove rejected credentials from the keyring. Disabled for long running processes, which read the stored credentials again for the next request instead of deleting them. Defaults to True.
+        """
+        self.environ = os.environ if environ is None else environ
+        self.platform = platform
+        self.fallback = fallback
+        self.remove_rejected = remove_rejected
+        self.credentials: tuple[str, str] | None = None
+        self.source: str | None = None
+        # Credentials from the environment or a file descriptor are not read again once rejected
+        self.rejected: str | None = None
+        self.lock = threading.Lock()
+
+    @property
+    def keyring_user(self) -> str:
+        """The keyring entry holding the credentials"""
+        if self.platform is None:
+            return BAA_KEYRING_USER
+        return f"{BAA_KEYRING_USER} ({self.platform})"
+
+    def get(self) -> tuple[str, str]:
+        """
+        Get the credentials, reading them if they are not already in memory.
+
+        Raises:
+            CredentialsNotFound: If no credentials are provided, or the credentials from the environment or a file descriptor were rejected.
+
+        Returns:
+            tuple[str, str]: A tuple containing the username and password for the Arlo platform.
+        """
+        with self.lock:
+            if self.credentials is None:
+                if self.rejected is not None:
+                    raise CredentialsNotFound(
+                        f"🚨 The Arlo credentials from {self.rejected} were rejected"
+                    )
+                self.credentials, self.source = self._read()
+            return self.credentials
+
+    def has_credentials(self) -> bool:
+        """
+        Check if credentials are provided, reading them if they are not already in memory.
+
+        Raises:
+            CredentialsNotFound: If credentials are given through BAA_CREDENTIALS_FD but cannot be read, as prompting for them would not work in a headless run.
+        """
+        try:
+            self.get()
+        except CredentialsNotFound:
+            if self._reads_fd():
+                raise
+            return False
+        return True
+
+    def invalidate(self) -> None:
+        """Forget the credentials after they were rejected. Credentials from the keyring are also removed from it, so the user is prompted for them on the next run, unless remove_rejected is disabled. Credentials from the environment or a file descriptor are not read again."""
+        with self.lock:
+            if self.source == "keyring" and self.remove_rejected:
+                remove_keyring_credentials(self.keyring_user)
+            elif self.source == "environment":
+                self.rejected = "the environment"
+            elif self.source == "fd":
+                self.rejected = (
+                    f"file descriptor {self.environ[BAA_CREDENTIALS_FD_ENV]}"
+                )
+            self.credentials = self.source = None
+
+    def _reads_fd(self) -> bool:
+        if self.platform is not None:
+            return self.fallback is not None and self.fallback._reads_fd()
+        return BAA_CREDENTIALS_FD_ENV in self.environ
+
+    def _read(self) -> tuple[tuple[str, str], str]:
+        if self.platform is not None:
+            return self._read_platform()
+
+        username = self.environ.get(BAA_USERNAME_ENV)
+        password = self.environ.get(BAA_PASSWORD_ENV)
+        if username and password:
+            return (username, password), "environment"
+
+        if (fd := self.environ.get(BAA_CREDENTIALS_FD_ENV)) is not None:
+            return read_credentials_fd(fd), "fd"
+
+        return get_keyring_credentials(), "keyring"
+
+    def _read_platform(self) -> tuple[tuple[str, str], str]:
+        suffix = platform_env_suffix(self.platform)
+        username = self.environ.get(f"{BAA_USERNAME_ENV}_{suffix}")
+        password = self.environ.get(f"{BAA_PASSWORD_ENV}_{suffix}")
+        if username and password:
+            return (username, password), "environment"
+
+        try:
+            return get_keyring_credentials(self.keyring_user), "keyring"
+        except CredentialsNotFound:
+            if self.fallback is None:
+                raise
+
+        # The fallback's credentials are not invalidated with the platform's, as other platforms may accept them
+        return self.fallback.get(), "fallback"
 
 
 class LoadingSpinner:
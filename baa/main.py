@@ -2,14 +2,27 @@ import logging
 import asyncio
 from pathlib import Path
 import click
+from collections import Counter
+from contextlib import suppress
 from prettytable import PrettyTable
 from datetime import datetime
 from timeit import default_timer as timer
 
-from baa.attendee_parser import butter
+from baa.api import (
+    ATTENDEE_FILE_ERRORS,
+    AttendanceResult,
+    count_attendance,
+    create_arlo_client,
+    update_attendance,
+    update_attendee_files,
+)
 from baa.arlo_api import ArloClient
-from baa.classes import AttendanceStatus, Attendee, ArloRegistration, Meeting
-from baa.helpers import LoadingSpinner
+from baa.classes import Attendee, ArloRegistration
+from baa.helpers import CredentialProvider, LoadingSpinner
+from baa.watcher import FolderWatcher
+from baa.scheduler import DEFAULT_MAX_CONCURRENCY, WriteResult
+from baa.matching import AmbiguousMatch, FuzzyMatch
+from baa.exceptions import AuthenticationFailed, CredentialsNotFound
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +52,78 @@ def notify_unregistered_attendees(
     click.echo(f"{unregistered_table.get_string(sortby='Name')}")
 
 
+def notify_ambiguous_matches(ambiguous_matches: list[AmbiguousMatch]) -> None:
+    click.secho(
+        "⚠️  The following registrations matched more than one attendee by name or email. The first attendee listed was used, follow up to confirm attendance",
+        fg="yellow",
+    )
+    ambiguous_table = PrettyTable(field_names=["Name", "Email", "Matched attendees"])
+    ambiguous_table.align = "l"
+    for match in ambiguous_matches:
+        ambiguous_table.add_row(
+            [
+                match.registration.name,
+                match.registration.email,
+                "\n".join(
+                    f"{attendee.name} ({attendee.email})"
+                    for attendee in match.attendees
+                ),
+            ]
+        )
+    click.echo(f"{ambiguous_table.get_string(sortby='Name')}\n")
+
+
+def notify_fuzzy_matches(fuzzy_matches: list[FuzzyMatch], suggest_only: bool) -> None:
+    click.secho(
+        (
+            "⚠️  The following registrations did not match any attendee exactly, but closely match the attendee listed. Their attendance has not been updated, re-run with --fuzzy apply once the matches are confirmed"
+            if suggest_only
+            else "⚠️  The following registrations did not match any attendee exactly, and have been matched to the closest attendee. Follow up to confirm attendance"
+        ),
+        fg="yellow",
+    )
+    fuzzy_table = PrettyTable(
+        field_names=["Name", "Email", "Matched attendee", "Score"]
+    )
+    fuzzy_table.align = "l"
+    for match in fuzzy_matches:
+        fuzzy_table.add_row(
+            [
+                match.registration.name,
+                match.registration.email,
+                f"{match.attendee.name} ({match.attendee.email})",
+                match.score,
+            ]
+        )
+    click.echo(f"{fuzzy_table.get_string(sortby='Name')}\n")
+
+
+def create_attendance_summary(
+    registrations: list[ArloRegistration], dry_run: bool
+) -> str:
+    changed, unchanged, failed = count_attendance(registrations)
+    return f"Attendance {'to be changed' if dry_run else 'changed'}: {changed}, unchanged: {unchanged}, failed: {failed}"
+
+
+def notify_not_attempted(registrations: list[ArloRegistration]) -> None:
+    click.secho(
+        "🚨 The Arlo API is failing, so attendance was not updated for the following registrations. Re-run baa once Arlo has recovered",
+        fg="red",
+    )
+    not_attempted_table = PrettyTable(field_names=["Name", "Email"])
+    not_attempted_table.align = "l"
+    for reg in registrations:
+        not_attempted_table.add_row([reg.name, reg.email])
+    click.echo(f"{not_attempted_table.get_string(sortby='Name')}\n")
+
+
+def notify_retries(retries: Counter[str]) -> None:
+    click.secho(
+        f"ℹ️  Retried {retries['GET']} requests for Arlo records and {retries['PATCH']} attendance updates after temporary errors from the Arlo API",
+        fg="yellow",
+    )
+
+
 def create_registered_table(registrations: list[ArloRegistration]) -> PrettyTable:
     registered_table = PrettyTable(
         field_names=["Name", "Email", "Attendance registered"]
@@ -56,61 +141,115 @@ def create_registered_table(registrations: list[ArloRegistration]) -> PrettyTabl
     return registered_table
 
 
-async def update_attendance(arlo_client: ArloClient, reg: ArloRegistration) -> None:
-    attendance_status = (
-        AttendanceStatus.ATTENDED
-        if reg.attendance_registered
-        else AttendanceStatus.DID_NOT_ATTEND
+def notify_failed_update(result: WriteResult) -> None:
+    click.secho(
+        f"⚠️  Unable to update attendance for {result.registration.name}: {result.registration.email}",
+        fg="yellow",
     )
-    logger.debug(f"Updating attendance for {reg} to {attendance_status}")
 
-    update_success = await arlo_client.update_attendance(
-        reg.reg_href, attendance_status
+
+def notify_session(result: AttendanceResult) -> None:
+    click.echo(
+        click.style("Event: ", fg="green", bold=True)
+        + click.style(result.event_name, fg="green")
     )
-    if not update_success:
-        click.secho(
-            f"⚠️  Unable to update attendance for {reg.name}: {reg.email}",
-            fg="yellow",
+    click.echo(
+        click.style("Session: ", fg="green", bold=True)
+        + click.style(result.session_name, fg="green")
+        + "\n"
+    )
+
+
+def notify_attendee_file_result(
+    result: AttendanceResult,
+    min_duration: int,
+    skip_absent: bool,
+    dry_run: bool,
+    fuzzy: str,
+) -> None:
+    for update in result.failed_updates:
+        notify_failed_update(update)
+
+    if result.not_attempted:
+        notify_not_attempted(result.not_attempted)
+
+    if result.registrations:
+        registered_table = create_registered_table(result.registrations)
+        click.echo(registered_table.get_string(sortby="Name"))
+        click.echo(create_attendance_summary(result.registrations, dry_run) + "\n")
+
+    if result.ambiguous_matches:
+        notify_ambiguous_matches(result.ambiguous_matches)
+
+    if result.fuzzy_matches:
+        notify_fuzzy_matches(result.fuzzy_matches, fuzzy == "suggest")
+
+    if result.unregistered_attendees:
+        notify_unregistered_attendees(
+            result.unregistered_attendees,
+            min_duration,
+            skip_absent,
         )
-        reg.attendance_registered = None
 
 
-async def process_registrations(
-    arlo_client: ArloClient,
-    meeting: Meeting,
-    event_code: str | None,
-    session_date: datetime | None,
+def notify_attendee_file(
+    result: AttendanceResult,
     min_duration: int,
     skip_absent: bool,
     dry_run: bool,
-) -> list[ArloRegistration]:
-    registrations = []
-    updates = []
-    for reg in arlo_client.get_registrations(event_code, session_date):
-        # Check if registration matches any meeting attendees
-        if reg in meeting.attendees:
-            attendee = meeting.attendees[meeting.attendees.index(reg)]
-            logger.debug(f"Match found in Arlo for {attendee}")
-
-            if attendee.session_duration >= min_duration:
-                attendee.attendance_registered = True
-                reg.attendance_registered = True
-            else:
-                logger.debug(
-                    f"Did not meet minimum duration threshold of{min_duration} mins"
-                )
+    fuzzy: str,
+) -> None:
+    click.echo(
+        click.style("File: ", fg="green", bold=True)
+        + click.style(str(result.attendee_file), fg="green")
+    )
+    if result.error is not None:
+        click.secho(f"{result.error}\n", fg="red")
+        return
 
-        # Skip absent registrations if flag is set
-        if skip_absent and not reg.attendance_registered:
-            continue
+    notify_session(result)
+    notify_attendee_file_result(result, min_duration, skip_absent, dry_run, fuzzy)
 
-        registrations.append(reg)
 
-        if not dry_run:
-            updates.append(update_attendance(arlo_client, reg))
+def create_batch_summary_table(
+    results: list[AttendanceResult], dry_run: bool, show_platform: bool = False
+) -> PrettyTable:
+    batch_table = PrettyTable(
+        field_names=(["Platform"] if show_platform else [])
+        + [
+            "File",
+            "Event",
+            "Session",
+            "To be changed" if dry_run else "Changed",
+            "Unchanged",
+            "Failed",
+            "Unregistered attendees",
+        ]
+    )
+    batch_table.align = "l"
+
+    for result in results:
+        platform = [result.platform] if show_platform else []
+        if result.error is not None:
+            batch_table.add_row(
+                platform
+                + [result.attendee_file.name, click.style(str(result.error), fg="red")]
+                + [""] * 5
+            )
+            continue
+
+        batch_table.add_row(
+            platform
+            + [
+                result.attendee_file.name,
+                result.event_name,
+                result.session_name,
+                *count_attendance(result.registrations),
+                len(result.unregistered_attendees),
+            ]
+        )
 
-    await asyncio.gather(*updates, return_exceptions=True)
-    return registrations
+    return batch_table
 
 
 async def baa(
@@ -122,64 +261,354 @@ async def baa(
     min_duration: int,
     skip_absent: bool,
     dry_run: bool,
+    cache_ttl: int = 24,
+    refresh_cache: bool = False,
+    fuzzy: str = "off",
+    fuzzy_threshold: float = 0.85,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    credential_provider: CredentialProvider | None = None,
 ) -> None:
     """
     Update Arlo attendance records based on attendees from the provided attendee file.
 
     This function matches registrations in Arlo with attendees from the specified file, updating their attendance status according to criteria like minimum session duration and skipping absent registrations. Can also be used in a dry-run mode where the process is simulated but no updates are made.
     """
-    logger.info(f"Processing attendees in {attendee_file}")
     start = timer()
 
+    arlo_client = create_arlo_client(
+        platform, cache_ttl, refresh_cache, max_concurrency, credential_provider
+    )
     try:
-        arlo_client = ArloClient(platform)
-        meeting = butter.get_attendees(attendee_file, event_code)
-        event_code = event_code or meeting.event_code
-        session_date = date or meeting.start_date
-
-        click.echo(
-            click.style("Event: ", fg="green", bold=True)
-            + click.style(arlo_client.get_event_name(event_code), fg="green")
-        )
-        click.echo(
-            click.style("Session: ", fg="green", bold=True)
-            + click.style(
-                arlo_client.get_session_name(event_code, session_date), fg="green"
-            )
-            + "\n"
-        )
+        # The connection to Arlo is opened while the credentials are read and the attendee file is parsed
+        preconnect = asyncio.create_task(arlo_client.preconnect())
 
         loading_msg = (
             "Updating Arlo registrations"
             if not dry_run
             else "Loading Arlo registrations (no records will be updated)"
         )
-        with LoadingSpinner(loading_msg):
-            registrations = await process_registrations(
+        spinner = LoadingSpinner(loading_msg)
+
+        def on_session(result: AttendanceResult) -> None:
+            notify_session(result)
+            spinner.start()
+
+        try:
+            result = await update_attendance(
                 arlo_client,
-                meeting,
+                attendee_file,
                 event_code,
-                session_date,
+                date,
                 min_duration,
                 skip_absent,
                 dry_run,
+                fuzzy,
+                fuzzy_threshold,
+                max_concurrency,
+                on_session,
             )
+        finally:
+            if spinner.loading:
+                spinner.stop()
+            preconnect.cancel()
+            await asyncio.gather(preconnect, return_exceptions=True)
 
         end = timer()
         logger.debug(f"Elapsed time to update registrations was {end - start} seconds")
 
-        if registrations:
-            registered_table = create_registered_table(registrations)
-            click.echo(registered_table.get_string(sortby="Name") + "\n")
+        notify_attendee_file_result(result, min_duration, skip_absent, dry_run, fuzzy)
+
+        if sum(arlo_client.retry_policy.retries.values()):
+            notify_retries(arlo_client.retry_policy.retries)
+    finally:
+        await arlo_client.close()
+
+
+async def baa_batch(
+    attendee_files: list[Path],
+    format: str,
+    platform: str,
+    event_code: str | None,
+    dates: list[datetime],
+    min_duration: int,
+    skip_absent: bool,
+    dry_run: bool,
+    cache_ttl: int = 24,
+    refresh_cache: bool = False,
+    fuzzy: str = "off",
+    fuzzy_threshold: float = 0.85,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    credential_provider: CredentialProvider | None = None,
+) -> list[AttendanceResult]:
+    """
+    Update Arlo attendance records based on attendees from several attendee files in one run.
+
+    The files are processed concurrently with one ArloClient, so the connection, credentials, and event and session lookups are shared between them, and the client's limits apply to the requests of every file together. A file that cannot be processed does not stop the others, its error is reported in the summary instead.
+
+    A single date applies to every file. With several dates, such as the days of an intensive course, each file is matched to the session on its meeting date, and the sessions on every date are resolved from one listing of the event's sessions when the event code is given.
+
+    Returns:
+        list[AttendanceResult]: The outcome of each attendee file, in the order given.
+    """
+    results = await baa_platforms(
+        {platform: attendee_files},
+        format,
+        event_code,
+        dates,
+        min_duration,
+        skip_absent,
+        dry_run,
+        cache_ttl,
+        refresh_cache,
+        fuzzy,
+        fuzzy_threshold,
+        max_concurrency,
+        credential_providers=(
+            {platform: credential_provider} if credential_provider else None
+        ),
+    )
+    return results[platform]
+
+
+async def baa_platforms(
+    platform_files: dict[str, list[Path]],
+    format: str,
+    event_code: str | None,
+    dates: list[datetime],
+    min_duration: int,
+    skip_absent: bool,
+    dry_run: bool,
+    cache_ttl: int = 24,
+    refresh_cache: bool = False,
+    fuzzy: str = "off",
+    fuzzy_threshold: float = 0.85,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    platform_concurrency: dict[str, int] | None = None,
+    credential_providers: dict[str, CredentialProvider] | None = None,
+) -> dict[str, list[AttendanceResult]]:
+    """
+    Update Arlo attendance records based on attendees from attendee files on several Arlo platforms in one run.
+
+    Each platform has its own ArloClient, with its own connection, credentials, cache, and limits, and the files of every platform are processed concurrently. A platform that is slow or failing does not hold up the others, and the files of each platform are processed as in baa_batch. If a platform rejects its credentials, the error is set on the results of its files, and the results of the other platforms are still reported.
+
+    Args:
+        platform_files (dict[str, list[Path]]): The attendee files to process on each platform subdomain.
+        platform_concurrency (dict[str, int], optional): Maximum number of attendance updates in flight on each platform. Platforms without one use max_concurrency.
+        credential_providers (dict[str, CredentialProvider], optional): Provides the credentials of each platform. Platforms without one use CredentialProvider().
+
+    Returns:
+        dict[str, list[AttendanceResult]]: The outcome of each attendee file, by platform, in the order given.
+    """
+    start = timer()
+    platform_concurrency = platform_concurrency or {}
+    credential_providers = credential_providers or {}
+    total_files = sum(len(attendee_files) for attendee_files in platform_files.values())
+
+    arlo_clients: dict[str, ArloClient] = {}
+    try:
+        for platform in platform_files:
+            arlo_clients[platform] = create_arlo_client(
+                platform,
+                cache_ttl,
+                refresh_cache,
+                platform_concurrency.get(platform, max_concurrency),
+                credential_providers.get(platform),
+            )
+
+        loading_msg = (
+            f"Updating Arlo registrations from {total_files} attendee files"
+            if not dry_run
+            else f"Loading Arlo registrations from {total_files} attendee files (no records will be updated)"
+        )
+
+        async def update_platform(
+            platform: str, attendee_files: list[Path]
+        ) -> list[AttendanceResult]:
+            try:
+                return await update_attendee_files(
+                    arlo_clients[platform],
+                    attendee_files,
+                    event_code,
+                    dates,
+                    min_duration,
+                    skip_absent,
+                    dry_run,
+                    fuzzy,
+                    fuzzy_threshold,
+                    platform_concurrency.get(platform, max_concurrency),
+                )
+            except (AuthenticationFailed, CredentialsNotFound) as e:
+                # Fails every file of the platform, while the updates of other platforms are still reported
+                logger.error(f"Unable to authenticate to {platform}: {e!r}")
+                return [
+                    AttendanceResult(attendee_file, error=e, platform=platform)
+                    for attendee_file in attendee_files
+                ]
+
+        with LoadingSpinner(loading_msg):
+            platform_results = await asyncio.gather(
+                *(
+                    update_platform(platform, attendee_files)
+                    for platform, attendee_files in platform_files.items()
+                )
+            )
+        results = dict(zip(platform_files, platform_results))
+
+        end = timer()
+        logger.debug(
+            f"Elapsed time to update registrations from {total_files} files on {len(platform_files)} platforms was {end - start} seconds"
+        )
 
-        unregistered_attendees = [
-            atnd for atnd in meeting.attendees if not atnd.attendance_registered
+        show_platform = len(platform_files) > 1
+        for platform, platform_results in results.items():
+            if show_platform:
+                click.echo(
+                    click.style("Platform: ", fg="green", bold=True)
+                    + click.style(platform, fg="green")
+                    + "\n"
+                )
+            for result in platform_results:
+                notify_attendee_file(result, min_duration, skip_absent, dry_run, fuzzy)
+
+        all_results = [
+            result
+            for platform_results in results.values()
+            for result in platform_results
         ]
-        if unregistered_attendees:
-            notify_unregistered_attendees(
-                unregistered_attendees,
-                min_duration,
-                skip_absent,
+        click.echo(
+            create_batch_summary_table(all_results, dry_run, show_platform).get_string()
+            + "\n"
+        )
+
+        retries = sum(
+            (arlo_client.retry_policy.retries for arlo_client in arlo_clients.values()),
+            Counter(),
+        )
+        if sum(retries.values()):
+            notify_retries(retries)
+    finally:
+        await asyncio.gather(
+            *(arlo_client.close() for arlo_client in arlo_clients.values())
+        )
+
+    return results
+
+
+async def baa_watch(
+    directory: Path,
+    format: str,
+    platform: str,
+    min_duration: int,
+    skip_absent: bool,
+    dry_run: bool,
+    cache_ttl: int = 24,
+    refresh_cache: bool = False,
+    fuzzy: str = "off",
+    fuzzy_threshold: float = 0.85,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    credential_provider: CredentialProvider | None = None,
+    max_files: int = 4,
+    poll_interval: float = 1.0,
+    settle_time: float = 2.0,
+    stop: asyncio.Event | None = None,
+) -> None:
+    """
+    Update Arlo attendance records from attendee files as they are dropped into a folder, until stopped.
+
+    One ArloClient is kept for every file, so the connection, credentials, and event and session lookups stay warm between files, and the client's limits apply to the requests of every file together. Files are processed concurrently, at most max_files at a time, with the event code and date parsed from each file. Once processed, each file is moved to the done subfolder, or to the failed subfolder if it could not be processed or some of its updates failed. In a dry run, files are left in the folder.
+
+    Args:
+        directory (Path): The folder attendee files are dropped into.
+        max_files (int, optional): Maximum number of attendee files processed at a time. Defaults to 4.
+        poll_interval (float, optional): Number of seconds between scans of the folder. Defaults to 1.0.
+        settle_time (float, optional): Number of seconds a file must be unmodified for before it is processed, so files are not processed while they are written. Defaults to 2.0.
+        stop (asyncio.Event, optional): Stops watching the folder once set, after the files being processed are finished. Defaults to watching until cancelled.
+
+    Raises:
+        AuthenticationFailed: If authentication to the Arlo API fails, which would fail every file.
+        CredentialsNotFound: If no credentials are provided, which would fail every file.
+    """
+    stop = stop or asyncio.Event()
+    watcher = FolderWatcher(directory, settle_time)
+    semaphore = asyncio.Semaphore(max_files)
+    tasks: set[asyncio.Task] = set()
+    preconnect: asyncio.Task | None = None
+
+    async def process(attendee_file: Path) -> None:
+        async with semaphore:
+            start = timer()
+            try:
+                result = await update_attendance(
+                    arlo_client,
+                    attendee_file,
+                    None,
+                    None,
+                    min_duration,
+                    skip_absent,
+                    dry_run,
+                    fuzzy,
+                    fuzzy_threshold,
+                    max_concurrency,
+                )
+            except (AuthenticationFailed, CredentialsNotFound):
+                # Fails every file, so watching stops
+                raise
+            except ATTENDEE_FILE_ERRORS as e:
+                logger.error(f"Unable to process {attendee_file}: {e!r}")
+                result = AttendanceResult(attendee_file, error=e)
+            except Exception as e:
+                # Any other error only fails this file, and watching continues
+                logger.exception(f"Unexpected error processing {attendee_file}")
+                result = AttendanceResult(
+                    attendee_file,
+                    error=Exception(
+                        f"🚨 Unexpected error processing {attendee_file.name}: {e!r}"
+                    ),
+                )
+            logger.debug(
+                f"Elapsed time to update registrations from {attendee_file} was {timer() - start} seconds"
             )
+
+        notify_attendee_file(result, min_duration, skip_absent, dry_run, fuzzy)
+        if not dry_run:
+            failed = bool(result.error or result.failed_updates or result.not_attempted)
+            try:
+                moved = watcher.move(attendee_file, failed)
+            except OSError as e:
+                logger.error(f"Unable to move {attendee_file}: {e!r}")
+                click.secho(f"🚨 Unable to move {attendee_file.name}: {e}\n", fg="red")
+                return
+            click.secho(
+                f"{'⚠️' if failed else 'ℹ️'}  Moved {attendee_file.name} to {moved}\n",
+                fg="yellow" if failed else None,
+            )
+
+    arlo_client = create_arlo_client(
+        platform, cache_ttl, refresh_cache, max_concurrency, credential_provider
+    )
+    try:
+        click.echo(f"Watching {directory} for attendee files, press Ctrl+C to stop\n")
+
+        while not stop.is_set():
+            for attendee_file in await asyncio.to_thread(watcher.poll):
+                tasks.add(asyncio.create_task(process(attendee_file)))
+                # Reopens the connection to Arlo if it was closed while idle, while the first file is parsed
+                if preconnect is None or preconnect.done():
+                    preconnect = asyncio.create_task(arlo_client.preconnect())
+
+            for task in [task for task in tasks if task.done()]:
+                tasks.discard(task)
+                # Raises errors that would fail every file, such as authentication failing. Other errors are reported by the file that raised them
+                task.result()
+
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), poll_interval)
+
+        await asyncio.gather(*tasks)
     finally:
+        if preconnect is not None:
+            tasks.add(preconnect)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
         await arlo_client.close()
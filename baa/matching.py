@@ -0,0 +1,272 @@
+import logging
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+
+from baa.classes import Attendee, ArloRegistration, ButterAttendee
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AmbiguousMatch:
+    """A registration that matched more than one attendee. The first attendee is the one that was used."""
+
+    registration: ArloRegistration
+    attendees: list[Attendee]
+
+
+class AttendeeIndex:
+    """
+    Index of meeting attendees by normalised email and name, to match Arlo registrations without comparing against every attendee.
+
+    Matching follows ArloRegistration equality: a registration matches an attendee if either the name or the email are equal, ignoring case. If several attendees match, the earliest attendee in the meeting is used and the match is recorded as ambiguous.
+    """
+
+    def __init__(self, attendees: list[Attendee]):
+        """
+        Initialize the AttendeeIndex.
+
+        Args:
+            attendees (list[Attendee]): The meeting attendees to index.
+        """
+        self.attendees = attendees
+        self.ambiguous_matches: list[AmbiguousMatch] = []
+        # Key = Normalised email/name, Value = Positions of attendees in the meeting
+        self.emails: dict[str, list[int]] = {}
+        self.names: dict[str, list[int]] = {}
+
+        for i, attendee in enumerate(attendees):
+            # Registrations are only compared with Butter attendees
+            if not isinstance(attendee, ButterAttendee):
+                continue
+
+            self.emails.setdefault(attendee.email.lower(), []).append(i)
+            self.names.setdefault(attendee.name.lower(), []).append(i)
+
+    def match(self, reg: ArloRegistration) -> Attendee | None:
+        """
+        Finds the attendee matching a registration.
+
+        Args:
+            reg (ArloRegistration): The registration to match.
+
+        Returns:
+            Attendee | None: The earliest matching attendee, or None if no attendees match.
+        """
+        positions = sorted(
+            set(self.emails.get(reg.email.lower(), []))
+            | set(self.names.get(reg.name.lower(), []))
+        )
+        if not positions:
+            return None
+
+        if len(positions) > 1:
+            candidates = [self.attendees[i] for i in positions]
+            logger.warning(
+                f"Registration {reg.name} ({reg.email}) matches {len(candidates)} attendees, using {candidates[0]}"
+            )
+            self.ambiguous_matches.append(AmbiguousMatch(reg, candidates))
+
+        return self.attendees[positions[0]]
+
+
+# Common English nicknames, mapped to the name they are short for
+NICKNAMES = {
+    "abby": "abigail",
+    "alex": "alexander",
+    "andy": "andrew",
+    "ben": "benjamin",
+    "beth": "elizabeth",
+    "bill": "william",
+    "bob": "robert",
+    "cathy": "catherine",
+    "chris": "christopher",
+    "dan": "daniel",
+    "danny": "daniel",
+    "dave": "david",
+    "ed": "edward",
+    "jen": "jennifer",
+    "jenny": "jennifer",
+    "jim": "james",
+    "jimmy": "james",
+    "joe": "joseph",
+    "kate": "katherine",
+    "katie": "katherine",
+    "kathy": "katherine",
+    "liz": "elizabeth",
+    "maggie": "margaret",
+    "matt": "matthew",
+    "meg": "margaret",
+    "mike": "michael",
+    "nick": "nicholas",
+    "pat": "patricia",
+    "peggy": "margaret",
+    "rob": "robert",
+    "sam": "samuel",
+    "steve": "stephen",
+    "sue": "susan",
+    "tom": "thomas",
+    "tony": "anthony",
+    "will": "william",
+}
+
+# Candidates compared in full for each registration, ranked by shared n-grams
+MAX_CANDIDATES = 20
+
+
+def normalise(text: str) -> str:
+    """
+    Normalise text for fuzzy comparison, removing diacritics, case and punctuation.
+
+    Args:
+        text (str): The text to normalise.
+
+    Returns:
+        str: The normalised text, with words separated by single spaces.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", stripped.casefold()).split())
+
+
+def name_tokens(name: str) -> list[str]:
+    """Get the normalised words of a name in sorted order, with nicknames replaced by the full name."""
+    return sorted(NICKNAMES.get(token, token) for token in normalise(name).split())
+
+
+def email_parts(email: str) -> tuple[str, str]:
+    """Get the normalised local part and domain of an email, ignoring separators and any +tag in the local part."""
+    local, _, domain = email.casefold().partition("@")
+    local = local.split("+")[0]
+    return (re.sub(r"[^a-z0-9]", "", normalise(local)), domain)
+
+
+def trigrams(text: str) -> set[str]:
+    """Get the character trigrams of text, padded so short words still have trigrams."""
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    """Get the similarity of two strings between 0 and 1, tolerant of typos and transposed characters."""
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+@dataclass
+class FuzzyMatch:
+    """A registration that was matched to an attendee with a similarity score between 0 and 1."""
+
+    registration: ArloRegistration
+    attendee: Attendee
+    score: float
+
+
+@dataclass
+class _FuzzyKey:
+    """Normalised representation of an attendee or registration for fuzzy comparison."""
+
+    name: str
+    local: str
+    domain: str
+    grams: set[str]
+
+    @classmethod
+    def of(cls, attendee: Attendee) -> "_FuzzyKey":
+        tokens = name_tokens(attendee.name or "")
+        local, domain = email_parts(attendee.email or "")
+        return cls(
+            name=" ".join(tokens),
+            local=local,
+            domain=domain,
+            grams={f"n:{token}" for token in tokens}
+            | {f"e:{gram}" for gram in (trigrams(local) if local else set())},
+        )
+
+    def score(self, other: "_FuzzyKey") -> float:
+        # Email typos are less certain when the domain also differs
+        email_score = similarity(self.local, other.local) * (
+            1.0 if self.domain == other.domain else 0.9
+        )
+        return max(similarity(self.name, other.name), email_score)
+
+
+class FuzzyMatcher:
+    """
+    Matches registrations to attendees whose name or email differ slightly, such as swapped first and last names, diacritics, nicknames and typos in the email.
+
+    Candidates are generated from an inverted index of name words and email character trigrams, so each registration is only compared in full with the attendees it shares the most n-grams with.
+    """
+
+    def __init__(self, threshold: float = 0.85, suggest_only: bool = False):
+        """
+        Initialize the FuzzyMatcher.
+
+        Args:
+            threshold (float, optional): Minimum score between 0 and 1 for a registration to match an attendee. Defaults to 0.85.
+            suggest_only (bool, optional): If set, matches are only suggested for review and attendance is not updated from them. Defaults to False.
+        """
+        self.threshold = threshold
+        self.suggest_only = suggest_only
+        self.matches: list[FuzzyMatch] = []
+
+    def match(
+        self, registrations: list[ArloRegistration], attendees: list[Attendee]
+    ) -> list[FuzzyMatch]:
+        """
+        Finds the best match for each registration, if any scores above the threshold. Each attendee is matched to at most one registration, the highest scoring pairs are matched first.
+
+        Args:
+            registrations (list[ArloRegistration]): The registrations that did not match any attendee exactly.
+            attendees (list[Attendee]): The attendees that did not match any registration exactly.
+
+        Returns:
+            list[FuzzyMatch]: The matches, ordered by descending score.
+        """
+        attendee_keys = [_FuzzyKey.of(attendee) for attendee in attendees]
+        # Key = n-gram, Value = Positions of attendees with the n-gram
+        postings: dict[str, list[int]] = {}
+        for i, key in enumerate(attendee_keys):
+            for gram in key.grams:
+                postings.setdefault(gram, []).append(i)
+
+        # N-grams shared by a large share of attendees (e.g. "com") do not distinguish candidates
+        max_postings = max(50, len(attendees) // 10)
+
+        scored: list[FuzzyMatch] = []
+        for reg in registrations:
+            reg_key = _FuzzyKey.of(reg)
+            shared = Counter()
+            for gram in reg_key.grams:
+                positions = postings.get(gram, [])
+                if len(positions) <= max_postings:
+                    shared.update(positions)
+
+            for i, _ in shared.most_common(MAX_CANDIDATES):
+                score = reg_key.score(attendee_keys[i])
+                if score >= self.threshold:
+                    scored.append(FuzzyMatch(reg, attendees[i], round(score, 3)))
+
+        matches = []
+        matched_registrations = set()
+        matched_attendees = set()
+        for match in sorted(scored, key=lambda match: match.score, reverse=True):
+            if (
+                id(match.registration) in matched_registrations
+                or id(match.attendee) in matched_attendees
+            ):
+                continue
+
+            logger.debug(
+                f"Fuzzy match for {match.registration.name} ({match.registration.email}): {match.attendee} with score {match.score}"
+            )
+            matched_registrations.add(id(match.registration))
+            matched_attendees.add(id(match.attendee))
+            matches.append(match)
+
+        self.matches.extend(matches)
+        return matches
@@ -0,0 +1,446 @@
+import asyncio
+import logging
+import random
+import time
+import httpx
+from collections import Counter, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable
+
+from baa.exceptions import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+# Responses that indicate Arlo is throttling requests or temporarily unavailable
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+def parse_retry_after(response: httpx.Response) -> float | None:
+    """
+    Gets the number of seconds to wait from the Retry-After header of a response.
+
+    Args:
+        response (httpx.Response): The response to check.
+
+    Returns:
+        float | None: The seconds to wait, or None if the header is missing or invalid. The header can either be a number of seconds or a HTTP date.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Retries idempotent requests to the Arlo API that fail with a transient error, such as a 429 or 5xx response or a connection error.
+
+    Retries are delayed with jittered exponential backoff, unless the response has a Retry-After header. The time spent waiting between retries is shared across every request using the policy, once the retry budget for the current budget window is spent requests are no longer retried. Waits older than the budget window no longer count against the budget, so a client kept by a long running process such as baa watch or baa serve retries again once Arlo recovers.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        budget: float = 120.0,
+        budget_window: float = 600.0,
+    ):
+        """
+        Initialize the RetryPolicy.
+
+        Args:
+            max_attempts (int, optional): Maximum number of attempts for each request, including the first. Defaults to 4.
+            base_delay (float, optional): Backoff in seconds before the first retry, doubled for each further retry. Defaults to 0.5.
+            max_delay (float, optional): Maximum backoff in seconds between retries. Defaults to 30.0.
+            budget (float, optional): Maximum total seconds spent waiting between retries, across all requests in the budget window. Defaults to 120.0.
+            budget_window (float, optional): Number of seconds waits between retries count against the budget for. Defaults to 600.0.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.budget_window = budget_window
+        # Time each wait between retries was reserved, and its delay, within the budget window
+        self.spent: deque[tuple[float, float]] = deque()
+        # Key = HTTP method, Value = Number of retries
+        self.retries: Counter[str] = Counter()
+
+    def backoff(self, attempt: int, response: httpx.Response | None = None) -> float:
+        """
+        Gets the delay in seconds before retrying a request.
+
+        Args:
+            attempt (int): The number of attempts made so far.
+            response (httpx.Response | None, optional): The failed response, used for its Retry-After header. Defaults to None.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        if (
+            response is not None
+            and (retry_after := parse_retry_after(response)) is not None
+        ):
+            return retry_after
+
+        # Full jitter, so clients retrying at the same time spread out
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+    def remaining_budget(self) -> float:
+        """Gets the seconds left in the retry budget, after the waits reserved within the budget window"""
+        expired = time.monotonic() - self.budget_window
+        while self.spent and self.spent[0][0] <= expired:
+            self.spent.popleft()
+        return self.budget - sum(delay for _, delay in self.spent)
+
+    def _retry_delay(
+        self,
+        method: str,
+        url: str,
+        attempt: int,
+        response: httpx.Response | None = None,
+        error: Exception | None = None,
+    ) -> float | None:
+        """
+        Checks whether a request should be retried, and reserves the delay from the retry budget.
+
+        Returns:
+            float | None: The delay in seconds before retrying, or None if the request should not be retried.
+        """
+        if response is not None and response.status_code not in RETRY_STATUS_CODES:
+            return None
+        if attempt >= self.max_attempts:
+            return None
+
+        delay = self.backoff(attempt, response)
+        if delay > self.remaining_budget():
+            logger.warning(f"Retry budget spent, not retrying {method} {url}")
+            return None
+        self.spent.append((time.monotonic(), delay))
+        self.retries[method] += 1
+
+        reason = repr(error) if error is not None else response.status_code
+        logger.debug(f"{method} {url} failed with {reason}, retrying in {delay:.2f}s")
+        return delay
+
+    async def asend(
+        self, method: str, url: str, send: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """
+        Sends a request, retrying transient failures.
+
+        Args:
+            method (str): HTTP method of the request, used to count retries.
+            url (str): URL of the request, used for logging.
+            send (Callable[[], Awaitable[httpx.Response]]): Sends the request and returns the response.
+
+        Returns:
+            httpx.Response: The first response that is not a transient failure, or the last response once retries are exhausted.
+
+        Raises:
+            httpx.TransportError: If the request could not be sent on the final attempt.
+            CircuitOpen: If the first attempt was not sent because the Arlo API is failing.
+        """
+        attempt = 0
+        response = error = None
+        while True:
+            attempt += 1
+            try:
+                response = await send()
+            except CircuitOpen:
+                # A retry not sent by the circuit breaker reports the failure of the previous attempt
+                if response is not None:
+                    return response
+                if error is not None:
+                    raise error
+                raise
+            except httpx.TransportError as e:
+                response, error = None, e
+                if (delay := self._retry_delay(method, url, attempt, error=e)) is None:
+                    raise
+            else:
+                error = None
+                if (delay := self._retry_delay(method, url, attempt, response)) is None:
+                    return response
+
+            await asyncio.sleep(delay)
+
+
+# Responses that indicate Arlo is overloaded, and concurrency should be reduced
+CONGESTION_STATUS_CODES = frozenset({429, 503})
+
+# Latency increase in seconds that is never treated as a spike, so jitter on fast responses is ignored
+LATENCY_SLACK = 0.05
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of concurrent requests to the Arlo API, adapting the limit to how Arlo is responding with additive increase, multiplicative decrease (AIMD).
+
+    The limit grows by one for each window of successful requests while latency stays near the smoothed baseline, up to max_limit. A throttled (429/503) or timed out request, or a latency spike, cuts the limit by the backoff factor. The limit is cut at most once for requests sent before the previous cut, so a burst of throttled responses only counts once.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        initial: int | None = None,
+        min_limit: int = 1,
+        backoff: float = 0.5,
+        latency_tolerance: float = 3.0,
+    ):
+        """
+        Initialize the AdaptiveLimiter.
+
+        Args:
+            name (str): Name of the requests being limited, used for logging.
+            max_limit (int): Maximum number of concurrent requests.
+            initial (int, optional): Initial number of concurrent requests. Defaults to half of max_limit.
+            min_limit (int, optional): Minimum number of concurrent requests. Defaults to 1.
+            backoff (float, optional): Factor the limit is multiplied by when Arlo is overloaded. Defaults to 0.5.
+            latency_tolerance (float, optional): Multiple of the baseline latency treated as a latency spike. Defaults to 3.0.
+        """
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self._limit = float(
+            initial if initial is not None else max(self.min_limit, max_limit // 2)
+        )
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.baseline_latency: float | None = None
+        self.last_decrease = 0.0
+        self.in_flight = 0
+        self.async_condition: asyncio.Condition | None = None
+        # Each change to the limit, as (seconds since the limiter was created, limit)
+        self.created = time.monotonic()
+        self.history: list[tuple[float, int]] = [(0.0, self.limit)]
+
+    @property
+    def limit(self) -> int:
+        """The current number of concurrent requests allowed"""
+        return int(self._limit)
+
+    def record(self, started: float, latency: float, congested: bool) -> None:
+        """
+        Adjusts the limit based on the outcome of a request.
+
+        Args:
+            started (float): time.monotonic() when the request was sent.
+            latency (float): Seconds taken for the request.
+            congested (bool): Whether Arlo throttled the request, or it timed out.
+        """
+        baseline = self.baseline_latency
+        spike = (
+            baseline is not None
+            and latency > baseline * self.latency_tolerance + LATENCY_SLACK
+        )
+        if not congested:
+            # Exponentially weighted moving average, so the baseline follows gradual changes
+            self.baseline_latency = (
+                latency if baseline is None else 0.9 * baseline + 0.1 * latency
+            )
+
+        previous = self.limit
+        if congested or spike:
+            # Requests sent before the last decrease reflect the old limit
+            if started < self.last_decrease:
+                return
+            self._limit = max(self.min_limit, self._limit * self.backoff)
+            self.last_decrease = time.monotonic()
+            reason = "throttled" if congested else f"latency spike of {latency:.3f}s"
+        else:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            reason = "healthy responses"
+
+        if self.limit != previous:
+            self.history.append((time.monotonic() - self.created, self.limit))
+            logger.debug(
+                f"{self.name} concurrency limit {previous} -> {self.limit} after {reason}"
+            )
+
+    async def asend(
+        self, send: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """
+        Sends a request once the number of requests in flight is below the limit.
+
+        Args:
+            send (Callable[[], Awaitable[httpx.Response]]): Sends the request and returns the response.
+
+        Returns:
+            httpx.Response: The response.
+        """
+        if self.async_condition is None:
+            self.async_condition = asyncio.Condition()
+
+        async with self.async_condition:
+            await self.async_condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+        started = time.monotonic()
+        # Not recorded if the request was interrupted, or not sent by the circuit breaker
+        congested = None
+        try:
+            response = await send()
+            congested = response.status_code in CONGESTION_STATUS_CODES
+            return response
+        except httpx.TransportError as e:
+            congested = isinstance(e, httpx.TimeoutException)
+            raise
+        finally:
+            if congested is not None:
+                self.record(started, time.monotonic() - started, congested)
+            async with self.async_condition:
+                self.in_flight -= 1
+                self.async_condition.notify_all()
+
+    def log_history(self) -> None:
+        """Log each change to the limit"""
+        history = ", ".join(f"{limit} at {at:.2f}s" for at, limit in self.history)
+        logger.debug(f"{self.name} concurrency limit history: {history}")
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to the Arlo API while it is failing, so remaining work fails fast instead of each request waiting for its own timeout.
+
+    The circuit opens once the share of failed requests (5xx responses or connection errors) in the recent window reaches failure_ratio. While open, requests raise CircuitOpen without being sent. After reset_timeout the circuit is half-open, and a limited number of probe requests are sent: the circuit closes if a probe succeeds, or opens again if it fails.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_ratio: float = 0.5,
+        min_requests: int = 10,
+        window: int = 20,
+        reset_timeout: float = 30.0,
+        half_open_probes: int = 1,
+    ):
+        """
+        Initialize the CircuitBreaker.
+
+        Args:
+            failure_ratio (float, optional): Share of failed requests in the window that opens the circuit. Defaults to 0.5.
+            min_requests (int, optional): Minimum number of requests in the window before the circuit can open. Defaults to 10.
+            window (int, optional): Number of most recent requests the failure ratio is calculated from. Defaults to 20.
+            reset_timeout (float, optional): Seconds the circuit stays open before probe requests are sent. Defaults to 30.0.
+            half_open_probes (int, optional): Number of probe requests allowed in flight while half-open. Defaults to 1.
+        """
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def _transition(self, state: str) -> None:
+        logger.debug(f"Circuit breaker {self.state} -> {state}")
+        self.state = state
+        self.outcomes.clear()
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+
+    def before_request(self) -> bool:
+        """
+        Checks whether a request can be sent.
+
+        Returns:
+            bool: True if the request is a half-open probe.
+
+        Raises:
+            CircuitOpen: If the circuit is open, or enough probes are already in flight.
+        """
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpen(
+                    f"🚨 The Arlo API is failing, requests are paused for {remaining:.0f} seconds. Try again once Arlo has recovered"
+                )
+            self._transition(self.HALF_OPEN)
+            self.probes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.half_open_probes:
+                raise CircuitOpen(
+                    "🚨 The Arlo API is failing, waiting for a probe request to succeed. Try again once Arlo has recovered"
+                )
+            self.probes += 1
+            return True
+
+        return False
+
+    def record(self, success: bool | None, probe: bool = False) -> None:
+        """
+        Records the outcome of a request, opening or closing the circuit if needed.
+
+        Args:
+            success (bool | None): Whether the request succeeded. Client errors such as 404 count as successes, as Arlo is responding. None if the request was interrupted, which is not counted.
+            probe (bool, optional): Whether the request was a half-open probe. Defaults to False.
+        """
+        if probe:
+            self.probes -= 1
+            if self.state == self.HALF_OPEN and success is not None:
+                self._transition(self.CLOSED if success else self.OPEN)
+            return
+
+        if self.state != self.CLOSED or success is None:
+            return
+
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if (
+            len(self.outcomes) >= self.min_requests
+            and failures / len(self.outcomes) >= self.failure_ratio
+        ):
+            logger.warning(
+                f"{failures} of the last {len(self.outcomes)} requests to the Arlo API failed, pausing requests for {self.reset_timeout} seconds"
+            )
+            self._transition(self.OPEN)
+
+    async def asend(
+        self, send: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        """
+        Sends a request unless the circuit is open.
+
+        Args:
+            send (Callable[[], Awaitable[httpx.Response]]): Sends the request and returns the response.
+
+        Returns:
+            httpx.Response: The response.
+
+        Raises:
+            CircuitOpen: If the circuit is open.
+        """
+        probe = self.before_request()
+        success = None
+        try:
+            response = await send()
+            success = response.status_code < 500
+            return response
+        except httpx.TransportError:
+            success = False
+            raise
+        finally:
+            self.record(success, probe)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from timeit import default_timer as timer
+
+from baa.arlo_api import DEFAULT_MAX_CONCURRENCY, ArloClient
+from baa.classes import ArloRegistration, AttendanceStatus
+from baa.exceptions import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WriteResult:
+    """Outcome of an attendance update for a registration. Error is set if the update raised an exception, and attempted is False if the update was not sent because the Arlo API is failing."""
+
+    registration: ArloRegistration
+    attendance: AttendanceStatus
+    success: bool
+    elapsed: float
+    error: Exception | None = None
+    attempted: bool = True
+
+
+class WriteScheduler:
+    """
+    Queues attendance updates and sends them to Arlo from a fixed number of workers, so there are never more than max_concurrency updates in flight.
+
+    Used as an async context manager. Leaving the context waits for every queued update to finish, or cancels them if an exception was raised.
+    """
+
+    def __init__(
+        self, arlo_client: ArloClient, max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ):
+        """
+        Initialize the WriteScheduler.
+
+        Args:
+            arlo_client (ArloClient): The client used to send attendance updates.
+            max_concurrency (int, optional): Maximum number of updates in flight. Defaults to 8.
+        """
+        self.arlo_client = arlo_client
+        self.max_concurrency = max_concurrency
+        self.queue: asyncio.Queue[ArloRegistration] = asyncio.Queue()
+        self.results: list[WriteResult] = []
+        self.workers: list[asyncio.Task] = []
+
+    async def __aenter__(self) -> "WriteScheduler":
+        self.workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)
+        ]
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            if exc_type is None:
+                await self.queue.join()
+        finally:
+            for worker in self.workers:
+                worker.cancel()
+            await asyncio.gather(*self.workers, return_exceptions=True)
+
+        attempted = [result for result in self.results if result.attempted]
+        failed = sum(not result.success for result in attempted)
+        logger.debug(
+            f"Sent {len(attempted)} attendance updates with at most {self.max_concurrency} in flight, {failed} failed, {len(self.results) - len(attempted)} not attempted"
+        )
+
+    def submit(self, reg: ArloRegistration) -> None:
+        """
+        Queues an update of the registration's attendance in Arlo, based on whether attendance was registered.
+
+        Args:
+            reg (ArloRegistration): The registration to update.
+        """
+        self.queue.put_nowait(reg)
+
+    async def _worker(self) -> None:
+        while True:
+            reg = await self.queue.get()
+            try:
+                self.results.append(await self._update_attendance(reg))
+            finally:
+                self.queue.task_done()
+
+    async def _update_attendance(self, reg: ArloRegistration) -> WriteResult:
+        attendance = reg.target_attendance
+        logger.debug(f"Updating attendance for {reg} to {attendance}")
+
+        start = timer()
+        try:
+            success = await self.arlo_client.update_attendance(reg.reg_href, attendance)
+        except CircuitOpen as e:
+            logger.debug(f"Not updating attendance for {reg}: {e}")
+            return WriteResult(
+                reg, attendance, False, timer() - start, error=e, attempted=False
+            )
+        except Exception as e:
+            logger.error(f"Unable to update attendance for {reg}: {e!r}")
+            return WriteResult(reg, attendance, False, timer() - start, error=e)
+
+        return WriteResult(reg, attendance, success, timer() - start)
@@ -0,0 +1,530 @@
+import asyncio
+import json
+import logging
+import shutil
+import tempfile
+import uuid
+from collections import deque
+from contextlib import suppress
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import Any
+from urllib.parse import parse_qsl, urlsplit
+
+import click
+
+from baa.arlo_api import ArloClient
+from baa.exceptions import AuthenticationFailed, CredentialsNotFound, HttpError
+from baa.helpers import ATTENDEE_FILE_SUFFIX, CredentialProvider
+from baa.api import (
+    ATTENDEE_FILE_ERRORS,
+    AttendanceResult,
+    create_arlo_client,
+    update_attendance,
+)
+from baa.scheduler import DEFAULT_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Largest attendee report accepted by POST /jobs
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+# Largest request line and headers accepted
+MAX_HEADER_SIZE = 64 * 1024
+# Number of finished jobs kept for GET /jobs/{id}, the oldest are forgotten first
+MAX_FINISHED_JOBS = 1000
+
+HTTP_REASONS = {
+    100: "Continue",
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Content Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+TRUE_VALUES = ("", "1", "true", "yes", "on")
+FALSE_VALUES = ("0", "false", "no", "off")
+
+
+@dataclass
+class JobOptions:
+    """Options for updating attendance from an attendee report, matching the options of the CLI."""
+
+    event_code: str | None = None
+    date: datetime | None = None
+    min_duration: int = 0
+    skip_absent: bool = False
+    dry_run: bool = False
+    fuzzy: str = "off"
+    fuzzy_threshold: float = 0.85
+
+    def with_query(self, query: dict[str, str]) -> "JobOptions":
+        """
+        Override the options with query parameters named after the CLI options, e.g. ?event-code=CK24ABC&dry-run.
+
+        Args:
+            query (dict[str, str]): The query parameters. Flags without a value are set.
+
+        Raises:
+            ValueError: If a parameter is unknown or its value is not valid.
+
+        Returns:
+            JobOptions: A copy of the options, with the parameters applied.
+        """
+
+        def flag(value: str) -> bool:
+            if value.lower() in TRUE_VALUES:
+                return True
+            if value.lower() in FALSE_VALUES:
+                return False
+            raise ValueError(f"expected true or false, got {value!r}")
+
+        parsers = {
+            "event_code": str,
+            "date": lambda value: datetime.strptime(value, "%Y-%m-%d"),
+            "min_duration": int,
+            "skip_absent": flag,
+            "dry_run": flag,
+            "fuzzy": lambda value: _choice(value, ("off", "suggest", "apply")),
+            "fuzzy_threshold": lambda value: _in_range(float(value), 0, 1),
+        }
+        changes = {}
+        for name, value in query.items():
+            option = name.replace("-", "_")
+            if option not in parsers:
+                raise ValueError(f"Unknown option {name!r}")
+            try:
+                changes[option] = parsers[option](value)
+            except ValueError as e:
+                raise ValueError(f"Invalid value for {name!r}: {e}")
+
+        return replace(self, **changes)
+
+    def to_dict(self) -> dict[str, Any]:
+        options = asdict(self)
+        options["date"] = self.date.strftime("%Y-%m-%d") if self.date else None
+        return options
+
+
+def _choice(value: str, choices: tuple[str, ...]) -> str:
+    if value.lower() not in choices:
+        raise ValueError(f"expected one of {', '.join(choices)}, got {value!r}")
+    return value.lower()
+
+
+def _in_range(value: float, low: float, high: float) -> float:
+    if not low <= value <= high:
+        raise ValueError(f"expected a value from {low} to {high}, got {value}")
+    return value
+
+
+@dataclass
+class Job:
+    """An attendee report submitted to the server, and the outcome of updating attendance from it once finished."""
+
+    job_id: str
+    filename: str
+    attendee_file: Path
+    options: JobOptions
+    status: str = "queued"
+    submitted_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    elapsed: float | None = None
+    result: AttendanceResult | None = None
+    error: str | None = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        result = self.result.to_dict() if self.result is not None else None
+        if result is not None:
+            result["attendee_file"] = self.filename
+
+        return {
+            "id": self.job_id,
+            "status": self.status,
+            "filename": self.filename,
+            "options": self.options.to_dict(),
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "elapsed": self.elapsed,
+            "error": self.error,
+            "result": result,
+        }
+
+
+class AttendanceServer:
+    """
+    HTTP server that updates attendance in Arlo from attendee reports uploaded by other tools, with one ArloClient shared by every report.
+
+    Endpoints:
+        POST /jobs: Queues the attendee report in the request body, with options in the query string named after the CLI options, e.g. ?event-code=CK24ABC&dry-run. Responds with the job once queued, or once finished with ?wait.
+        GET /jobs/{id}: Responds with a job, including its result once finished.
+        GET /status: Responds with the number of jobs queued, running and finished, and the retries of requests to Arlo.
+
+    Reports are processed by a fixed number of workers, so at most max_jobs reports are processed at a time, and reports are rejected with 503 once max_queue reports are waiting.
+    """
+
+    def __init__(
+        self,
+        arlo_client: ArloClient,
+        defaults: JobOptions | None = None,
+        max_jobs: int = 4,
+        max_queue: int = 100,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        """
+        Initialize the AttendanceServer.
+
+        Args:
+            arlo_client (ArloClient): The client used to look up and update registrations, for every report.
+            defaults (JobOptions, optional): Options of reports that don't set them in the query string. Defaults to JobOptions().
+            max_jobs (int, optional): Maximum number of reports processed at a time. Defaults to 4.
+            max_queue (int, optional): Maximum number of reports waiting to be processed. Defaults to 100.
+            max_concurrency (int, optional): Maximum number of attendance updates in flight for each report. Defaults to 8.
+        """
+        self.arlo_client = arlo_client
+        self.defaults = defaults or JobOptions()
+        self.max_jobs = max_jobs
+        self.max_concurrency = max_concurrency
+        self.queue: asyncio.Queue[Job] = asyncio.Queue(max_queue)
+        self.jobs: dict[str, Job] = {}
+        self.finished: deque[str] = deque()
+        self.counts = {"succeeded": 0, "failed": 0}
+        self.workers: list[asyncio.Task] = []
+        self.writers: set[asyncio.StreamWriter] = set()
+        self.server: asyncio.Server | None = None
+        self.upload_dir: Path | None = None
+        self.started = timer()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> tuple[str, int]:
+        """
+        Starts the workers and listens for requests.
+
+        Args:
+            host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+            port (int, optional): The port to listen on, or 0 for any free port. Defaults to 8080.
+
+        Returns:
+            tuple[str, int]: The address and port listened on.
+        """
+        self.upload_dir = Path(tempfile.mkdtemp(prefix="baa-"))
+        self.workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.max_jobs)
+        ]
+        self.server = await asyncio.start_server(
+            self._handle_connection, host, port, limit=MAX_HEADER_SIZE
+        )
+        self.started = timer()
+        host, port = self.server.sockets[0].getsockname()[:2]
+        logger.info(f"Listening on http://{host}:{port}")
+        return host, port
+
+    async def close(self) -> None:
+        """Stops listening for requests, and cancels the reports being processed."""
+        if self.server is not None:
+            self.server.close()
+        for writer in self.writers:
+            writer.close()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        if self.upload_dir is not None:
+            shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "platform": self.arlo_client.platform,
+            "uptime": timer() - self.started,
+            "max_jobs": self.max_jobs,
+            "max_queue": self.queue.maxsize,
+            "queued": self.queue.qsize(),
+            "running": sum(job.status == "running" for job in self.jobs.values()),
+            **self.counts,
+            "retries": dict(self.arlo_client.retry_policy.retries),
+        }
+
+    async def submit(
+        self, report: bytes, filename: str, options: JobOptions, wait: bool = False
+    ) -> Job:
+        """
+        Queues an attendee report to update attendance from.
+
+        Args:
+            report (bytes): The contents of the attendee report.
+            filename (str): The name of the attendee report.
+            options (JobOptions): Options for updating attendance from the report.
+            wait (bool, optional): Whether to return once the report is processed, rather than once it is queued. Defaults to False.
+
+        Raises:
+            HttpError: If the report is empty or its name is invalid, too many reports are waiting to be processed, or the report cannot be saved.
+
+        Returns:
+            Job: The job processing the report.
+        """
+        if not report:
+            raise HttpError(400, "Missing attendee report in the request body")
+        name = Path(filename).name
+        if name == "..":
+            raise HttpError(400, f"Invalid attendee report name: {filename}")
+        queue_full = HttpError(
+            503, f"{self.queue.maxsize} attendee reports are already waiting"
+        )
+        if self.queue.full():
+            raise queue_full
+
+        job_id = uuid.uuid4().hex
+        # The report is parsed from a file like any other attendee file, under the name it was uploaded with
+        attendee_file = self.upload_dir / job_id / (name or job_id)
+        job = Job(job_id, filename, attendee_file, options)
+        try:
+            await asyncio.to_thread(_write_report, attendee_file, report)
+            # Reports uploaded while this one was written may have filled the queue
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            shutil.rmtree(attendee_file.parent, ignore_errors=True)
+            raise queue_full
+        except OSError as e:
+            logger.error(f"Unable to save {filename}: {e!r}")
+            shutil.rmtree(attendee_file.parent, ignore_errors=True)
+            raise HttpError(500, f"Unable to save the attendee report {filename}")
+        self.jobs[job_id] = job
+        logger.debug(f"Queued job {job_id} for {filename}")
+
+        if wait:
+            await job.done.wait()
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        start = timer()
+        options = job.options
+        try:
+            job.result = await update_attendance(
+                self.arlo_client,
+                job.attendee_file,
+                options.event_code,
+                options.date,
+                options.min_duration,
+                options.skip_absent,
+                options.dry_run,
+                options.fuzzy,
+                options.fuzzy_threshold,
+                self.max_concurrency,
+            )
+        except (*ATTENDEE_FILE_ERRORS, AuthenticationFailed, CredentialsNotFound) as e:
+            logger.error(f"Unable to process {job.filename}: {e!r}")
+            job.error = str(e)
+        except Exception as e:
+            # The worker carries on with the next report
+            logger.exception(f"Unexpected error processing {job.filename}")
+            job.error = f"Unexpected error: {e!r}"
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            job.elapsed = timer() - start
+            shutil.rmtree(job.attendee_file.parent, ignore_errors=True)
+
+        failed = job.error is not None or bool(
+            job.result.failed_updates or job.result.not_attempted
+        )
+        job.status = "failed" if failed else "succeeded"
+        self.counts[job.status] += 1
+        job.done.set()
+        logger.debug(f"Job {job.job_id} {job.status} in {job.elapsed} seconds")
+
+        self.finished.append(job.job_id)
+        while len(self.finished) > MAX_FINISHED_JOBS:
+            del self.jobs[self.finished.popleft()]
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.writers.add(writer)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await self._read_request(reader, writer)
+                    if request is None:
+                        break
+                    method, path, query, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, payload, extra_headers = await self._route(
+                        method, path, query, body
+                    )
+                except HttpError as e:
+                    # The rest of the request may not have been read
+                    keep_alive = False
+                    status, payload, extra_headers = e.status, {"error": e.message}, {}
+
+                await self._respond(writer, status, payload, extra_headers, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> tuple[str, str, dict[str, str], dict[str, str], bytes] | None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "Request headers are too large")
+
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")[:-2]
+        try:
+            method, target, _ = request_line.split(" ")
+            headers = {
+                name.strip().lower(): value.strip()
+                for name, value in (line.split(":", 1) for line in header_lines)
+            }
+        except ValueError:
+            raise HttpError(400, "Malformed request")
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "The request body must have a Content-Length")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > MAX_UPLOAD_SIZE:
+            raise HttpError(
+                413, f"Attendee reports must be at most {MAX_UPLOAD_SIZE} bytes"
+            )
+
+        if length and headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        body = await reader.readexactly(length)
+
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+        return method.upper(), url.path.rstrip("/"), query, headers, body
+
+    async def _route(
+        self, method: str, path: str, query: dict[str, str], body: bytes
+    ) -> tuple[int, Any, dict[str, str]]:
+        if path == "/jobs":
+            if method != "POST":
+                raise HttpError(405, f"Use POST to submit attendee reports to {path}")
+            filename = query.pop("filename", f"attendee_file{ATTENDEE_FILE_SUFFIX}")
+            try:
+                wait = query.pop("wait", "false").lower() in TRUE_VALUES
+                options = self.defaults.with_query(query)
+            except ValueError as e:
+                raise HttpError(400, str(e))
+
+            job = await self.submit(body, filename, options, wait)
+            return (
+                200 if job.done.is_set() else 202,
+                job.to_dict(),
+                {"Location": f"/jobs/{job.job_id}"},
+            )
+
+        if path.startswith("/jobs/") or path == "/status":
+            if method != "GET":
+                raise HttpError(405, f"Use GET for {path}")
+            if path == "/status":
+                return 200, self.status(), {}
+
+            job = self.jobs.get(path.removeprefix("/jobs/"))
+            if job is None:
+                raise HttpError(404, f"No job at {path}")
+            return 200, job.to_dict(), {}
+
+        raise HttpError(404, f"No endpoint at {path}")
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: Any,
+        extra_headers: dict[str, str],
+        keep_alive: bool,
+    ) -> None:
+        body = json.dumps(payload).encode()
+        headers = {
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **extra_headers,
+        }
+        head = f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in headers.items()
+        )
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+
+def _write_report(attendee_file: Path, report: bytes) -> None:
+    attendee_file.parent.mkdir(parents=True)
+    attendee_file.write_bytes(report)
+
+
+async def baa_serve(
+    platform: str,
+    defaults: JobOptions,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    cache_ttl: int = 24,
+    refresh_cache: bool = False,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    credential_provider: CredentialProvider | None = None,
+    max_jobs: int = 4,
+    max_queue: int = 100,
+    stop: asyncio.Event | None = None,
+) -> None:
+    """
+    Serve the AttendanceServer until stopped, with one ArloClient kept for every report, so the connection, credentials, and event and session lookups stay warm between reports.
+
+    Args:
+        platform (str): The platform subdomain (e.g., "myarlo") to update attendance on.
+        defaults (JobOptions): Options of reports that don't set them in the query string.
+        stop (asyncio.Event, optional): Stops serving once set. Defaults to serving until cancelled.
+    """
+    stop = stop or asyncio.Event()
+    arlo_client = create_arlo_client(
+        platform, cache_ttl, refresh_cache, max_concurrency, credential_provider
+    )
+    try:
+        preconnect = asyncio.create_task(arlo_client.preconnect())
+        server = AttendanceServer(
+            arlo_client, defaults, max_jobs, max_queue, max_concurrency
+        )
+        try:
+            host, port = await server.start(host, port)
+            click.echo(
+                f"Serving attendance updates for {platform} on http://{host}:{port}, press Ctrl+C to stop\n"
+            )
+            await stop.wait()
+        finally:
+            preconnect.cancel()
+            await asyncio.gather(preconnect, return_exceptions=True)
+            await server.close()
+    finally:
+        await arlo_client.close()
@@ -0,0 +1,113 @@
+import logging
+import os
+import time
+from pathlib import Path
+
+from baa.helpers import ATTENDEE_FILE_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# Subfolders of the watched folder that attendee files are moved to once processed
+DONE_DIR = "done"
+FAILED_DIR = "failed"
+
+
+class FolderWatcher:
+    """
+    Finds attendee files dropped into a folder, by polling it for new files.
+
+    A file is only ready once it is unchanged between two polls and has not been modified for settle_time seconds, so files that are still being written or copied into the folder are not processed partially. Files are claimed when they are ready, so they are only returned once.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        settle_time: float = 2.0,
+        suffix: str = ATTENDEE_FILE_SUFFIX,
+    ):
+        """
+        Initialize the FolderWatcher.
+
+        Args:
+            directory (Path): The folder attendee files are dropped into.
+            settle_time (float, optional): Number of seconds a file must be unmodified for before it is ready. Defaults to 2.0.
+            suffix (str, optional): Extension of the attendee files, matched case-insensitively. Defaults to ".csv".
+        """
+        self.directory = directory
+        self.settle_time = settle_time
+        self.suffix = suffix
+        # Size and modification time of each file at the last poll, for files that are not ready yet
+        self.pending: dict[Path, tuple[int, int]] = {}
+        self.claimed: set[Path] = set()
+
+    def poll(self) -> list[Path]:
+        """
+        Scans the folder once for attendee files that are ready to be processed.
+
+        Returns:
+            list[Path]: The files that became ready since the last poll, in name order.
+        """
+        now = time.time()
+        seen = set()
+        ready = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if (
+                    entry.name.startswith(".")
+                    or not entry.name.lower().endswith(self.suffix)
+                    or not entry.is_file()
+                ):
+                    continue
+
+                path = Path(entry.path)
+                if path in self.claimed:
+                    continue
+                seen.add(path)
+
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if (
+                    self.pending.get(path) == signature
+                    and now - stat.st_mtime >= self.settle_time
+                ):
+                    del self.pending[path]
+                    self.claimed.add(path)
+                    ready.append(path)
+                else:
+                    self.pending[path] = signature
+
+        # Forget files that were removed before they were ready
+        for path in self.pending.keys() - seen:
+            del self.pending[path]
+
+        if ready:
+            logger.debug(f"Found {len(ready)} attendee files in {self.directory}")
+        return sorted(ready)
+
+    def move(self, attendee_file: Path, failed: bool) -> Path:
+        """
+        Moves a processed attendee file to the done or failed subfolder, without replacing a file of the same name that was processed before.
+
+        Args:
+            attendee_file (Path): A file returned by poll.
+            failed (bool): Whether the file is moved to the failed subfolder instead of the done subfolder.
+
+        Returns:
+            Path: The new path of the file.
+        """
+        target_dir = self.directory / (FAILED_DIR if failed else DONE_DIR)
+        target_dir.mkdir(exist_ok=True)
+
+        target = target_dir / attendee_file.name
+        copies = 0
+        while target.exists():
+            copies += 1
+            target = target_dir / f"{attendee_file.stem}-{copies}{attendee_file.suffix}"
+
+        attendee_file.replace(target)
+        self.claimed.discard(attendee_file)
+        logger.debug(f"Moved {attendee_file} to {target}")
+        return target
@@ -0,0 +1,40 @@
+import httpx
+import pytest
+import pytest_asyncio
+
+from baa.arlo_api import ArloClient
+from tests.fake_arlo import FakeArlo
+
+
+@pytest.fixture
+def fake_arlo(request):
+    marker = request.node.get_closest_marker("catalogue")
+    options = dict(marker.kwargs) if marker else {}
+    events = options.pop("events", 1)
+    registrations = options.pop("registrations", 4)
+
+    fake_arlo = FakeArlo.with_catalogue(events, **options)
+    for event in fake_arlo.events:
+        fake_arlo.add_registrations(f"{event.event_id}00", registrations)
+    return fake_arlo
+
+
+@pytest.fixture
+def make_arlo_client(mocker):
+    mocker.patch("baa.helpers.get_keyring_credentials", return_value=("user", "pass"))
+
+    def make_arlo_client(fake_arlo: FakeArlo, **kwargs) -> ArloClient:
+        arlo_client = ArloClient("test-platform", **kwargs)
+        arlo_client.async_client = httpx.AsyncClient(
+            transport=fake_arlo.async_transport()
+        )
+        return arlo_client
+
+    return make_arlo_client
+
+
+@pytest_asyncio.fixture
+async def arlo_client(make_arlo_client, fake_arlo):
+    arlo_client = make_arlo_client(fake_arlo)
+    yield arlo_client
+    await arlo_client.close()
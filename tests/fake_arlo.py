@@ -0,0 +1,406 @@
+import asyncio
+import csv
+import h2.config
+import h2.connection
+import h2.events
+import hashlib
+import re
+import httpx
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BASE_URL = "https://test-platform.arlo.co/api/2012-02-01/auth/resources"
+
+
+@dataclass
+class FakeEvent:
+    event_id: str
+    code: str
+    name: str
+
+
+@dataclass
+class FakeSession:
+    session_id: str
+    event_id: str
+    name: str
+    start: datetime
+
+
+@dataclass
+class FakeRegistration:
+    reg_id: str
+    first_name: str
+    last_name: str
+    email: str
+    status: str = "Approved"
+    attendance: str = "Unknown"
+
+
+@dataclass
+class FakeArlo:
+    """
+    A stand-in for the Arlo API, serving generated Events, EventSessions and EventSessionRegistrations over an httpx.MockTransport.
+
+    Supports the expand, filter, skip and top query options used by ArloClient, ETag revalidation, an optional TotalCount element, and attendance updates. Per-request latency can be simulated, and the number of requests served concurrently to async clients can be capped. Async requests arriving while throttle_limit requests are already in flight are rejected with 429 Too Many Requests, and during an outage every request fails with 500 Internal Server Error after the latency.
+    """
+
+    events: list[FakeEvent] = field(default_factory=list)
+    sessions: list[FakeSession] = field(default_factory=list)
+    registrations: dict[str, list[FakeRegistration]] = field(default_factory=dict)
+    page_size: int = 100
+    latency: float = 0.0
+    supports_filter: bool = True
+    supports_etag: bool = True
+    exposes_total_count: bool = False
+    write_latency: float = 0.0
+    capacity: int | None = None
+    throttle_limit: int | None = None
+    outage: bool = False
+    requests: list[httpx.Request] = field(default_factory=list)
+    in_flight: int = 0
+    max_in_flight: int = 0
+    throttled: int = 0
+    base_url: str = BASE_URL
+
+    @classmethod
+    def with_catalogue(cls, num_events: int, sessions_per_event: int = 5, **kwargs):
+        events = [
+            FakeEvent(event_id=str(1000 + i), code=f"CK{i:05d}", name=f"Event {i}")
+            for i in range(num_events)
+        ]
+        sessions = [
+            FakeSession(
+                session_id=f"{event.event_id}{j:02d}",
+                event_id=event.event_id,
+                name=f"{event.name} Session {j}",
+                start=datetime(2024, 1, 1, 18, 30) + timedelta(days=7 * j),
+            )
+            for event in events
+            for j in range(sessions_per_event)
+        ]
+        return cls(events=events, sessions=sessions, **kwargs)
+
+    def add_registrations(self, session_id: str, num_registrations: int) -> None:
+        self.registrations[session_id] = [
+            FakeRegistration(
+                reg_id=f"{session_id}-{i}",
+                first_name="Attendee",
+                last_name=str(i),
+                email=f"attendee{i}@example.com",
+            )
+            for i in range(num_registrations)
+        ]
+
+    def async_transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.async_handler)
+
+    async def async_handler(self, request: httpx.Request) -> httpx.Response:
+        if self.throttle_limit is not None and self.in_flight >= self.throttle_limit:
+            self.throttled += 1
+            return httpx.Response(429)
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.capacity is None:
+                return await self._async_route(request)
+
+            if not hasattr(self, "_capacity"):
+                self._capacity = asyncio.Semaphore(self.capacity)
+            async with self._capacity:
+                return await self._async_route(request)
+        finally:
+            self.in_flight -= 1
+
+    async def _async_route(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        latency = self.write_latency if request.method == "PATCH" else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+
+        return self._route(request)
+
+    def _route(self, request: httpx.Request) -> httpx.Response:
+        if self.outage:
+            return httpx.Response(500)
+
+        if request.method == "PATCH":
+            return self._update_attendance(request)
+
+        params = request.url.params
+        path = request.url.path
+        filter_expr = params.get("filter")
+        if filter_expr is not None and not self.supports_filter:
+            return httpx.Response(400, content=b"Filter not supported")
+
+        if path.endswith("/events"):
+            items = self.events
+            if filter_expr is not None:
+                code = re.search(r"Code eq '([^']*)'", filter_expr).group(1)
+                items = [event for event in items if event.code == code]
+            return self._page(request, "Events", items, self._event_xml)
+
+        if match := re.search(r"/events/(\w+)/sessions$", path):
+            items = [s for s in self.sessions if s.event_id == match.group(1)]
+            if filter_expr is not None:
+                lower, upper = re.findall(r"datetime\('([^']*)'\)", filter_expr)
+                lower = datetime.strptime(lower, "%Y-%m-%dT%H:%M:%SZ")
+                upper = datetime.strptime(upper, "%Y-%m-%dT%H:%M:%SZ")
+                items = [s for s in items if lower <= s.start < upper]
+            return self._page(request, "EventSessions", items, self._session_xml)
+
+        if match := re.search(r"/eventsessions/([\w-]+)/registrations$", path):
+            items = self.registrations.get(match.group(1), [])
+            return self._page(
+                request, "EventSessionRegistrations", items, self._registration_xml
+            )
+
+        return httpx.Response(404)
+
+    def _update_attendance(self, request: httpx.Request) -> httpx.Response:
+        match = re.search(r"/sessionregistrations/([\w-]+)$", request.url.path)
+        for registrations in self.registrations.values():
+            for reg in registrations:
+                if match and reg.reg_id == match.group(1):
+                    reg.attendance = re.search(
+                        r"<replace[^>]*>([^<]*)</replace>", request.content.decode()
+                    ).group(1)
+                    return httpx.Response(200)
+
+        return httpx.Response(404)
+
+    def _page(self, request, root_tag, items, to_xml) -> httpx.Response:
+        skip = int(request.url.params.get("skip", 0))
+        top = int(request.url.params.get("top", self.page_size))
+        page = items[skip : skip + top]
+
+        body = "".join(to_xml(item) for item in page)
+        if self.exposes_total_count:
+            body = f"<TotalCount>{len(items)}</TotalCount>" + body
+        if skip + top < len(items):
+            next_url = request.url.copy_merge_params({"skip": skip + top, "top": top})
+            body += f'<Link rel="next" href="{str(next_url).replace("&", "&amp;")}"/>'
+
+        content = f"<{root_tag}>{body}</{root_tag}>".encode()
+        if not self.supports_etag:
+            return httpx.Response(200, content=content)
+
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, content=content, headers={"ETag": etag})
+
+    @staticmethod
+    def _event_xml(event: FakeEvent) -> str:
+        return f"""
+            <Link title="Event">
+                <Event>
+                    <EventID>{event.event_id}</EventID>
+                    <Code>{event.code}</Code>
+                    <Name>{event.name}</Name>
+                </Event>
+            </Link>
+        """
+
+    @staticmethod
+    def _session_xml(session: FakeSession) -> str:
+        return f"""
+            <Link title="EventSession">
+                <EventSession>
+                    <SessionID>{session.session_id}</SessionID>
+                    <Name>{session.name}</Name>
+                    <StartDateTime>{session.start.strftime("%Y-%m-%dT%H:%M:%S")}.0000000+00:00</StartDateTime>
+                </EventSession>
+            </Link>
+        """
+
+    def _registration_xml(self, reg: FakeRegistration) -> str:
+        return f"""
+            <Link title="EventSessionRegistration" href="{self.base_url}/registrations/{reg.reg_id}/sessionregistrations/{reg.reg_id}">
+                <EventSessionRegistration>
+                    <Attendance>{reg.attendance}</Attendance>
+                    <Link title="ParentRegistration">
+                        <Registration>
+                            <Status>{reg.status}</Status>
+                            <Link title="Contact">
+                                <Contact>
+                                    <FirstName>{reg.first_name}</FirstName>
+                                    <LastName>{reg.last_name}</LastName>
+                                    <Email>{reg.email}</Email>
+                                </Contact>
+                            </Link>
+                        </Registration>
+                    </Link>
+                </EventSessionRegistration>
+            </Link>
+        """
+
+
+class FakeArloServer:
+    """
+    Serves a FakeArlo over a local socket, speaking HTTP/1.1 with keep-alive, or HTTP/2 to clients sending the HTTP/2 connection preface (prior knowledge, without TLS).
+
+    Each new connection is delayed by connect_latency before it is served, standing in for the TCP and TLS handshakes with the Arlo API.
+    """
+
+    def __init__(self, fake_arlo: FakeArlo, connect_latency: float = 0.0):
+        self.fake_arlo = fake_arlo
+        self.connect_latency = connect_latency
+        self.connections = 0
+
+    @asynccontextmanager
+    async def serve(self):
+        server = await asyncio.start_server(self._handle_connection, "127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()
+        self.fake_arlo.base_url = f"http://{host}:{port}/api/2012-02-01/auth/resources"
+        async with server:
+            yield self.fake_arlo.base_url
+
+    async def _handle_connection(self, reader, writer) -> None:
+        self.connections += 1
+        await asyncio.sleep(self.connect_latency)
+        try:
+            preface = await reader.readexactly(len(b"PRI * HTTP/2.0"))
+            if preface == b"PRI * HTTP/2.0":
+                await self._serve_http2(preface, reader, writer)
+            else:
+                await self._serve_http1(preface, reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_http1(self, preface: bytes, reader, writer) -> None:
+        head = preface + await reader.readuntil(b"\r\n\r\n")
+        while True:
+            request_line, *header_lines = head.decode().split("\r\n")[:-2]
+            method, target, _ = request_line.split(" ")
+            headers = [tuple(line.split(": ", 1)) for line in header_lines]
+            length = int(
+                dict((k.lower(), v) for k, v in headers).get("content-length", 0)
+            )
+            content = await reader.readexactly(length)
+
+            response = await self._respond(method, target, headers, content)
+            writer.write(
+                f"HTTP/1.1 {response.status_code} OK\r\n".encode()
+                + b"".join(
+                    f"{k}: {v}\r\n".encode()
+                    for k, v in response.headers.items()
+                    if k.lower() != "content-length"
+                )
+                + f"Content-Length: {len(response.content)}\r\n\r\n".encode()
+                + response.content
+            )
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+
+    async def _serve_http2(self, preface: bytes, reader, writer) -> None:
+        conn = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        # Key = Stream ID, Value = Request headers and body received so far
+        streams: dict[int, tuple[list, bytearray]] = {}
+        # Key = Stream ID, Value = Response body not yet sent, waiting for the flow control window
+        pending: dict[int, bytes] = {}
+
+        def send_data(stream_id: int) -> None:
+            data = pending.pop(stream_id)
+            size = min(len(data), conn.local_flow_control_window(stream_id))
+            while size > 0:
+                chunk = min(size, conn.max_outbound_frame_size)
+                conn.send_data(stream_id, data[:chunk])
+                data, size = data[chunk:], size - chunk
+            if data:
+                pending[stream_id] = data
+            else:
+                conn.end_stream(stream_id)
+            writer.write(conn.data_to_send())
+
+        async def respond(stream_id: int) -> None:
+            headers, content = streams.pop(stream_id)
+            headers = dict(headers)
+            response = await self._respond(
+                headers[":method"],
+                headers[":path"],
+                [(k, v) for k, v in headers.items() if not k.startswith(":")],
+                bytes(content),
+            )
+            conn.send_headers(
+                stream_id,
+                [(":status", str(response.status_code))]
+                + [
+                    (k, v)
+                    for k, v in response.headers.items()
+                    if k.lower() != "content-length"
+                ]
+                + [("content-length", str(len(response.content)))],
+            )
+            pending[stream_id] = response.content
+            send_data(stream_id)
+
+        data = preface
+        tasks = set()
+        while data:
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    streams[event.stream_id] = (event.headers, bytearray())
+                elif isinstance(event, h2.events.DataReceived):
+                    streams[event.stream_id][1].extend(event.data)
+                    conn.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id
+                    )
+                elif isinstance(event, h2.events.StreamEnded):
+                    task = asyncio.create_task(respond(event.stream_id))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif isinstance(event, h2.events.WindowUpdated):
+                    for stream_id in list(pending):
+                        send_data(stream_id)
+            writer.write(conn.data_to_send())
+            data = await reader.read(65535)
+
+    async def _respond(
+        self, method: str, target: str, headers: list, content: bytes
+    ) -> httpx.Response:
+        request = httpx.Request(
+            method,
+            self.fake_arlo.base_url.split("/api/")[0] + target,
+            headers=headers,
+            content=content,
+        )
+        response = await self.fake_arlo.async_handler(request)
+        response.read()
+        return response
+
+
+def write_attendee_file(path: Path, event_code: str, date: datetime) -> Path:
+    """Writes a Butter participant list of the even numbered attendees registered by FakeArlo.add_registrations"""
+    with path.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([f"Room name: Session {event_code}"])
+        writer.writerow(["Room ID: ABCXYZ"])
+        writer.writerow([f"Started at: {date.strftime('%b %d %Y')} - 06:30 PM"])
+        writer.writerow([f"Ended at: {date.strftime('%b %d %Y')} - 08:30 PM"])
+        writer.writerow([])
+        writer.writerow([])
+        writer.writerow(
+            [
+                "Name",
+                "Email",
+                "Type",
+                "Channel id",
+                "First join at",
+                "Duration in session (minutes)",
+            ]
+        )
+        for i in range(0, 50, 2):
+            writer.writerow(
+                [f"Attendee {i}", f"attendee{i}@example.com", "guest", "main", "", "60"]
+            )
+    return path
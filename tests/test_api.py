@@ -0,0 +1,185 @@
+import httpx
+import pytest
+import subprocess
+import sys
+from datetime import datetime
+
+from baa.api import AttendanceResult, update_attendance, update_attendee_files
+from baa.classes import AttendanceStatus, ButterAttendee, Meeting
+from baa.exceptions import ApiCommunicationFailure, SessionNotFound
+from baa.resilience import RetryPolicy
+from tests.fake_arlo import FakeArlo, write_attendee_file
+
+
+@pytest.fixture
+def meeting():
+    return Meeting(
+        "CK00000",
+        datetime(2024, 1, 1),
+        [
+            ButterAttendee(
+                name="Attendee 0", email="attendee0@example.com", session_duration=60
+            ),
+            ButterAttendee(
+                name="Attendee 1", email="attendee1@example.com", session_duration=10
+            ),
+            ButterAttendee(
+                name="Guest", email="guest@example.com", session_duration=60
+            ),
+        ],
+    )
+
+
+@pytest.mark.asyncio
+async def test_update_attendance_from_meeting(arlo_client, fake_arlo, meeting):
+    result = await update_attendance(arlo_client, meeting, min_duration=30)
+
+    assert result.attendee_file is None
+    assert result.event_code == "CK00000"
+    assert result.session_date == datetime(2024, 1, 1)
+    assert [reg.name for reg in result.matched] == ["Attendee 0", "Attendee 1"]
+    assert [atnd.name for atnd in result.unmatched_attendees] == ["Guest"]
+    # Attendee 1 matched, but did not attend for long enough
+    assert [atnd.name for atnd in result.unregistered_attendees] == [
+        "Attendee 1",
+        "Guest",
+    ]
+    assert len(result.updated) == 4
+    assert result.unchanged == [] and result.failed == []
+    assert [reg.attendance for reg in fake_arlo.registrations["100000"]] == [
+        "Attended",
+        "DidNotAttend",
+        "DidNotAttend",
+        "DidNotAttend",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_update_attendance_unchanged(arlo_client, fake_arlo, meeting):
+    for reg in fake_arlo.registrations["100000"]:
+        reg.attendance = "DidNotAttend"
+
+    result = await update_attendance(arlo_client, meeting, dry_run=True)
+
+    assert [reg.target_attendance for reg in result.updated] == [
+        AttendanceStatus.ATTENDED,
+        AttendanceStatus.ATTENDED,
+    ]
+    assert len(result.unchanged) == 2
+    # Nothing is updated in a dry run
+    assert fake_arlo.registrations["100000"][0].attendance == "DidNotAttend"
+
+
+@pytest.mark.asyncio
+async def test_update_attendance_from_file(arlo_client, tmp_path):
+    attendee_file = write_attendee_file(
+        tmp_path / "report.csv", "CK00000", datetime(2024, 1, 1)
+    )
+
+    result = await update_attendance(arlo_client, attendee_file)
+
+    assert result.attendee_file == attendee_file
+    assert result.event_name and result.session_name
+    assert [reg.name for reg in result.matched] == ["Attendee 0", "Attendee 2"]
+    assert set(result.timings) == {"parse", "lookup", "registrations", "total"}
+    assert all(
+        0 <= elapsed <= result.timings["total"] for elapsed in result.timings.values()
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.catalogue(registrations=20, page_size=5, latency=0.005)
+async def test_update_attendance_pipelined(make_arlo_client, fake_arlo, meeting):
+    # Pages are read one at a time
+    arlo_client = make_arlo_client(fake_arlo, max_prefetch=1)
+
+    await update_attendance(arlo_client, meeting)
+    await arlo_client.close()
+
+    # Updates of the first page are sent before the last page is read
+    methods = [request.method for request in fake_arlo.requests]
+    last_read = len(methods) - methods[::-1].index("GET") - 1
+    assert methods.index("PATCH") < last_read
+
+
+@pytest.mark.asyncio
+@pytest.mark.catalogue(registrations=20, page_size=5)
+async def test_update_attendance_rerun_sends_no_updates(
+    arlo_client, fake_arlo, meeting
+):
+    writes = []
+    for _ in range(2):
+        num_requests = len(fake_arlo.requests)
+        await update_attendance(arlo_client, meeting)
+        writes.append(
+            sum(req.method == "PATCH" for req in fake_arlo.requests[num_requests:])
+        )
+
+    assert writes == [20, 0]
+
+
+@pytest.mark.asyncio
+async def test_update_attendance_session_dates(arlo_client, meeting):
+    with pytest.raises(SessionNotFound, match="the meeting"):
+        await update_attendance(
+            arlo_client, meeting, session_dates={datetime(2024, 1, 2).date()}
+        )
+
+
+@pytest.mark.asyncio
+async def test_update_attendee_files_connection_failure(arlo_client, tmp_path):
+    fake_arlo = FakeArlo.with_catalogue(2)
+    for event in fake_arlo.events:
+        fake_arlo.add_registrations(f"{event.event_id}00", 4)
+    arlo_client.retry_policy = RetryPolicy(base_delay=0)
+    fake_handler = fake_arlo.async_transport().handler
+
+    async def handler(request):
+        if "/eventsessions/100100/" in request.url.path:
+            raise httpx.ConnectError("Connection refused")
+        return await fake_handler(request)
+
+    arlo_client.async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    attendee_files = [
+        write_attendee_file(tmp_path / f"{code}.csv", code, datetime(2024, 1, 1))
+        for code in ("CK00000", "CK00001")
+    ]
+
+    results = await update_attendee_files(
+        arlo_client, attendee_files, None, [], 0, False, False
+    )
+
+    # The file that could not reach Arlo does not stop the other
+    assert results[0].error is None and len(results[0].updated) == 4
+    assert isinstance(results[1].error, ApiCommunicationFailure)
+    assert isinstance(results[1].error.__cause__, httpx.ConnectError)
+
+
+def test_result_to_dict(meeting):
+    result = AttendanceResult(
+        event_code="CK00000",
+        unmatched_attendees=meeting.attendees[2:],
+        timings={"total": 1.5},
+    )
+
+    result_dict = result.to_dict()
+
+    assert result_dict["attendee_file"] is None
+    assert result_dict["summary"]["unmatched_attendees"] == 1
+    assert result_dict["unmatched_attendees"] == [
+        {"name": "Guest", "email": "guest@example.com"}
+    ]
+    assert result_dict["timings"] == {"total": 1.5}
+
+
+def test_import_without_renderers():
+    # Services using the library API don't load the tables used by the CLI
+    modules = subprocess.run(
+        [sys.executable, "-c", "import sys, baa.api; print(' '.join(sys.modules))"],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.split()
+
+    assert "baa.api" in modules
+    assert "prettytable" not in modules and "baa.main" not in modules
@@ -1,21 +1,27 @@
+import asyncio
 import pytest
+import httpx
 from httpx import Response
 from lxml import etree
-from datetime import datetime
+from datetime import datetime, timedelta
 from baa.arlo_api import ArloClient
+from baa.cache import MetadataCache
+from baa.resilience import RetryPolicy
 from baa.exceptions import (
     AuthenticationFailed,
     ApiCommunicationFailure,
+    CredentialsNotFound,
     EventNotFound,
     SessionNotFound,
 )
-from baa.classes import AttendanceStatus
+from baa.classes import AttendanceStatus, ArloEvent, ArloSession
+from tests.fake_arlo import FakeArlo
 
 
 @pytest.fixture
 def arlo_client(mocker):
-    mocker.patch("baa.arlo_api.get_keyring_credentials", return_value=("user", "pass"))
-    return ArloClient("test-platform")
+    mocker.patch("baa.helpers.get_keyring_credentials", return_value=("user", "pass"))
+    return ArloClient("test-platform", retry_policy=RetryPolicy(base_delay=0))
 
 
 def mock_response(status_code=200, content=""):
@@ -23,6 +29,11 @@ def mock_response(status_code=200, content=""):
     return response
 
 
+async def async_pages(*pages):
+    for page in pages:
+        yield page
+
+
 def api_example_events(event_code="CK24ABC"):
     return f"""
         <Events>
@@ -57,6 +68,7 @@ def api_example_event_session_registrations(registrations):
         event_session_regs_xml += f"""
         <Link title="EventSessionRegistration" href="reg-href">
             <EventSessionRegistration>
+                <Attendance>{reg[4] if len(reg) > 4 else "Unknown"}</Attendance>
                 <Link title="ParentRegistration">
                     <Registration>
                         <Status>{reg[3]}</Status>
@@ -87,102 +99,301 @@ def api_example_event_session_registrations(registrations):
         (500, ApiCommunicationFailure),
     ],
 )
-def test_api_exceptions(mocker, arlo_client, status_code, exception):
-    mock_remove_creds = mocker.patch("baa.arlo_api.remove_keyring_credentials")
+@pytest.mark.asyncio
+async def test_api_exceptions(mocker, arlo_client, status_code, exception):
+    mock_invalidate = mocker.patch.object(arlo_client.credential_provider, "invalidate")
     mocker.patch.object(
-        arlo_client.client, "get", return_value=mock_response(status_code)
+        arlo_client.async_client, "get", return_value=mock_response(status_code)
     )
 
     with pytest.raises(exception):
-        arlo_client._get_response("http://test.url")
+        await arlo_client._aget_response("http://test.url")
 
     if exception is AuthenticationFailed:
-        mock_remove_creds.assert_called_once()
+        mock_invalidate.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_response_retries_transient_failures(mocker, arlo_client):
+    mock_get = mocker.patch.object(
+        arlo_client.async_client,
+        "get",
+        side_effect=[mock_response(503), mock_response(200, api_example_events())],
+    )
+
+    res = await arlo_client._aget_response("http://test.url")
+
+    assert res.status_code == 200
+    assert mock_get.call_count == 2
+    assert arlo_client.retry_policy.retries == {"GET": 1}
+
+
+@pytest.fixture
+def cached_arlo_client(mocker, arlo_client, tmp_path):
+    arlo_client.cache = MetadataCache(
+        "test-platform", ttl=timedelta(hours=1), path=tmp_path / "metadata.sqlite3"
+    )
+    yield arlo_client
+    arlo_client.cache.close()
+
+
+@pytest.mark.asyncio
+async def test_response_cache_hit(mocker, cached_arlo_client):
+    mock_get = mocker.patch.object(
+        cached_arlo_client.async_client,
+        "get",
+        return_value=Response(200, content=b"<Events/>", headers={"ETag": '"v1"'}),
+    )
+
+    await cached_arlo_client._aget_response(
+        "http://test.url", params={"expand": "Event"}
+    )
+    res = await cached_arlo_client._aget_response(
+        "http://test.url", params={"expand": "Event"}
+    )
+    assert res.content == b"<Events/>"
+    mock_get.assert_called_once()
+    assert cached_arlo_client.response_cache_stats == {"miss": 1, "hit": 1}
+
+
+@pytest.mark.asyncio
+async def test_response_cache_revalidated(mocker, cached_arlo_client):
+    mock_get = mocker.patch.object(
+        cached_arlo_client.async_client,
+        "get",
+        side_effect=[
+            Response(
+                200,
+                content=b"<Events/>",
+                headers={
+                    "ETag": '"v1"',
+                    "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+                },
+            ),
+            Response(304),
+        ],
+    )
 
+    await cached_arlo_client._aget_response("http://test.url")
+    res = await cached_arlo_client._aget_response("http://test.url", revalidate=True)
+    assert res.content == b"<Events/>"
+    assert mock_get.call_args.kwargs["headers"] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert cached_arlo_client.response_cache_stats == {"miss": 1, "revalidated": 1}
 
-def test_get_event_tree(mocker, arlo_client):
+
+@pytest.mark.asyncio
+async def test_get_event(mocker, arlo_client):
     event_code = "CK24ABC"
-    mocker.patch.object(
-        arlo_client.client,
+    mock_get = mocker.patch.object(
+        arlo_client.async_client,
+        "get",
+        return_value=mock_response(200, api_example_events(event_code)),
+    )
+
+    event = await arlo_client._aget_event(event_code)
+    assert event == ArloEvent(event_id="1234", code=event_code, name="Test Event")
+    mock_get.assert_called_once()
+    assert mock_get.call_args.kwargs["params"]["filter"] == f"Code eq '{event_code}'"
+    # Second call should hit the index
+    assert await arlo_client._aget_event(event_code) is event
+    mock_get.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "filtered_response",
+    [mock_response(400), mock_response(200, "<Events></Events>")],
+)
+@pytest.mark.asyncio
+async def test_get_event_fallback(mocker, arlo_client, filtered_response):
+    event_code = "CK24ABC"
+    mock_get = mocker.patch.object(
+        arlo_client.async_client,
+        "get",
+        side_effect=[filtered_response, mock_response(200, api_example_events())],
+    )
+
+    event = await arlo_client._aget_event(event_code)
+    assert event.event_id == "1234"
+    assert mock_get.call_count == 2
+    assert "filter" not in mock_get.call_args.kwargs["params"]
+    assert arlo_client.event_catalogue_indexed
+
+
+@pytest.mark.asyncio
+async def test_get_event_server_error_not_fallback(mocker, arlo_client):
+    mock_get = mocker.patch.object(
+        arlo_client.async_client, "get", return_value=mock_response(503)
+    )
+
+    with pytest.raises(ApiCommunicationFailure) as exc_info:
+        await arlo_client._aget_event("CK24ABC")
+
+    # Only a rejected filter falls back to scanning the catalogue, not a failing server
+    assert exc_info.value.status == 503
+    assert all("filter" in call.kwargs["params"] for call in mock_get.call_args_list)
+    assert not arlo_client.event_catalogue_indexed
+
+
+@pytest.mark.asyncio
+async def test_full_event_catalogue_indexed_once(mocker, arlo_client):
+    mock_get = mocker.patch.object(
+        arlo_client.async_client,
+        "get",
+        side_effect=[
+            mock_response(400),
+            mock_response(200, api_example_events("CK24ABC")),
+            mock_response(400),
+        ],
+    )
+
+    assert await arlo_client._aget_event("CK24ABC") is not None
+    # Unknown code after the catalogue was indexed should not download it again
+    assert await arlo_client._aget_event("CK00XYZ") is None
+    assert mock_get.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_get_sessions_filtered(mocker, arlo_client):
+    event_id = "1234"
+    mock_get = mocker.patch.object(
+        arlo_client.async_client,
         "get",
-        return_value=mock_response(200, api_example_events()),
+        return_value=mock_response(200, api_example_event_sessions("2024-01-01")),
     )
 
-    tree = arlo_client._get_event_tree(event_code)
-    assert tree is not None
-    # Second call should hit the cache
-    tree2 = arlo_client._get_event_tree(event_code)
-    assert tree2 is tree
+    sessions = await arlo_client._aget_sessions(event_id, datetime(2024, 1, 1))
+    assert sessions == [
+        ArloSession(
+            session_id="5678",
+            event_id=event_id,
+            name="Test Session",
+            start=datetime(2024, 1, 1, 18, 30),
+        )
+    ]
+    mock_get.assert_called_once()
+    assert mock_get.call_args.kwargs["params"]["filter"] == (
+        "StartDateTime ge datetime('2023-12-31T00:00:00Z') and StartDateTime lt datetime('2024-01-03T00:00:00Z')"
+    )
+    # Second call should hit the index
+    assert await arlo_client._aget_sessions(event_id, datetime(2024, 1, 1)) == sessions
+    mock_get.assert_called_once()
 
 
-def test_get_session_tree(mocker, arlo_client):
+@pytest.mark.parametrize(
+    "filtered_response",
+    [mock_response(400), mock_response(200, "<EventSessions></EventSessions>")],
+)
+@pytest.mark.asyncio
+async def test_get_sessions_fallback(mocker, arlo_client, filtered_response):
     event_id = "1234"
-    mocker.patch.object(
-        arlo_client.client,
+    mock_get = mocker.patch.object(
+        arlo_client.async_client,
         "get",
-        return_value=mock_response(200, api_example_event_sessions()),
+        side_effect=[
+            filtered_response,
+            mock_response(200, api_example_event_sessions("2024-01-01")),
+        ],
     )
 
-    tree = arlo_client._get_session_tree(event_id)
-    assert tree is not None
-    # Second call should hit the cache
-    tree2 = arlo_client._get_session_tree(event_id)
-    assert tree2 is tree
+    sessions = await arlo_client._aget_sessions(event_id, datetime(2024, 1, 1))
+    assert sessions[0].session_id == "5678"
+    assert mock_get.call_count == 2
+    assert "filter" not in mock_get.call_args.kwargs["params"]
+    # Full listing is indexed, so other dates should not be requested again
+    assert await arlo_client._aget_sessions(event_id, datetime(2024, 2, 2)) == []
+    assert mock_get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_sessions_from_cache(mocker, arlo_client):
+    cached_session = ArloSession(
+        session_id="5678",
+        event_id="1234",
+        name="Test Session",
+        start=datetime(2024, 1, 1, 18, 30),
+    )
+    arlo_client.cache = mocker.Mock()
+    arlo_client.cache.get_sessions.return_value = [cached_session]
+    mock_get = mocker.patch.object(arlo_client.async_client, "get")
+
+    assert await arlo_client._aget_sessions("1234", datetime(2024, 1, 1)) == [
+        cached_session
+    ]
+    mock_get.assert_not_called()
+
 
+@pytest.mark.asyncio
+async def test_get_event_from_cache(mocker, arlo_client):
+    cached_event = ArloEvent(event_id="1234", code="CK24ABC", name="Test Event")
+    arlo_client.cache = mocker.Mock()
+    arlo_client.cache.get_event.return_value = cached_event
+    mock_get = mocker.patch.object(arlo_client.async_client, "get")
+
+    assert await arlo_client._aget_event("CK24ABC") == cached_event
+    mock_get.assert_not_called()
 
-def test_get_event_id(mocker, arlo_client):
+
+@pytest.mark.asyncio
+async def test_get_event_id(mocker, arlo_client):
     event_code = "CK24ABC"
     mocker.patch.object(
-        arlo_client,
-        "_get_event_tree",
-        return_value=etree.fromstring(api_example_events(event_code)),
+        arlo_client.async_client,
+        "get",
+        return_value=mock_response(200, api_example_events(event_code)),
     )
-    event_id = arlo_client._get_event_id(event_code)
+    event_id = await arlo_client._aget_event_id(event_code)
     assert event_id == "1234"
 
 
-def test_no_evevnt_id(mocker, arlo_client):
+@pytest.mark.asyncio
+async def test_no_evevnt_id(mocker, arlo_client):
     event_code = "CK24ABC"
 
     with pytest.raises(EventNotFound):
         mocker.patch.object(
-            arlo_client,
-            "_get_event_tree",
-            return_value=etree.fromstring(api_example_events("CK00XYZ")),
+            arlo_client.async_client,
+            "get",
+            return_value=mock_response(200, api_example_events("CK00XYZ")),
         )
-        arlo_client._get_event_id(event_code)
+        await arlo_client._aget_event_id(event_code)
 
 
-def test_get_session_id(mocker, arlo_client):
+@pytest.mark.asyncio
+async def test_get_session_id(mocker, arlo_client):
     event_id = "1234"
     start_date = datetime(2024, 1, 1)
     mocker.patch.object(
-        arlo_client,
-        "_get_session_tree",
-        return_value=etree.fromstring(api_example_event_sessions("2024-01-01")),
+        arlo_client.async_client,
+        "get",
+        return_value=mock_response(200, api_example_event_sessions("2024-01-01")),
     )
 
-    session_id = arlo_client._get_session_id(event_id, start_date)
+    session_id = await arlo_client._aget_session_id(event_id, start_date)
     assert session_id == "5678"
 
 
-def test_no_session_id(mocker, arlo_client):
+@pytest.mark.asyncio
+async def test_no_session_id(mocker, arlo_client):
     event_id = "1234"
     start_date = datetime(2024, 1, 1)
 
     with pytest.raises(SessionNotFound):
         mocker.patch.object(
-            arlo_client,
-            "_get_session_tree",
-            return_value=etree.fromstring(api_example_event_sessions("2024-02-02")),
+            arlo_client.async_client,
+            "get",
+            return_value=mock_response(200, api_example_event_sessions("2024-02-02")),
         )
-        arlo_client._get_session_id(event_id, start_date)
+        await arlo_client._aget_session_id(event_id, start_date)
 
 
-def test_get_registrations_tree(mocker, arlo_client):
+@pytest.mark.asyncio
+async def test_get_session_registration_pages(mocker, arlo_client):
     session_id = "5678"
     mocker.patch.object(
-        arlo_client.client,
+        arlo_client.async_client,
         "get",
         return_value=mock_response(
             200,
@@ -192,34 +403,81 @@ def test_get_registrations_tree(mocker, arlo_client):
         ),
     )
 
-    tree = arlo_client._get_registrations_tree(session_id)
-    assert tree is not None
+    pages = [
+        page async for page in await arlo_client._aget_registration_pages(session_id)
+    ]
+    assert len(pages) == 1
+    assert pages[0].findtext(".//Email") == "ada@example.com"
 
 
-def test_get_registrations(mocker, arlo_client):
+@pytest.mark.asyncio
+async def test_get_registrations(mocker, arlo_client):
     event_code = "CK24ABC"
     session_date = datetime(2024, 1, 1)
-    mocker.patch.object(arlo_client, "_get_event_id", return_value="1234")
-    mocker.patch.object(arlo_client, "_get_session_id", return_value="4567")
+    mocker.patch.object(arlo_client, "_aget_event_id", return_value="1234")
+    mocker.patch.object(arlo_client, "_aget_session_id", return_value="4567")
     mocker.patch.object(
         arlo_client,
-        "_get_registrations_tree",
-        return_value=etree.fromstring(
-            api_example_event_session_registrations(
-                [
-                    ("Ada", "Lovelace", "ada@example.com", "Approved"),
-                    ("Dorothy", "Hodgkin", "dorothy@example.com", "Cancelled"),
-                ]
-            )
+        "_aget_registration_pages",
+        return_value=async_pages(
+            etree.fromstring(
+                api_example_event_session_registrations(
+                    [("Ada", "Lovelace", "ada@example.com", "Approved", "Attended")]
+                )
+            ),
+            etree.fromstring(
+                api_example_event_session_registrations(
+                    [("Dorothy", "Hodgkin", "dorothy@example.com", "Cancelled")]
+                )
+            ),
         ),
     )
 
-    registrations = list(arlo_client.get_registrations(event_code, session_date))
+    registrations = [
+        reg async for reg in arlo_client.aget_registrations(event_code, session_date)
+    ]
     # Cancelled registration should not be returned
     assert len(registrations) == 1
     assert registrations[0].name == "Ada Lovelace"
     assert registrations[0].email == "ada@example.com"
     assert registrations[0].reg_href == "reg-href"
+    assert registrations[0].current_attendance == AttendanceStatus.ATTENDED
+
+
+@pytest.mark.asyncio
+async def test_get_registration_pages(mocker, arlo_client):
+    mocker.patch.object(arlo_client, "_aget_event_id", return_value="1234")
+    mocker.patch.object(arlo_client, "_aget_session_id", return_value="4567")
+    mocker.patch.object(
+        arlo_client,
+        "_aget_registration_pages",
+        return_value=async_pages(
+            etree.fromstring(
+                api_example_event_session_registrations(
+                    [
+                        ("Ada", "Lovelace", "ada@example.com", "Approved"),
+                        ("Mary", "Shelley", "mary@example.com", "Approved"),
+                    ]
+                )
+            ),
+            etree.fromstring(
+                api_example_event_session_registrations(
+                    [("Dorothy", "Hodgkin", "dorothy@example.com", "Cancelled")]
+                )
+            ),
+        ),
+    )
+
+    pages = [
+        page
+        async for page in arlo_client.aget_registration_pages(
+            "CK24ABC", datetime(2024, 1, 1)
+        )
+    ]
+    assert [[reg.name for reg in page] for page in pages] == [
+        ["Ada Lovelace", "Mary Shelley"],
+        [],
+    ]
 
 
 @pytest.mark.asyncio
@@ -243,7 +501,29 @@ async def test_update_attendance(mocker, arlo_client):
     assert not update_sucess
 
 
-def test_append_paginated(mocker, arlo_client):
+@pytest.mark.asyncio
+async def test_update_attendance_retries_transient_failures(mocker, arlo_client):
+    mock_patch = mocker.patch.object(
+        arlo_client.async_client,
+        "patch",
+        side_effect=[mock_response(429), mock_response(200)],
+    )
+
+    assert await arlo_client.update_attendance(
+        "http://test.url/registration", AttendanceStatus.ATTENDED
+    )
+    assert mock_patch.call_count == 2
+    assert arlo_client.retry_policy.retries == {"PATCH": 1}
+
+
+@pytest.mark.asyncio
+async def test_get_pages(mocker, arlo_client):
+    first_page_content = """
+        <Root>
+            <Item>First Item</Item>
+            <Link rel="next" href="http://test.url/next"/>
+        </Root>
+    """
     second_page_content = """
         <Root>
             <Item>Second Item</Item>
@@ -255,52 +535,355 @@ def test_append_paginated(mocker, arlo_client):
             <Item>Final Item</Item>
         </Root>
     """
-    mocker.patch.object(
-        arlo_client.client,
+    mock_get = mocker.patch.object(
+        arlo_client.async_client,
         "get",
         side_effect=[
+            mock_response(200, first_page_content),
             mock_response(200, second_page_content),
             mock_response(200, final_page_content),
         ],
     )
 
-    result = arlo_client._append_paginated(
-        etree.fromstring(
-            """
-        <Root>
-            <Item>First Item</Item>
-            <Link rel="next" href="http://test.url/next"/>
-        </Root>
-    """
-        )
+    pages = await arlo_client._aget_pages("http://test.url")
+    # Only the first page is requested until the pages are consumed
+    mock_get.assert_called_once()
+
+    assert [page.findtext("./Item") async for page in pages] == [
+        "First Item",
+        "Second Item",
+        "Final Item",
+    ]
+    assert mock_get.call_count == 3
+
+
+@pytest.mark.parametrize(
+    "total_count, expected_skips",
+    [(None, ["100", "200", "300", "400"]), ("250", ["100", "200"])],
+)
+def test_next_page_urls(arlo_client, total_count, expected_skips):
+    urls = arlo_client._next_page_urls(
+        "http://test.url/events?expand=Event&skip=100&top=100",
+        int(total_count) if total_count else None,
+    )
+
+    assert [httpx.URL(url).params["skip"] for url in urls] == expected_skips
+    assert all(httpx.URL(url).params["expand"] == "Event" for url in urls)
+
+
+def test_next_page_urls_without_offsets(arlo_client):
+    assert arlo_client._next_page_urls("http://test.url/next", None) == [
+        "http://test.url/next"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_pages_prefetch(mocker, arlo_client):
+    pages = {
+        "0": """
+            <Root>
+                <Item>First Item</Item>
+                <Link rel="next" href="http://test.url/items?skip=100&amp;top=100"/>
+            </Root>
+        """,
+        "100": """
+            <Root>
+                <Item>Second Item</Item>
+                <Link rel="next" href="http://test.url/items?skip=200&amp;top=100"/>
+            </Root>
+        """,
+        "200": "<Root><Item>Final Item</Item></Root>",
+        "300": "<Root></Root>",
+        "400": "<Root></Root>",
+    }
+    mock_get = mocker.patch.object(
+        arlo_client.async_client,
+        "get",
+        side_effect=lambda url, params=None, **kwargs: mock_response(
+            200, pages[httpx.URL(url).copy_merge_params(params or {}).params["skip"]]
+        ),
     )
-    assert len(result.findall(".//Item")) == 3
-    assert result.findtext(".//Item[1]") == "First Item"
-    assert result.findtext(".//Item[2]") == "Second Item"
-    assert result.findtext(".//Item[3]") == "Final Item"
 
+    result = await arlo_client._aget_pages("http://test.url/items", params={"skip": 0})
+    assert [page.findtext("./Item") async for page in result] == [
+        "First Item",
+        "Second Item",
+        "Final Item",
+    ]
+    assert mock_get.call_count <= arlo_client.max_prefetch + 1
 
-def test_get_event_name(mocker, arlo_client):
+
+@pytest.mark.asyncio
+async def test_get_event_name(mocker, arlo_client):
     event_code = "CK24ABC"
     mocker.patch.object(
-        arlo_client,
-        "_get_event_tree",
-        return_value=etree.fromstring(api_example_events(event_code)),
+        arlo_client.async_client,
+        "get",
+        return_value=mock_response(200, api_example_events(event_code)),
     )
 
-    event_name = arlo_client.get_event_name(event_code)
+    event_name = await arlo_client.aget_event_name(event_code)
     assert event_name == "Test Event"
 
 
-def test_get_session_name(arlo_client, mocker):
+@pytest.mark.asyncio
+async def test_get_session_name(arlo_client, mocker):
     event_code = "CK24ABC"
     start_date = datetime(2024, 1, 1)
-    mocker.patch.object(arlo_client, "_get_event_id", return_value="1234")
+    mocker.patch.object(arlo_client, "_aget_event_id", return_value="1234")
     mocker.patch.object(
-        arlo_client,
-        "_get_session_tree",
-        return_value=etree.fromstring(api_example_event_sessions("2024-01-01")),
+        arlo_client.async_client,
+        "get",
+        return_value=mock_response(200, api_example_event_sessions("2024-01-01")),
     )
 
-    name = arlo_client.get_session_name(event_code, start_date)
+    name = await arlo_client.aget_session_name(event_code, start_date)
     assert name == "Test Session"
+
+
+@pytest.mark.asyncio
+async def test_get_event_name_not_found(mocker, arlo_client):
+    mocker.patch.object(
+        arlo_client.async_client,
+        "get",
+        return_value=mock_response(200, api_example_events("CK00XYZ")),
+    )
+
+    assert await arlo_client.aget_event_name("CK24ABC") == "Not found"
+
+
+def fake_async_client(arlo_client, fake_arlo):
+    arlo_client.async_client = httpx.AsyncClient(transport=fake_arlo.async_transport())
+    return arlo_client
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("supports_filter", [True, False])
+async def test_aget_names(arlo_client, supports_filter):
+    fake_arlo = FakeArlo.with_catalogue(3, supports_filter=supports_filter)
+    fake_async_client(arlo_client, fake_arlo)
+
+    assert await arlo_client.aget_event_name("CK00001") == "Event 1"
+    assert (
+        await arlo_client.aget_session_name("CK00001", datetime(2024, 1, 8))
+        == "Event 1 Session 1"
+    )
+    assert await arlo_client.aget_event_name("CK00XYZ") == "Not found"
+    with pytest.raises(SessionNotFound):
+        await arlo_client._aget_session_id("1001", datetime(2023, 1, 1))
+
+
+@pytest.mark.asyncio
+async def test_aget_registration_pages(arlo_client):
+    fake_arlo = FakeArlo.with_catalogue(1, page_size=2)
+    fake_arlo.add_registrations("100000", 5)
+    fake_arlo.registrations["100000"][1].status = "Cancelled"
+    fake_arlo.registrations["100000"][2].attendance = "Attended"
+    fake_async_client(arlo_client, fake_arlo)
+
+    pages = [
+        page
+        async for page in arlo_client.aget_registration_pages(
+            "CK00000", datetime(2024, 1, 1)
+        )
+    ]
+    assert [[reg.name for reg in page] for page in pages] == [
+        ["Attendee 0"],
+        ["Attendee 2", "Attendee 3"],
+        ["Attendee 4"],
+    ]
+    assert pages[1][0].current_attendance == AttendanceStatus.ATTENDED
+
+
+@pytest.mark.asyncio
+async def test_aget_registration_pages_look_ahead(arlo_client):
+    fake_arlo = FakeArlo.with_catalogue(1, page_size=1, exposes_total_count=True)
+    fake_arlo.add_registrations("100000", 20)
+    fake_async_client(arlo_client, fake_arlo)
+    limit = arlo_client.read_limiter.limit
+
+    pages = arlo_client.aget_registration_pages("CK00000", datetime(2024, 1, 1))
+    await anext(pages)
+    await anext(pages)
+    await asyncio.sleep(0)
+    await pages.aclose()
+
+    # Every page is known from the total count, but only the look-ahead window is fetched
+    registration_requests = [
+        r for r in fake_arlo.requests if r.url.path.endswith("/registrations")
+    ]
+    assert len(registration_requests) <= 2 + limit < 20
+
+
+@pytest.mark.asyncio
+async def test_aget_registration_pages_event_not_found(arlo_client):
+    fake_async_client(arlo_client, FakeArlo.with_catalogue(1))
+
+    with pytest.raises(EventNotFound):
+        async for _ in arlo_client.aget_registration_pages(
+            "CK00XYZ", datetime(2024, 1, 1)
+        ):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_shared(arlo_client):
+    fake_arlo = FakeArlo.with_catalogue(1, latency=0.01)
+    fake_arlo.add_registrations("100000", 3)
+    fake_async_client(arlo_client, fake_arlo)
+    event_code, date = "CK00000", datetime(2024, 1, 1)
+
+    async def registrations():
+        return [reg async for reg in arlo_client.aget_registrations(event_code, date)]
+
+    event_name, session_name, regs = await asyncio.gather(
+        arlo_client.aget_event_name(event_code),
+        arlo_client.aget_session_name(event_code, date),
+        registrations(),
+    )
+
+    assert (event_name, session_name) == ("Event 0", "Event 0 Session 0")
+    assert len(regs) == 3
+    # The event and its sessions are only requested once, for all three lookups
+    paths = [request.url.path for request in fake_arlo.requests]
+    assert len(paths) == 3
+    assert not arlo_client.pending_lookups
+
+
+@pytest.mark.asyncio
+async def test_credentials_read_on_first_request(mocker):
+    mock_credentials = mocker.patch(
+        "baa.helpers.get_keyring_credentials", return_value=("user", "pass")
+    )
+    arlo_client = ArloClient("test-platform")
+    fake_arlo = FakeArlo.with_catalogue(1)
+    arlo_client.async_client = httpx.AsyncClient(
+        auth=arlo_client.auth, transport=fake_arlo.async_transport()
+    )
+    mock_credentials.assert_not_called()
+
+    await arlo_client.aget_event_name("CK00000")
+    await arlo_client.aget_event_name("CK00001")
+
+    mock_credentials.assert_called_once()
+    assert fake_arlo.requests[0].headers["Authorization"].startswith("Basic ")
+
+
+@pytest.mark.asyncio
+async def test_preconnect(mocker, arlo_client):
+    fake_arlo = FakeArlo()
+    arlo_client.async_client = httpx.AsyncClient(
+        auth=arlo_client.auth, transport=fake_arlo.async_transport()
+    )
+
+    await arlo_client.preconnect()
+
+    assert arlo_client.credential_provider.credentials == ("user", "pass")
+    assert fake_arlo.requests[0].method == "HEAD"
+    # Credentials are not sent with the request opening the connection
+    assert "Authorization" not in fake_arlo.requests[0].headers
+
+
+@pytest.mark.asyncio
+async def test_preconnect_failure_ignored(mocker, arlo_client):
+    mocker.patch(
+        "baa.helpers.get_keyring_credentials", side_effect=CredentialsNotFound()
+    )
+    arlo_client.async_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(mocker.Mock(side_effect=httpx.ConnectError("")))
+    )
+
+    await arlo_client.preconnect()
+
+    assert arlo_client.credential_provider.credentials is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("supports_filter", [True, False])
+async def test_aget_sessions_on_dates(arlo_client, supports_filter):
+    fake_arlo = FakeArlo.with_catalogue(
+        1, sessions_per_event=5, supports_filter=supports_filter
+    )
+    fake_async_client(arlo_client, fake_arlo)
+    dates = [datetime(2024, 1, 8), datetime(2024, 1, 22), datetime(2024, 1, 23)]
+
+    sessions, *session_names = await asyncio.gather(
+        arlo_client.aget_sessions_on_dates("CK00000", dates),
+        # Lookups of a date while the dates are being listed wait for the listing
+        arlo_client.aget_session_name("CK00000", dates[0]),
+        arlo_client.aget_session_name("CK00000", dates[1]),
+    )
+
+    assert {d: [s.session_id for s in ss] for d, ss in sessions.items()} == {
+        dates[0].date(): ["100001"],
+        dates[1].date(): ["100003"],
+        dates[2].date(): [],
+    }
+    assert session_names == ["Event 0 Session 1", "Event 0 Session 3"]
+    session_requests = [
+        r for r in fake_arlo.requests if r.url.path.endswith("/sessions")
+    ]
+    assert len(session_requests) == (1 if supports_filter else 2)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("supports_filter", [True, False])
+async def test_filtered_lookup_request_count(arlo_client, supports_filter):
+    fake_arlo = FakeArlo.with_catalogue(
+        100, page_size=10, supports_filter=supports_filter
+    )
+    fake_async_client(arlo_client, fake_arlo)
+
+    event_id = await arlo_client._aget_event_id("CK00075")
+    assert await arlo_client._aget_session_id(event_id, datetime(2024, 1, 8)) == (
+        "107501"
+    )
+
+    # The filtered lookup requests the event and its sessions, instead of the whole catalogue
+    if supports_filter:
+        assert len(fake_arlo.requests) == 2
+    else:
+        assert len(fake_arlo.requests) > 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_prefetch", [1, 8])
+async def test_aget_pages_in_flight(mocker, max_prefetch):
+    mocker.patch("baa.helpers.get_keyring_credentials", return_value=("user", "pass"))
+    arlo_client = ArloClient("test-platform", max_prefetch=max_prefetch)
+    fake_arlo = FakeArlo.with_catalogue(
+        100,
+        sessions_per_event=0,
+        page_size=5,
+        latency=0.001,
+        exposes_total_count=True,
+    )
+    fake_async_client(arlo_client, fake_arlo)
+
+    pages = await arlo_client._aget_pages(
+        f"{arlo_client.base_url}/events", params={"expand": "Event"}
+    )
+    codes = [code async for page in pages for code in page.xpath(".//Code/text()")]
+
+    assert codes == [event.code for event in fake_arlo.events]
+    if max_prefetch == 1:
+        assert fake_arlo.max_in_flight == 1
+    else:
+        # Pages are fetched concurrently, within the adaptive read limit
+        assert 1 < fake_arlo.max_in_flight <= arlo_client.read_limiter.max_limit
+    await arlo_client.close()
+
+
+@pytest.mark.asyncio
+async def test_aget_event_name_connection_failure(mocker, arlo_client):
+    arlo_client.async_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(
+            mocker.Mock(side_effect=httpx.ConnectError("Connection refused"))
+        )
+    )
+
+    # Once retries are exhausted, connection errors are reported like other API failures
+    with pytest.raises(ApiCommunicationFailure) as exc_info:
+        await arlo_client.aget_event_name("CK00000")
+
+    assert isinstance(exc_info.value.__cause__, httpx.ConnectError)
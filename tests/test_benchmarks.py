@@ -0,0 +1,846 @@
+import asyncio
+import pytest
+import httpx
+import subprocess
+import sys
+from pathlib import Path
+from datetime import datetime
+from timeit import default_timer as timer
+
+from baa.arlo_api import ArloClient
+from baa.classes import ArloRegistration, AttendanceStatus, ButterAttendee, Meeting
+from baa.api import (
+    process_registrations,
+    update_attendance,
+    update_attendee_files,
+)
+from baa.matching import AttendeeIndex, FuzzyMatcher, _FuzzyKey
+from baa.resilience import AdaptiveLimiter, CircuitBreaker, RetryPolicy
+from baa.scheduler import WriteScheduler
+from baa.server import AttendanceServer
+from tests.fake_arlo import (
+    BASE_URL,
+    FakeArlo,
+    FakeArloServer,
+    FakeSession,
+    write_attendee_file,
+)
+
+pytestmark = pytest.mark.benchmark
+
+# Simulated round-trip latency for each request to the stand-in Arlo API
+LATENCY = 0.005
+
+
+async def resolve_session(
+    arlo_client: ArloClient, event_code: str, date: datetime
+) -> str:
+    event_id = await arlo_client._aget_event_id(event_code)
+    return await arlo_client._aget_session_id(event_id, date)
+
+
+@pytest.mark.asyncio
+async def test_benchmark_filtered_lookup(make_arlo_client):
+    event_code, date = "CK00750", datetime(2024, 1, 15)
+    timings = {}
+    request_counts = {}
+
+    for supports_filter in (False, True):
+        fake_arlo = FakeArlo.with_catalogue(
+            1000, page_size=100, latency=LATENCY, supports_filter=supports_filter
+        )
+        arlo_client = make_arlo_client(fake_arlo)
+
+        start = timer()
+        session_id = await resolve_session(arlo_client, event_code, date)
+        timings[supports_filter] = timer() - start
+        request_counts[supports_filter] = len(fake_arlo.requests)
+        assert session_id == "175002"
+
+    print(
+        f"\nFull catalogue scan: {timings[False]:.3f}s ({request_counts[False]} requests)"
+        f"\nFiltered lookup: {timings[True]:.3f}s ({request_counts[True]} requests)"
+    )
+    assert request_counts[True] == 2
+    assert timings[True] < timings[False]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("exposes_total_count", [False, True])
+async def test_benchmark_concurrent_prefetch(make_arlo_client, exposes_total_count):
+    timings = {}
+
+    for max_prefetch in (1, 8):
+        fake_arlo = FakeArlo.with_catalogue(
+            4000,
+            sessions_per_event=0,
+            page_size=100,
+            latency=LATENCY,
+            exposes_total_count=exposes_total_count,
+        )
+        arlo_client = make_arlo_client(fake_arlo, max_prefetch=max_prefetch)
+
+        start = timer()
+        pages = await arlo_client._aget_pages(
+            f"{arlo_client.base_url}/events", params={"expand": "Event"}
+        )
+        codes = [code async for page in pages for code in page.xpath(".//Code/text()")]
+        timings[max_prefetch] = timer() - start
+
+        assert codes == [event.code for event in fake_arlo.events]
+
+    print(
+        f"\nSequential walk of 40 pages: {timings[1]:.3f}s"
+        f"\nConcurrent prefetch of 40 pages: {timings[8]:.3f}s"
+    )
+    assert timings[8] < timings[1]
+
+
+PEAK_MEMORY_SCRIPT = """
+import resource
+import sys
+from copy import deepcopy
+from unittest import mock
+
+import httpx
+import asyncio
+from baa.arlo_api import ArloClient
+from baa.classes import ArloRegistration, ButterAttendee, Meeting
+from baa.api import (
+    process_registrations,
+    update_attendance,
+    update_attendee_files,
+)
+from baa.matching import AttendeeIndex
+from tests.fake_arlo import FakeArlo
+
+fake_arlo = FakeArlo.with_catalogue(20000, sessions_per_event=0, supports_filter=False)
+with mock.patch("baa.helpers.get_keyring_credentials", return_value=("user", "pass")):
+    arlo_client = ArloClient("test-platform")
+arlo_client.async_client = httpx.AsyncClient(transport=fake_arlo.async_transport())
+
+
+async def index_events():
+    pages = await arlo_client._aget_pages(
+        f"{arlo_client.base_url}/events", params={"expand": "Event"}
+    )
+    if sys.argv[1] == "tree":
+        # Previous behaviour, appending a copy of every element to the first page
+        root = None
+        async for page in pages:
+            if root is None:
+                root = page
+            else:
+                for elem in page:
+                    root.append(deepcopy(elem))
+        arlo_client._index_event_page(root)
+    else:
+        async for page in pages:
+            arlo_client._index_event_page(page)
+
+
+asyncio.run(index_events())
+assert len(arlo_client.event_index) == 20000
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="resource module is unavailable")
+def test_benchmark_streaming_pages_peak_memory():
+    peak_memory = {}
+    for mode in ("tree", "stream"):
+        result = subprocess.run(
+            [sys.executable, "-c", PEAK_MEMORY_SCRIPT, mode],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=Path(__file__).parent.parent,
+        )
+        peak_memory[mode] = int(result.stdout)
+
+    print(
+        f"\nPeak memory indexing 20000 events from one tree: {peak_memory['tree']} KiB"
+        f"\nPeak memory indexing 20000 events page by page: {peak_memory['stream']} KiB"
+    )
+    assert peak_memory["stream"] < peak_memory["tree"]
+
+
+# Dependencies only needed once the CLI runs baa, not to parse arguments or print --help
+HEAVY_MODULES = {"httpx", "h2", "lxml", "prettytable", "keyring"}
+
+
+def import_time(module: str) -> tuple[int, set[str]]:
+    """Get the cumulative import time of a module in microseconds, and the heavy modules it imports, in a fresh interpreter"""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys, {module}; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+        cwd=Path(__file__).parent.parent,
+    )
+    # Each line of stderr is "import time: self [us] | cumulative | imported package"
+    cumulative = next(
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.split("|")[-1].strip() == module
+    )
+    return cumulative, HEAVY_MODULES & set(result.stdout.split())
+
+
+def test_benchmark_cli_import_time():
+    cli_time, _ = import_time("baa.cli")
+    main_time, main_modules = import_time("baa.main")
+
+    print(
+        f"\nImporting baa.cli: {cli_time / 1000:.1f}ms"
+        f"\nImporting baa.main: {main_time / 1000:.1f}ms ({', '.join(sorted(main_modules))})"
+    )
+    assert cli_time < main_time
+
+
+async def read_then_write(arlo_client: ArloClient, meeting: Meeting) -> None:
+    # Previous behaviour, only sending updates once every page has been read
+    updates = []
+    async for reg in arlo_client.aget_registrations(
+        meeting.event_code, meeting.start_date
+    ):
+        updates.append(
+            arlo_client.update_attendance(reg.reg_href, AttendanceStatus.DID_NOT_ATTEND)
+        )
+    await asyncio.gather(*updates)
+
+
+async def pipelined(arlo_client: ArloClient, meeting: Meeting) -> None:
+    await process_registrations(
+        arlo_client, meeting, meeting.event_code, meeting.start_date, 0, False, False
+    )
+
+
+@pytest.mark.asyncio
+async def test_benchmark_pipelined_registrations(make_arlo_client):
+    timings = {}
+
+    for strategy in (read_then_write, pipelined):
+        fake_arlo = FakeArlo.with_catalogue(
+            1, page_size=50, latency=0.05, write_latency=0.01, capacity=10
+        )
+        fake_arlo.add_registrations("100000", 500)
+        arlo_client = make_arlo_client(fake_arlo, max_prefetch=1)
+        meeting = Meeting("CK00000", datetime(2024, 1, 1), attendees=[])
+
+        start = timer()
+        await strategy(arlo_client, meeting)
+        timings[strategy.__name__] = timer() - start
+
+        registrations = fake_arlo.registrations["100000"]
+        assert all(reg.attendance == "DidNotAttend" for reg in registrations)
+
+    print(
+        f"\nRead all pages, then update 500 registrations: {timings['read_then_write']:.3f}s"
+        f"\nUpdate each page while the next page is read: {timings['pipelined']:.3f}s"
+    )
+    assert timings["pipelined"] < timings["read_then_write"]
+
+
+def test_benchmark_indexed_matching():
+    attendees = [
+        ButterAttendee(
+            name=f"Attendee {i}", email=f"attendee{i}@example.com", session_duration=1
+        )
+        for i in range(1000)
+    ]
+    registrations = [
+        ArloRegistration(
+            name=f"Registration {i}", email=f"attendee{i}@example.com", reg_href=""
+        )
+        for i in range(0, 2000, 2)
+    ]
+
+    start = timer()
+    scanned = [
+        attendees[attendees.index(reg)] if reg in attendees else None
+        for reg in registrations
+    ]
+    scan_time = timer() - start
+
+    start = timer()
+    attendee_index = AttendeeIndex(attendees)
+    indexed = [attendee_index.match(reg) for reg in registrations]
+    index_time = timer() - start
+
+    print(
+        f"\nLinear scan of 1000 attendees for 1000 registrations: {scan_time:.3f}s"
+        f"\nIndexed match of 1000 attendees for 1000 registrations: {index_time:.3f}s"
+    )
+    assert indexed == scanned
+    assert index_time < scan_time
+
+
+def test_benchmark_fuzzy_matching():
+    first_names = ["Ada", "Mary", "Grace", "Edith", "Katherine", "Hedy", "Radia"]
+    attendees = [
+        ButterAttendee(
+            name=f"{first_names[i % 7]} Surname{i}",
+            email=f"attendee{i}@example.com",
+            session_duration=1,
+        )
+        for i in range(120)
+    ]
+    # Swapped names, with a typo in the email
+    registrations = [
+        ArloRegistration(
+            name=f"Surname{i} {first_names[i % 7]}",
+            email=f"atendee{i}@work.com",
+            reg_href="",
+        )
+        for i in range(120)
+    ]
+
+    start = timer()
+    # Comparing every registration with every attendee
+    attendee_keys = [_FuzzyKey.of(attendee) for attendee in attendees]
+    pairwise = []
+    for reg in registrations:
+        reg_key = _FuzzyKey.of(reg)
+        scores = [reg_key.score(attendee_key) for attendee_key in attendee_keys]
+        pairwise.append(scores.index(max(scores)))
+    pairwise_time = timer() - start
+
+    start = timer()
+    matches = FuzzyMatcher().match(registrations, attendees)
+    indexed_time = timer() - start
+
+    print(
+        f"\nPairwise fuzzy match of 120 attendees for 120 registrations: {pairwise_time:.3f}s"
+        f"\nIndexed fuzzy match of 120 attendees for 120 registrations: {indexed_time:.3f}s"
+    )
+    assert pairwise == list(range(120))
+    assert {id(match.registration): match.attendee for match in matches} == {
+        id(reg): attendees[i] for i, reg in enumerate(registrations)
+    }
+    assert indexed_time < pairwise_time
+
+
+def fixed_limiter(limit: int) -> AdaptiveLimiter:
+    return AdaptiveLimiter("Write", max_limit=limit, initial=limit, min_limit=limit)
+
+
+async def unbounded_writes(arlo_client: ArloClient, regs: list[ArloRegistration]):
+    # Previous behaviour, sending every update at once
+    arlo_client.write_limiter = fixed_limiter(len(regs))
+    await asyncio.gather(
+        *(
+            arlo_client.update_attendance(reg.reg_href, AttendanceStatus.DID_NOT_ATTEND)
+            for reg in regs
+        ),
+        return_exceptions=True,
+    )
+
+
+async def scheduled_writes(arlo_client: ArloClient, regs: list[ArloRegistration]):
+    async with WriteScheduler(arlo_client, max_concurrency=8) as scheduler:
+        for reg in regs:
+            scheduler.submit(reg)
+
+
+@pytest.mark.asyncio
+async def test_benchmark_bounded_write_concurrency(make_arlo_client):
+    throughput = {}
+
+    for strategy in (unbounded_writes, scheduled_writes):
+        fake_arlo = FakeArlo.with_catalogue(1, write_latency=0.01, throttle_limit=16)
+        fake_arlo.add_registrations("100000", 500)
+        # Without retries, so throttled updates are not hidden
+        arlo_client = make_arlo_client(
+            fake_arlo, retry_policy=RetryPolicy(max_attempts=1)
+        )
+        regs = [
+            ArloRegistration(name="", email="", reg_href=reg_href)
+            for reg_href in (
+                f"{BASE_URL}/registrations/{reg.reg_id}/sessionregistrations/{reg.reg_id}"
+                for reg in fake_arlo.registrations["100000"]
+            )
+        ]
+
+        start = timer()
+        await strategy(arlo_client, regs)
+        elapsed = timer() - start
+
+        updated = sum(
+            reg.attendance == "DidNotAttend"
+            for reg in fake_arlo.registrations["100000"]
+        )
+        throughput[strategy.__name__] = (updated, updated / elapsed)
+
+    print(
+        f"\nAll 500 updates at once: {throughput['unbounded_writes'][0]} succeeded, {throughput['unbounded_writes'][1]:.0f} updates/s"
+        f"\nAt most 8 updates in flight: {throughput['scheduled_writes'][0]} succeeded, {throughput['scheduled_writes'][1]:.0f} updates/s"
+    )
+    assert throughput["scheduled_writes"][0] == 500
+    assert throughput["unbounded_writes"][0] < 500
+
+
+@pytest.mark.asyncio
+async def test_benchmark_adaptive_write_concurrency(make_arlo_client):
+    results = {}
+
+    for strategy in ("fixed", "adaptive"):
+        # Arlo slows down and throttles requests above 6 in flight
+        fake_arlo = FakeArlo.with_catalogue(1, write_latency=0.01, throttle_limit=6)
+        fake_arlo.add_registrations("100000", 300)
+        arlo_client = make_arlo_client(
+            fake_arlo,
+            max_concurrency=32,
+            retry_policy=RetryPolicy(max_attempts=10, base_delay=0.01, max_delay=0.1),
+        )
+        if strategy == "fixed":
+            arlo_client.write_limiter = fixed_limiter(32)
+
+        start = timer()
+        async with WriteScheduler(arlo_client, max_concurrency=32) as scheduler:
+            for reg in fake_arlo.registrations["100000"]:
+                scheduler.submit(
+                    ArloRegistration(
+                        name="",
+                        email="",
+                        reg_href=f"{BASE_URL}/registrations/{reg.reg_id}/sessionregistrations/{reg.reg_id}",
+                    )
+                )
+        elapsed = timer() - start
+
+        succeeded = sum(result.success for result in scheduler.results)
+        results[strategy] = (fake_arlo.throttled, elapsed, succeeded)
+
+    print(
+        f"\nFixed limit of 32 updates in flight: {results['fixed'][2]} succeeded, {results['fixed'][0]} throttled, {results['fixed'][1]:.3f}s"
+        f"\nAdaptive limit of up to 32 updates in flight: {results['adaptive'][2]} succeeded, {results['adaptive'][0]} throttled, {results['adaptive'][1]:.3f}s"
+        f"\nAdaptive limit history: {[limit for _, limit in arlo_client.write_limiter.history[:12]]}..."
+    )
+    assert results["adaptive"][2] == 300
+    assert results["adaptive"][0] < results["fixed"][0]
+
+
+@pytest.mark.asyncio
+async def test_benchmark_circuit_breaker_outage(make_arlo_client):
+    timings = {}
+
+    for strategy in ("without breaker", "with breaker"):
+        # Arlo fails every update with a 500 after a slow response
+        fake_arlo = FakeArlo.with_catalogue(1, write_latency=0.02, outage=True)
+        fake_arlo.add_registrations("100000", 100)
+        breaker = (
+            CircuitBreaker(failure_ratio=2)
+            if strategy == "without breaker"
+            else CircuitBreaker()
+        )
+        arlo_client = make_arlo_client(
+            fake_arlo,
+            circuit_breaker=breaker,
+            retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.05),
+        )
+
+        start = timer()
+        async with WriteScheduler(arlo_client, max_concurrency=8) as scheduler:
+            for reg in fake_arlo.registrations["100000"]:
+                scheduler.submit(
+                    ArloRegistration(
+                        name="",
+                        email="",
+                        reg_href=f"{BASE_URL}/registrations/{reg.reg_id}/sessionregistrations/{reg.reg_id}",
+                    )
+                )
+        timings[strategy] = (
+            timer() - start,
+            len(fake_arlo.requests),
+            sum(not result.attempted for result in scheduler.results),
+        )
+        assert not any(result.success for result in scheduler.results)
+
+    print(
+        f"\nOutage without circuit breaker: {timings['without breaker'][0]:.3f}s, {timings['without breaker'][1]} requests"
+        f"\nOutage with circuit breaker: {timings['with breaker'][0]:.3f}s, {timings['with breaker'][1]} requests, {timings['with breaker'][2]} updates not attempted"
+    )
+    assert timings["with breaker"][0] < timings["without breaker"][0]
+    assert 0 < timings["with breaker"][2] < 100
+
+
+@pytest.mark.asyncio
+async def test_benchmark_rerun_write_volume(make_arlo_client):
+    fake_arlo = FakeArlo.with_catalogue(1, page_size=100)
+    fake_arlo.add_registrations("100000", 500)
+    attendees = [
+        ButterAttendee(
+            name=f"Attendee {i}", email=f"attendee{i}@example.com", session_duration=1
+        )
+        for i in range(0, 500, 3)
+    ]
+    writes = []
+
+    for run in ("first run", "re-run"):
+        arlo_client = make_arlo_client(fake_arlo)
+        meeting = Meeting("CK00000", datetime(2024, 1, 1), attendees=attendees)
+        num_requests = len(fake_arlo.requests)
+
+        await process_registrations(
+            arlo_client,
+            meeting,
+            meeting.event_code,
+            meeting.start_date,
+            0,
+            False,
+            False,
+        )
+        writes.append(
+            sum(req.method == "PATCH" for req in fake_arlo.requests[num_requests:])
+        )
+
+    print(
+        f"\nAttendance updates on first run of 500 registrations: {writes[0]}"
+        f"\nAttendance updates on re-run of 500 registrations: {writes[1]}"
+    )
+    assert writes == [500, 0]
+    assert (
+        sum(reg.attendance == "Attended" for reg in fake_arlo.registrations["100000"])
+        == 167
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("connect_latency", [0.0, 0.1])
+async def test_benchmark_http2(make_arlo_client, connect_latency):
+    timings = {}
+    connections = {}
+
+    for http2 in (False, True):
+        fake_arlo = FakeArlo.with_catalogue(
+            1, page_size=50, latency=0.04, write_latency=0.02
+        )
+        fake_arlo.add_registrations("100000", 200)
+        server = FakeArloServer(fake_arlo, connect_latency=connect_latency)
+        async with server.serve() as base_url:
+            arlo_client = make_arlo_client(fake_arlo)
+            arlo_client.base_url = base_url
+            # Local server without TLS, so HTTP/2 is used with prior knowledge instead of negotiated
+            arlo_client.async_client = httpx.AsyncClient(
+                http1=not http2, http2=http2, limits=arlo_client.limits
+            )
+            meeting = Meeting("CK00000", datetime(2024, 1, 1), attendees=[])
+
+            start = timer()
+            await pipelined(arlo_client, meeting)
+            timings[http2] = timer() - start
+            connections[http2] = server.connections
+            await arlo_client.close()
+
+        registrations = fake_arlo.registrations["100000"]
+        assert all(reg.attendance == "DidNotAttend" for reg in registrations)
+
+    print(
+        f"\nHTTP/1.1, {connect_latency}s to connect: {timings[False]:.3f}s ({connections[False]} connections)"
+        f"\nHTTP/2, {connect_latency}s to connect: {timings[True]:.3f}s ({connections[True]} connections)"
+    )
+    # Timings depend on the handshake cost: HTTP/2 saves a handshake for each extra connection, but frames each request in Python on both ends here
+    assert connections[True] == 1 < connections[False]
+
+
+@pytest.mark.asyncio
+async def test_benchmark_batch_attendee_files(make_arlo_client, tmp_path):
+    # Weekly batch: one session of each of 10 events, from a catalogue that has to be downloaded to find them
+    sessions = [(f"CK{i * 20:05d}", datetime(2024, 1, 1)) for i in range(10)]
+    attendee_files = [
+        write_attendee_file(tmp_path / f"{event_code}.csv", event_code, date)
+        for event_code, date in sessions
+    ]
+    timings = {}
+    request_counts = {}
+
+    for batch in (False, True):
+        fake_arlo = FakeArlo.with_catalogue(
+            200, page_size=50, latency=0.02, supports_filter=False
+        )
+        for event in fake_arlo.events[::20]:
+            fake_arlo.add_registrations(f"{event.event_id}00", 50)
+
+        def client() -> ArloClient:
+            return make_arlo_client(fake_arlo)
+
+        async def update(arlo_client: ArloClient, attendee_file: Path):
+            return await update_attendance(
+                arlo_client, attendee_file, None, None, 0, False, False
+            )
+
+        start = timer()
+        if batch:
+            arlo_client = client()
+            results = await asyncio.gather(
+                *(update(arlo_client, file) for file in attendee_files)
+            )
+        else:
+            # Previous behaviour, one run with its own client for each file
+            results = [await update(client(), file) for file in attendee_files]
+        timings[batch] = timer() - start
+        # Filtered lookups are rejected for each file, only unfiltered requests download the catalogue
+        request_counts[batch] = sum(
+            request.url.path.endswith("/events") and "filter" not in request.url.params
+            for request in fake_arlo.requests
+        )
+
+        assert all(len(result.registrations) == 50 for result in results)
+        assert all(
+            reg.attendance == "Attended"
+            for regs in fake_arlo.registrations.values()
+            for reg in regs[::2]
+        )
+
+    print(
+        f"\nSeparate runs for 10 files: {timings[False]:.3f}s ({request_counts[False]} event catalogue requests)"
+        f"\nBatch of 10 files: {timings[True]:.3f}s ({request_counts[True]} event catalogue requests)"
+    )
+    # The catalogue is downloaded once for the batch, rather than once for each file
+    assert request_counts[True] < 2 * request_counts[False] / len(attendee_files)
+    assert timings[True] < timings[False]
+
+
+@pytest.mark.asyncio
+async def test_benchmark_multi_day_sessions(make_arlo_client, tmp_path):
+    # Intensive course with one session, and one attendee file, on each of 5 days
+    dates = [datetime(2024, 1, 1 + day) for day in range(5)]
+    attendee_files = [
+        write_attendee_file(tmp_path / f"day{day}.csv", "CK00000", date)
+        for day, date in enumerate(dates)
+    ]
+    timings = {}
+    request_counts = {}
+
+    for single_invocation in (False, True):
+        fake_arlo = FakeArlo.with_catalogue(1, sessions_per_event=0, latency=0.05)
+        fake_arlo.sessions = [
+            FakeSession(f"10000{day}", "1000", f"Day {day}", date.replace(hour=9))
+            for day, date in enumerate(dates)
+        ]
+        for session in fake_arlo.sessions:
+            fake_arlo.add_registrations(session.session_id, 50)
+
+        def client() -> ArloClient:
+            return make_arlo_client(fake_arlo)
+
+        start = timer()
+        if single_invocation:
+            arlo_client = client()
+            session_dates = {date.date() for date in dates}
+            _, *results = await asyncio.gather(
+                arlo_client.aget_sessions_on_dates("CK00000", dates),
+                *(
+                    update_attendance(
+                        arlo_client,
+                        attendee_file,
+                        "CK00000",
+                        None,
+                        0,
+                        False,
+                        False,
+                        session_dates=session_dates,
+                    )
+                    for attendee_file in attendee_files
+                ),
+            )
+        else:
+            # Previous behaviour, one run for each day
+            results = [
+                await update_attendance(
+                    client(), attendee_file, "CK00000", date, 0, False, False
+                )
+                for attendee_file, date in zip(attendee_files, dates)
+            ]
+        timings[single_invocation] = timer() - start
+        request_counts[single_invocation] = sum(
+            request.url.path.endswith(("/events", "/sessions"))
+            for request in fake_arlo.requests
+        )
+
+        assert [result.session_name for result in results] == [
+            f"Day {day}" for day in range(5)
+        ]
+
+    print(
+        f"\nSeparate runs for 5 days: {timings[False]:.3f}s ({request_counts[False]} event and session requests)"
+        f"\nOne invocation for 5 days: {timings[True]:.3f}s ({request_counts[True]} event and session requests)"
+    )
+    assert request_counts[True] == 2
+    assert timings[True] < timings[False]
+
+
+@pytest.mark.asyncio
+async def test_benchmark_multiple_platforms(make_arlo_client, tmp_path):
+    # Three Arlo platforms, each with the sessions of 2 events to update
+    platforms = ["first", "second", "third"]
+    timings = {}
+
+    for concurrent in (False, True):
+        fake_arlos = {}
+        platform_files = {}
+        for platform in platforms:
+            fake_arlo = FakeArlo.with_catalogue(2, latency=0.05)
+            for event in fake_arlo.events:
+                fake_arlo.add_registrations(f"{event.event_id}00", 50)
+            fake_arlos[platform] = fake_arlo
+            platform_files[platform] = [
+                write_attendee_file(
+                    tmp_path / f"{platform}-{event.code}.csv",
+                    event.code,
+                    datetime(2024, 1, 1),
+                )
+                for event in fake_arlo.events
+            ]
+
+        def client(platform: str) -> ArloClient:
+            return make_arlo_client(fake_arlos[platform])
+
+        async def update(platform: str):
+            return await update_attendee_files(
+                client(platform), platform_files[platform], None, [], 0, False, False
+            )
+
+        start = timer()
+        if concurrent:
+            results = await asyncio.gather(*map(update, platforms))
+        else:
+            # Previous behaviour, one run for each platform
+            results = [await update(platform) for platform in platforms]
+        timings[concurrent] = timer() - start
+
+        assert all(
+            result.error is None and len(result.registrations) == 50
+            for platform_results in results
+            for result in platform_results
+        )
+
+    print(
+        f"\nSeparate runs for 3 platforms: {timings[False]:.3f}s"
+        f"\nOne run for 3 platforms: {timings[True]:.3f}s"
+    )
+    assert timings[True] < timings[False]
+
+
+@pytest.mark.asyncio
+async def test_benchmark_watch_warm_client(make_arlo_client, tmp_path):
+    # Attendee files dropped into a watched folder one at a time, for sessions of 5 events in a catalogue that has to be downloaded to find them
+    events = [f"CK{i * 20:05d}" for i in range(5)]
+    attendee_files = [
+        write_attendee_file(
+            tmp_path / f"{event_code}.csv", event_code, datetime(2024, 1, 1)
+        )
+        for event_code in events
+    ]
+    timings = {}
+    connections = {}
+
+    for warm in (False, True):
+        fake_arlo = FakeArlo.with_catalogue(
+            100, page_size=50, latency=0.02, supports_filter=False
+        )
+        for event in fake_arlo.events[::20]:
+            fake_arlo.add_registrations(f"{event.event_id}00", 50)
+        server = FakeArloServer(fake_arlo, connect_latency=0.05)
+
+        async with server.serve() as base_url:
+
+            def client() -> ArloClient:
+                arlo_client = make_arlo_client(fake_arlo)
+                arlo_client.base_url = base_url
+                arlo_client.async_client = httpx.AsyncClient(
+                    http1=False, http2=True, limits=arlo_client.limits
+                )
+                return arlo_client
+
+            arlo_client = client()
+            start = timer()
+            results = []
+            for attendee_file in attendee_files:
+                if not warm:
+                    # Previous behaviour, a cron job running baa for each file with a cold client
+                    await arlo_client.close()
+                    arlo_client = client()
+                results.append(
+                    await update_attendance(
+                        arlo_client, attendee_file, None, None, 0, False, False
+                    )
+                )
+            timings[warm] = timer() - start
+            connections[warm] = server.connections
+            await arlo_client.close()
+
+        assert all(len(result.registrations) == 50 for result in results)
+
+    print(
+        f"\nCold client for each of 5 files: {timings[False]:.3f}s ({connections[False]} connections)"
+        f"\nWarm client for 5 files: {timings[True]:.3f}s ({connections[True]} connections)"
+    )
+    assert connections[True] == 1 < connections[False]
+    assert timings[True] < timings[False]
+
+
+@pytest.mark.asyncio
+async def test_benchmark_serve_warm_client(make_arlo_client, tmp_path):
+    # Reports for sessions of 3 events sent by internal tooling one at a time
+    events = [f"CK{i * 20:05d}" for i in range(3)]
+    reports = [
+        write_attendee_file(
+            tmp_path / f"{event_code}.csv", event_code, datetime(2024, 1, 1)
+        )
+        for event_code in events
+    ]
+    timings = {}
+
+    for serve in (False, True):
+        fake_arlo = FakeArlo.with_catalogue(
+            60, page_size=20, latency=0.02, supports_filter=False
+        )
+        for event in fake_arlo.events[::20]:
+            fake_arlo.add_registrations(f"{event.event_id}00", 50)
+
+        def client() -> ArloClient:
+            return make_arlo_client(fake_arlo)
+
+        if serve:
+            server = AttendanceServer(client())
+            host, port = await server.start(port=0)
+            async with httpx.AsyncClient(base_url=f"http://{host}:{port}") as http:
+                start = timer()
+                for report in reports:
+                    response = await http.post(
+                        "/jobs?wait", content=report.read_bytes()
+                    )
+                    assert response.json()["status"] == "succeeded"
+                timings[serve] = timer() - start
+            await server.close()
+            await server.arlo_client.close()
+        else:
+            # Previous behaviour, a new Python process with a cold client for each report
+            start = timer()
+            for report in reports:
+                await asyncio.to_thread(
+                    subprocess.run,
+                    [sys.executable, "-c", "import baa.main"],
+                    check=True,
+                    cwd=Path(__file__).parent.parent,
+                )
+                arlo_client = client()
+                result = await update_attendance(
+                    arlo_client, report, None, None, 0, False, False
+                )
+                assert len(result.registrations) == 50
+                await arlo_client.close()
+            timings[serve] = timer() - start
+
+    print(
+        f"\nNew process for each of 3 reports: {timings[False]:.3f}s"
+        f"\nServer with a warm client for 3 reports: {timings[True]:.3f}s"
+    )
+    assert timings[True] < timings[False]
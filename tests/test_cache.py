@@ -0,0 +1,231 @@
+import pytest
+import httpx
+import stat
+import sys
+from datetime import date, datetime, timedelta
+from threading import Thread
+
+from baa.arlo_api import ArloClient
+from baa.cache import MetadataCache, get_cache_dir
+from baa.classes import ArloEvent, ArloSession
+from tests.fake_arlo import FakeArlo
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "metadata.sqlite3"
+
+
+@pytest.fixture
+def metadata_cache(cache_path):
+    metadata_cache = MetadataCache("test-platform", path=cache_path)
+    yield metadata_cache
+    metadata_cache.close()
+
+
+def example_session(session_id="5678", start=datetime(2024, 1, 1, 18, 30)):
+    return ArloSession(
+        session_id=session_id, event_id="1234", name="Test Session", start=start
+    )
+
+
+def test_get_cache_dir_override(monkeypatch, tmp_path):
+    monkeypatch.setenv("BAA_CACHE_DIR", str(tmp_path))
+    assert get_cache_dir() == tmp_path
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX file permissions")
+def test_cache_only_readable_by_user(tmp_path):
+    cache_path = tmp_path / "baa" / "metadata.sqlite3"
+    metadata_cache = MetadataCache("test-platform", path=cache_path)
+    metadata_cache.set_response("https://test.url/registrations", None, None, b"")
+    metadata_cache.close()
+    # Databases created by earlier versions are restricted when opened
+    cache_path.chmod(0o644)
+    MetadataCache("test-platform", path=cache_path).close()
+
+    assert stat.S_IMODE(cache_path.parent.stat().st_mode) == 0o700
+    assert stat.S_IMODE(cache_path.stat().st_mode) == 0o600
+
+
+def test_events(metadata_cache):
+    event = ArloEvent(event_id="1234", code="CK24ABC", name="Test Event")
+    metadata_cache.set_events([event])
+
+    assert metadata_cache.get_event("CK24ABC") == event
+    assert metadata_cache.get_event("CK00XYZ") is None
+
+
+def test_sessions(metadata_cache):
+    sessions = [
+        example_session("1", datetime(2024, 1, 1, 18, 30)),
+        example_session("2", datetime(2024, 1, 8, 18, 30)),
+    ]
+    metadata_cache.set_sessions(sessions)
+
+    assert metadata_cache.get_sessions("1234", date(2024, 1, 8)) == [sessions[1]]
+    assert metadata_cache.get_sessions("1234", date(2024, 1, 2)) == []
+
+
+def test_expired_entries(cache_path):
+    metadata_cache = MetadataCache("test-platform", ttl=timedelta(0), path=cache_path)
+    metadata_cache.set_events([ArloEvent(event_id="1234", code="CK24ABC", name="")])
+    metadata_cache.set_sessions([example_session()])
+
+    assert metadata_cache.get_event("CK24ABC") is None
+    assert metadata_cache.get_sessions("1234", date(2024, 1, 1)) == []
+
+
+def test_refresh(cache_path, metadata_cache):
+    metadata_cache.set_events([ArloEvent(event_id="1234", code="CK24ABC", name="")])
+
+    refreshed_cache = MetadataCache("test-platform", refresh=True, path=cache_path)
+    assert refreshed_cache.get_event("CK24ABC") is None
+    refreshed_cache.set_events([ArloEvent(event_id="5678", code="CK24ABC", name="")])
+
+    assert metadata_cache.get_event("CK24ABC").event_id == "5678"
+
+
+def test_platforms_are_separate(cache_path, metadata_cache):
+    metadata_cache.set_events([ArloEvent(event_id="1234", code="CK24ABC", name="")])
+
+    other_cache = MetadataCache("other-platform", path=cache_path)
+    assert other_cache.get_event("CK24ABC") is None
+
+
+def test_concurrent_writers(cache_path):
+    def write_events(platform):
+        metadata_cache = MetadataCache(platform, path=cache_path)
+        for i in range(50):
+            metadata_cache.set_events(
+                [ArloEvent(event_id=str(i), code=f"CK{i}", name=platform)]
+            )
+        metadata_cache.close()
+
+    writers = [Thread(target=write_events, args=(f"platform{i}",)) for i in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    for i in range(4):
+        metadata_cache = MetadataCache(f"platform{i}", path=cache_path)
+        assert metadata_cache.get_event("CK49").name == f"platform{i}"
+
+
+@pytest.mark.asyncio
+async def test_warm_run_makes_no_requests(mocker, cache_path):
+    mocker.patch("baa.helpers.get_keyring_credentials", return_value=("user", "pass"))
+    fake_arlo = FakeArlo.with_catalogue(10)
+    session_ids = []
+
+    for _ in range(2):
+        fake_arlo.requests.clear()
+        arlo_client = ArloClient(
+            "test-platform", cache=MetadataCache("test-platform", path=cache_path)
+        )
+        arlo_client.async_client = httpx.AsyncClient(
+            transport=fake_arlo.async_transport()
+        )
+        event_id = await arlo_client._aget_event_id("CK00005")
+        session_ids.append(
+            await arlo_client._aget_session_id(event_id, datetime(2024, 1, 8))
+        )
+        await arlo_client.close()
+
+    assert session_ids == ["100501", "100501"]
+    assert len(fake_arlo.requests) == 0
+
+
+def test_responses(metadata_cache):
+    url = "https://test.url/events?expand=Event"
+    assert metadata_cache.get_response(url) is None
+
+    metadata_cache.set_response(url, '"v1"', None, b"<Events/>")
+    cached = metadata_cache.get_response(url)
+    assert (cached.etag, cached.last_modified, cached.body) == (
+        '"v1"',
+        None,
+        b"<Events/>",
+    )
+    assert cached.is_fresh(timedelta(hours=1))
+    assert not cached.is_fresh(timedelta(0))
+
+    metadata_cache.touch_response(url)
+    assert metadata_cache.get_response(url).fetched_at >= cached.fetched_at
+
+
+def test_old_entries_pruned_on_open(cache_path, metadata_cache):
+    other_platform = MetadataCache("other-platform", path=cache_path)
+    for cache in (metadata_cache, other_platform):
+        cache.set_response("https://test.url/old", None, None, b"<Events/>")
+        cache.set_response("https://test.url/new", None, None, b"<Events/>")
+        cache.set_events([ArloEvent(event_id="1234", code="CK24ABC", name="")])
+    # Older than PRUNE_AFTER_TTLS times the default TTL of a day
+    old = (datetime.now() - timedelta(days=8)).timestamp()
+    with metadata_cache.conn:
+        metadata_cache.conn.execute(
+            "UPDATE responses SET fetched_at = ? WHERE url = ?",
+            (old, "https://test.url/old"),
+        )
+        metadata_cache.conn.execute("UPDATE events SET fetched_at = ?", (old,))
+    other_platform.close()
+
+    reopened = MetadataCache("test-platform", path=cache_path)
+    assert reopened.get_response("https://test.url/old") is None
+    assert reopened.get_response("https://test.url/new") is not None
+    assert reopened.conn.execute("SELECT platform FROM events").fetchall() == [
+        ("other-platform",)
+    ]
+    reopened.close()
+
+    # Entries of other platforms are pruned when their own cache is opened
+    other_platform = MetadataCache("other-platform", path=cache_path)
+    assert other_platform.get_response("https://test.url/old") is None
+    other_platform.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_run_revalidates_pages(mocker, cache_path):
+    mocker.patch("baa.helpers.get_keyring_credentials", return_value=("user", "pass"))
+    fake_arlo = FakeArlo.with_catalogue(10)
+
+    stats = []
+    for _ in range(2):
+        fake_arlo.requests.clear()
+        arlo_client = ArloClient(
+            "test-platform",
+            cache=MetadataCache("test-platform", ttl=timedelta(0), path=cache_path),
+        )
+        arlo_client.async_client = httpx.AsyncClient(
+            transport=fake_arlo.async_transport()
+        )
+        event_id = await arlo_client._aget_event_id("CK00005")
+        await arlo_client._aget_session_id(event_id, datetime(2024, 1, 8))
+        await arlo_client.close()
+        stats.append(arlo_client.response_cache_stats)
+
+    assert stats[0] == {"miss": 2}
+    assert stats[1] == {"revalidated": 2}
+    assert all("If-None-Match" in request.headers for request in fake_arlo.requests)
+
+
+@pytest.mark.asyncio
+async def test_paginated_responses_cached_per_page(mocker, cache_path):
+    mocker.patch("baa.helpers.get_keyring_credentials", return_value=("user", "pass"))
+    fake_arlo = FakeArlo.with_catalogue(10, page_size=3, supports_filter=False)
+
+    for _ in range(2):
+        arlo_client = ArloClient(
+            "test-platform", cache=MetadataCache("test-platform", path=cache_path)
+        )
+        arlo_client.async_client = httpx.AsyncClient(
+            transport=fake_arlo.async_transport()
+        )
+        await arlo_client._aindex_event_catalogue()
+        await arlo_client.close()
+
+        assert sorted(arlo_client.event_index) == [e.code for e in fake_arlo.events]
+
+    assert arlo_client.response_cache_stats["miss"] == 0
+    assert arlo_client.response_cache_stats["hit"] >= 4
@@ -28,3 +28,32 @@ def test_attendance_status_enum():
     assert AttendanceStatus.ATTENDED.value == "Attended"
     assert AttendanceStatus.DID_NOT_ATTEND.value == "DidNotAttend"
     assert AttendanceStatus.UNKNOWN.value == "Unknown"
+
+
+@pytest.mark.parametrize(
+    "attendance_registered, current_attendance, changed",
+    [
+        (True, AttendanceStatus.ATTENDED, False),
+        (False, AttendanceStatus.DID_NOT_ATTEND, False),
+        (True, AttendanceStatus.DID_NOT_ATTEND, True),
+        (False, AttendanceStatus.UNKNOWN, True),
+        (True, None, True),
+    ],
+)
+def test_arlo_reg_attendance_changed(
+    attendance_registered, current_attendance, changed
+):
+    reg = ArloRegistration(
+        name="Ada Lovelace",
+        email="ada@example.com",
+        reg_href="href",
+        attendance_registered=attendance_registered,
+        current_attendance=current_attendance,
+    )
+
+    assert reg.target_attendance == (
+        AttendanceStatus.ATTENDED
+        if attendance_registered
+        else AttendanceStatus.DID_NOT_ATTEND
+    )
+    assert reg.attendance_changed == changed
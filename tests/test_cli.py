@@ -1,14 +1,17 @@
+import json
 import pytest
+import subprocess
+import sys
 from click.testing import CliRunner
 from datetime import datetime
 
-from baa.cli import main
-from baa.exceptions import AuthenticationFailed
+from baa.cli import expand_attendee_files, main
+from baa.exceptions import AuthenticationFailed, CredentialsNotFound, EventNotFound
 
 
 @pytest.fixture
 def cli_runner(mocker):
-    mocker.patch("baa.cli.baa")
+    mocker.patch("baa.main.baa")
     # Mock banner as call to get_terminal_size() wont work in CliRunner
     mocker.patch("baa.cli.banner", return_value="")
     return CliRunner()
@@ -16,7 +19,7 @@ def cli_runner(mocker):
 
 @pytest.fixture(autouse=True)
 def mock_keyring(mocker):
-    mocker.patch("baa.cli.has_keyring_credentials", return_value=True)
+    mocker.patch("baa.cli.CredentialProvider.has_credentials", return_value=True)
     mocker.patch("baa.cli.set_keyring_credentials")
 
 
@@ -28,7 +31,7 @@ def attendee_file(tmp_path):
 
 
 def test_cli_success(cli_runner, attendee_file, mocker):
-    mock_baa = mocker.patch("baa.cli.baa")
+    mock_baa = mocker.patch("baa.main.baa")
 
     result = cli_runner.invoke(
         main,
@@ -37,18 +40,31 @@ def test_cli_success(cli_runner, attendee_file, mocker):
     print(result.output)
     assert result.exit_code == 0
     mock_baa.assert_called_once_with(
-        attendee_file, "butter", "codefirstgirls", None, None, 0, False, False
+        attendee_file,
+        "butter",
+        "codefirstgirls",
+        None,
+        None,
+        0,
+        False,
+        False,
+        24,
+        False,
+        "off",
+        0.85,
+        8,
+        credential_provider=mocker.ANY,
     )
 
 
 def test_cli_invalid_attendee_file(cli_runner):
     result = cli_runner.invoke(main, ["invalid_file.csv"])
     assert result.exit_code != 0
-    assert "Invalid value for 'ATTENDEE_FILE'" in result.output
+    assert "Invalid value for 'ATTENDEE_FILES...'" in result.output
 
 
 def test_cli_with_options(cli_runner, attendee_file, mocker):
-    mock_baa = mocker.patch("baa.cli.baa")
+    mock_baa = mocker.patch("baa.main.baa")
 
     result = cli_runner.invoke(
         main,
@@ -66,6 +82,15 @@ def test_cli_with_options(cli_runner, attendee_file, mocker):
             "90",
             "--skip-absent",
             "--dry-run",
+            "--cache-ttl",
+            "1",
+            "--refresh-cache",
+            "--fuzzy",
+            "suggest",
+            "--fuzzy-threshold",
+            "0.9",
+            "--max-concurrency",
+            "2",
         ],
     )
 
@@ -79,11 +104,17 @@ def test_cli_with_options(cli_runner, attendee_file, mocker):
         90,
         True,
         True,
+        1,
+        True,
+        "suggest",
+        0.9,
+        2,
+        credential_provider=mocker.ANY,
     )
 
 
 def test_cli_no_keyring_credentials(cli_runner, attendee_file, mocker):
-    mocker.patch("baa.cli.has_keyring_credentials", return_value=False)
+    mocker.patch("baa.cli.CredentialProvider.has_credentials", return_value=False)
     mock_set_password = mocker.patch("baa.cli.set_keyring_credentials")
 
     result = cli_runner.invoke(main, [attendee_file.as_posix()])
@@ -92,12 +123,323 @@ def test_cli_no_keyring_credentials(cli_runner, attendee_file, mocker):
     mock_set_password.assert_called_once()
 
 
+def test_cli_unreadable_credentials_fd(cli_runner, attendee_file, mocker):
+    mocker.patch(
+        "baa.cli.CredentialProvider.has_credentials",
+        side_effect=CredentialsNotFound("Unable to read Arlo credentials"),
+    )
+    mock_set_password = mocker.patch("baa.cli.set_keyring_credentials")
+    mock_baa = mocker.patch("baa.main.baa")
+
+    result = cli_runner.invoke(main, [attendee_file.as_posix()])
+
+    # Headless runs fail rather than prompting for the credentials
+    assert result.exit_code == 1
+    assert "Unable to read Arlo credentials" in result.output
+    mock_set_password.assert_not_called()
+    mock_baa.assert_not_called()
+
+
 def test_cli_auth_failed(cli_runner, attendee_file, mocker):
     mocker.patch(
-        "baa.cli.baa", side_effect=AuthenticationFailed("Authentication failed")
+        "baa.main.baa", side_effect=AuthenticationFailed("Authentication failed")
     )
 
     result = cli_runner.invoke(main, [attendee_file.as_posix()])
 
     assert result.exit_code == 1
     assert "Authentication failed" in result.output
+
+
+def test_expand_attendee_files(tmp_path, attendee_file):
+    reports = tmp_path / "reports"
+    reports.mkdir()
+    for name in ("b.csv", "a.CSV", "notes.txt"):
+        (reports / name).write_text("temp", encoding="utf-8")
+
+    assert expand_attendee_files((reports, attendee_file, reports / "b.csv")) == [
+        reports / "a.CSV",
+        reports / "b.csv",
+        attendee_file,
+    ]
+
+
+@pytest.mark.parametrize("error, exit_code", [(None, 0), (EventNotFound(), 1)])
+def test_cli_batch(cli_runner, tmp_path, attendee_file, mocker, error, exit_code):
+    other_file = tmp_path / "other_file.csv"
+    other_file.write_text("temp", encoding="utf-8")
+    mock_baa = mocker.patch("baa.main.baa")
+    mock_baa_batch = mocker.patch(
+        "baa.main.baa_batch",
+        return_value=[mocker.Mock(error=None), mocker.Mock(error=error)],
+    )
+
+    result = cli_runner.invoke(main, [tmp_path.as_posix()])
+
+    assert result.exit_code == exit_code
+    mock_baa.assert_not_called()
+    assert mock_baa_batch.call_args.args[0] == [attendee_file, other_file]
+
+
+def test_cli_empty_directory(cli_runner, tmp_path):
+    result = cli_runner.invoke(main, [tmp_path.as_posix()])
+
+    assert result.exit_code != 0
+    assert "No attendee files found" in result.output
+
+
+def test_cli_dates(cli_runner, attendee_file, mocker):
+    mock_baa_batch = mocker.patch("baa.main.baa_batch", return_value=[])
+
+    result = cli_runner.invoke(
+        main,
+        [
+            attendee_file.as_posix(),
+            "--date",
+            "2024-01-08",
+            "--date-range",
+            "2024-01-01",
+            "2024-01-03",
+            "--date",
+            "2024-01-02",
+        ],
+    )
+
+    assert result.exit_code == 0
+    assert mock_baa_batch.call_args.args[4] == [
+        datetime(2024, 1, 1),
+        datetime(2024, 1, 2),
+        datetime(2024, 1, 3),
+        datetime(2024, 1, 8),
+    ]
+
+
+def test_cli_invalid_date_range(cli_runner, attendee_file):
+    result = cli_runner.invoke(
+        main, [attendee_file.as_posix(), "--date-range", "2024-01-03", "2024-01-01"]
+    )
+
+    assert result.exit_code != 0
+    assert "The last date is before the first date" in result.output
+
+
+@pytest.mark.parametrize("error, exit_code", [(None, 0), (EventNotFound(), 1)])
+def test_cli_platform_map(
+    cli_runner, tmp_path, attendee_file, mocker, error, exit_code
+):
+    reports = tmp_path / "reports"
+    reports.mkdir()
+    other_file = reports / "other_file.csv"
+    other_file.write_text("temp", encoding="utf-8")
+    platform_map = tmp_path / "platforms.json"
+    platform_map.write_text(
+        json.dumps(
+            {
+                "first": ["attendee_file.csv"],
+                "second": {"files": ["reports"], "max_concurrency": 2},
+            }
+        ),
+        encoding="utf-8",
+    )
+    mock_baa_platforms = mocker.patch(
+        "baa.main.baa_platforms",
+        return_value={
+            "first": [mocker.Mock(error=None)],
+            "second": [mocker.Mock(error=error)],
+        },
+    )
+
+    result = cli_runner.invoke(main, ["--platform-map", platform_map.as_posix()])
+
+    assert result.exit_code == exit_code
+    assert mock_baa_platforms.call_args.args[0] == {
+        "first": [attendee_file],
+        "second": [other_file],
+    }
+    kwargs = mock_baa_platforms.call_args.kwargs
+    assert kwargs["platform_concurrency"] == {"second": 2}
+    # Each platform has its own credentials, falling back to the shared ones
+    providers = kwargs["credential_providers"]
+    assert [provider.platform for provider in providers.values()] == [
+        "first",
+        "second",
+    ]
+    assert providers["first"].fallback is providers["second"].fallback
+
+
+def test_cli_platform_map_with_attendee_files(
+    cli_runner, tmp_path, attendee_file, mocker
+):
+    platform_map = tmp_path / "platforms.json"
+    platform_map.write_text(json.dumps({"other": [attendee_file.name]}))
+    mock_baa_platforms = mocker.patch("baa.main.baa_platforms", return_value={})
+
+    result = cli_runner.invoke(
+        main,
+        [
+            attendee_file.as_posix(),
+            "--platform-map",
+            platform_map.as_posix(),
+            "--platform",
+            "myplatform",
+        ],
+    )
+
+    assert result.exit_code == 0
+    assert mock_baa_platforms.call_args.args[0] == {
+        "other": [attendee_file],
+        "myplatform": [attendee_file],
+    }
+
+
+@pytest.mark.parametrize(
+    "mapping, message",
+    [
+        ([], "Expected an object of attendee files by platform"),
+        ({"myarlo": "attendee_file.csv"}, "Expected a list of attendee files"),
+        ({"myarlo": ["missing.csv"]}, "does not exist"),
+        (
+            {"myarlo": {"files": [], "max_concurrency": 0}},
+            "Expected a max_concurrency of at least 1",
+        ),
+    ],
+)
+def test_cli_invalid_platform_map(
+    cli_runner, tmp_path, attendee_file, mapping, message
+):
+    platform_map = tmp_path / "platforms.json"
+    platform_map.write_text(json.dumps(mapping))
+
+    result = cli_runner.invoke(main, ["--platform-map", platform_map.as_posix()])
+
+    assert result.exit_code != 0
+    assert message in result.output
+
+
+def test_cli_missing_attendee_files(cli_runner):
+    result = cli_runner.invoke(main, [])
+
+    assert result.exit_code != 0
+    assert "Missing attendee files" in result.output
+
+
+def test_cli_update_command(cli_runner, attendee_file, mocker):
+    mock_baa = mocker.patch("baa.main.baa")
+
+    result = cli_runner.invoke(main, ["update", attendee_file.as_posix()])
+
+    assert result.exit_code == 0
+    assert mock_baa.call_args.args[0] == attendee_file
+
+
+@pytest.mark.parametrize("help_option", ["-h", "--help"])
+def test_cli_help_lists_commands(cli_runner, help_option):
+    result = cli_runner.invoke(main, [help_option])
+
+    assert result.exit_code == 0
+    assert "Commands:" in result.output
+    assert all(command in result.output for command in ("update", "watch", "serve"))
+
+
+def test_cli_update_help(cli_runner):
+    result = cli_runner.invoke(main, ["update", "-h"])
+
+    assert result.exit_code == 0
+    assert "--event-code" in result.output
+
+
+def test_cli_watch(cli_runner, tmp_path, mocker):
+    mock_baa_watch = mocker.patch("baa.main.baa_watch")
+
+    result = cli_runner.invoke(
+        main,
+        [
+            "watch",
+            tmp_path.as_posix(),
+            "--platform",
+            "myplatform",
+            "--max-files",
+            "2",
+            "--settle-time",
+            "5",
+        ],
+    )
+
+    assert result.exit_code == 0
+    mock_baa_watch.assert_called_once_with(
+        tmp_path,
+        "butter",
+        "myplatform",
+        0,
+        False,
+        False,
+        24,
+        False,
+        "off",
+        0.85,
+        8,
+        mocker.ANY,
+        2,
+        1.0,
+        5.0,
+    )
+
+
+def test_cli_watch_stopped(cli_runner, tmp_path, mocker):
+    mocker.patch("baa.main.baa_watch", side_effect=KeyboardInterrupt)
+
+    result = cli_runner.invoke(main, ["watch", tmp_path.as_posix()])
+
+    assert result.exit_code == 0
+    assert "Stopped watching" in result.output
+
+
+def test_cli_watch_auth_failed(cli_runner, tmp_path, mocker, monkeypatch):
+    for env in ("BAA_ARLO_USERNAME", "BAA_ARLO_PASSWORD", "BAA_CREDENTIALS_FD"):
+        monkeypatch.delenv(env, raising=False)
+    mocker.patch("baa.helpers.get_keyring_credentials", return_value=("user", "pass"))
+    mock_remove_credentials = mocker.patch("baa.helpers.remove_keyring_credentials")
+
+    async def reject_credentials(*args):
+        credential_provider = args[11]
+        credential_provider.get()
+        credential_provider.invalidate()
+        raise AuthenticationFailed("Authentication failed")
+
+    mocker.patch("baa.main.baa_watch", side_effect=reject_credentials)
+
+    result = cli_runner.invoke(main, ["watch", tmp_path.as_posix()])
+
+    # Watching stops, and the rejected credentials are removed so the next run prompts for them
+    assert result.exit_code == 1
+    assert "Authentication failed" in result.output
+    mock_remove_credentials.assert_called_once()
+
+
+def test_cli_serve(cli_runner, mocker):
+    mock_baa_serve = mocker.patch("baa.server.baa_serve")
+
+    result = cli_runner.invoke(
+        main, ["serve", "--port", "9000", "--max-jobs", "2", "--min-duration", "30"]
+    )
+
+    assert result.exit_code == 0
+    platform, defaults, host, port, *_ = mock_baa_serve.call_args.args
+    assert (platform, host, port) == ("codefirstgirls", "127.0.0.1", 9000)
+    assert defaults.min_duration == 30
+    assert mock_baa_serve.call_args.args[-2:] == (2, 100)
+    # Credentials rejected while serving are not removed from the keyring
+    assert not mock_baa_serve.call_args.args[-3].remove_rejected
+
+
+def test_import_without_arlo_client():
+    # Commands import the Arlo client and renderers when run, so baa -h starts quickly
+    modules = subprocess.run(
+        [sys.executable, "-c", "import sys, baa.cli; print(' '.join(sys.modules))"],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.split()
+
+    assert "baa.cli" in modules
+    assert not {"httpx", "h2", "lxml", "prettytable", "keyring"} & set(modules)
@@ -1,3 +1,4 @@
+import os
 import pytest
 from baa.helpers import (
     b64encode_str,
@@ -6,6 +7,7 @@ from baa.helpers import (
     get_keyring_credentials,
     set_keyring_credentials,
     remove_keyring_credentials,
+    CredentialProvider,
     LoadingSpinner,
     BAA_KEYRING_DOMAIN,
     BAA_KEYRING_USER,
@@ -13,6 +15,12 @@ from baa.helpers import (
 from baa.exceptions import CredentialsNotFound
 
 
+@pytest.fixture(autouse=True)
+def fd_credentials(monkeypatch):
+    # File descriptor numbers are reused between tests
+    monkeypatch.setattr("baa.helpers._fd_credentials", {})
+
+
 def test_base64_encoding_decoding():
     original = "Hello, World!"
     encoded = b64encode_str(original)
@@ -61,6 +69,228 @@ def test_remove_keyring_credentials(mocker):
     mock_delete_password.assert_called_once_with(BAA_KEYRING_DOMAIN, BAA_KEYRING_USER)
 
 
+def keyring_password(username="username", password="password"):
+    return f"{b64encode_str(username)};{b64encode_str(password)}"
+
+
+def test_credential_provider_reads_keyring_once(mocker):
+    mock_get_password = mocker.patch(
+        "keyring.get_password", return_value=keyring_password()
+    )
+    credential_provider = CredentialProvider(environ={})
+
+    assert credential_provider.has_credentials()
+    assert credential_provider.get() == ("username", "password")
+    mock_get_password.assert_called_once()
+
+
+def test_credential_provider_no_credentials(mocker):
+    mocker.patch("keyring.get_password", return_value=None)
+    mocker.patch("keyring.get_keyring")
+    credential_provider = CredentialProvider(environ={})
+
+    assert not credential_provider.has_credentials()
+    with pytest.raises(CredentialsNotFound):
+        credential_provider.get()
+
+
+def test_credential_provider_environment(mocker):
+    mock_get_password = mocker.patch("keyring.get_password")
+    credential_provider = CredentialProvider(
+        environ={"BAA_ARLO_USERNAME": "env-user", "BAA_ARLO_PASSWORD": "env-pass"}
+    )
+
+    assert credential_provider.get() == ("env-user", "env-pass")
+    mock_get_password.assert_not_called()
+
+
+def test_credential_provider_file_descriptor(mocker):
+    mock_get_password = mocker.patch("keyring.get_password")
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"fd-user\nfd-pass\n")
+    os.close(write_fd)
+    credential_provider = CredentialProvider(
+        environ={"BAA_CREDENTIALS_FD": str(read_fd)}
+    )
+
+    assert credential_provider.get() == ("fd-user", "fd-pass")
+    # The file descriptor is only read once
+    assert credential_provider.get() == ("fd-user", "fd-pass")
+    mock_get_password.assert_not_called()
+
+
+def test_credential_provider_invalidate(mocker):
+    mock_get_password = mocker.patch(
+        "keyring.get_password", return_value=keyring_password()
+    )
+    mock_delete_password = mocker.patch("keyring.delete_password")
+    credential_provider = CredentialProvider(environ={})
+    credential_provider.get()
+
+    credential_provider.invalidate()
+    credential_provider.get()
+
+    # Credentials are read again after being invalidated, and removed from the keyring
+    assert mock_get_password.call_count == 2
+    mock_delete_password.assert_called_once()
+
+
+def test_credential_provider_invalidate_environment(mocker):
+    mock_delete_password = mocker.patch("keyring.delete_password")
+    credential_provider = CredentialProvider(
+        environ={"BAA_ARLO_USERNAME": "env-user", "BAA_ARLO_PASSWORD": "env-pass"}
+    )
+    credential_provider.get()
+
+    credential_provider.invalidate()
+
+    with pytest.raises(CredentialsNotFound, match="the environment were rejected"):
+        credential_provider.get()
+    mock_delete_password.assert_not_called()
+
+
+def test_credential_provider_invalidate_file_descriptor(mocker):
+    mock_fdopen = mocker.patch("os.fdopen", wraps=os.fdopen)
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"fd-user\nfd-pass\n")
+    os.close(write_fd)
+    credential_provider = CredentialProvider(
+        environ={"BAA_CREDENTIALS_FD": str(read_fd)}
+    )
+    credential_provider.get()
+
+    credential_provider.invalidate()
+
+    # The closed file descriptor, which may have been reused, is not opened again
+    with pytest.raises(
+        CredentialsNotFound, match=f"descriptor {read_fd} were rejected"
+    ):
+        credential_provider.get()
+    mock_fdopen.assert_called_once()
+
+
+def test_credential_provider_file_descriptor_read_once_per_process(mocker):
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"fd-user\nfd-pass\n")
+    os.close(write_fd)
+    environ = {"BAA_CREDENTIALS_FD": str(read_fd)}
+
+    assert CredentialProvider(environ=environ).get() == ("fd-user", "fd-pass")
+    assert CredentialProvider(environ=environ).get() == ("fd-user", "fd-pass")
+
+
+@pytest.mark.parametrize(
+    "fd, match",
+    [
+        ("not-a-number", "Unable to read"),
+        # Not an open file descriptor
+        ("999999", "Unable to read"),
+        (None, "Expected a username and password"),
+    ],
+)
+def test_credential_provider_bad_file_descriptor(mocker, fd, match):
+    mock_get_password = mocker.patch(
+        "keyring.get_password", return_value=keyring_password()
+    )
+    if fd is None:
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b"fd-user\n")
+        os.close(write_fd)
+        fd = str(read_fd)
+    credential_provider = CredentialProvider(environ={"BAA_CREDENTIALS_FD": fd})
+
+    # Headless runs fail rather than falling back to the keyring or a prompt
+    with pytest.raises(CredentialsNotFound, match=match):
+        credential_provider.has_credentials()
+    with pytest.raises(CredentialsNotFound, match=match):
+        credential_provider.get()
+    mock_get_password.assert_not_called()
+
+
+def test_credential_provider_invalidate_keeps_stored(mocker):
+    mock_get_password = mocker.patch(
+        "keyring.get_password", return_value=keyring_password()
+    )
+    mock_delete_password = mocker.patch("keyring.delete_password")
+    credential_provider = CredentialProvider(environ={}, remove_rejected=False)
+    credential_provider.get()
+
+    credential_provider.invalidate()
+    credential_provider.get()
+
+    # Long running processes read the stored credentials again, without removing them
+    assert mock_get_password.call_count == 2
+    mock_delete_password.assert_not_called()
+
+
+def test_credential_provider_platform_environment(mocker):
+    mock_get_password = mocker.patch("keyring.get_password")
+    credential_provider = CredentialProvider(
+        environ={
+            "BAA_ARLO_USERNAME_MY_ARLO": "platform-user",
+            "BAA_ARLO_PASSWORD_MY_ARLO": "platform-pass",
+            "BAA_ARLO_USERNAME": "env-user",
+            "BAA_ARLO_PASSWORD": "env-pass",
+        },
+        platform="my-arlo",
+    )
+
+    assert credential_provider.get() == ("platform-user", "platform-pass")
+    mock_get_password.assert_not_called()
+
+
+def test_credential_provider_platform_keyring(mocker):
+    def get_password(domain, user):
+        if user == f"{BAA_KEYRING_USER} (myarlo)":
+            return keyring_password("platform-user", "platform-pass")
+        return None
+
+    mocker.patch("keyring.get_password", side_effect=get_password)
+    mock_delete_password = mocker.patch("keyring.delete_password")
+    credential_provider = CredentialProvider(
+        environ={},
+        platform="myarlo",
+        fallback=CredentialProvider(
+            environ={"BAA_ARLO_USERNAME": "env-user", "BAA_ARLO_PASSWORD": "env-pass"}
+        ),
+    )
+
+    assert credential_provider.get() == ("platform-user", "platform-pass")
+    credential_provider.invalidate()
+    mock_delete_password.assert_called_once_with(
+        BAA_KEYRING_DOMAIN, f"{BAA_KEYRING_USER} (myarlo)"
+    )
+
+
+def test_credential_provider_platform_fallback(mocker):
+    mock_get_password = mocker.patch("keyring.get_password", return_value=None)
+    mock_delete_password = mocker.patch("keyring.delete_password")
+    fallback = CredentialProvider(
+        environ={"BAA_ARLO_USERNAME": "env-user", "BAA_ARLO_PASSWORD": "env-pass"}
+    )
+    credential_providers = [
+        CredentialProvider(environ={}, platform=platform, fallback=fallback)
+        for platform in ("first", "second")
+    ]
+
+    for credential_provider in credential_providers:
+        assert credential_provider.get() == ("env-user", "env-pass")
+    # Each platform checks its own keyring entry before using the shared credentials
+    assert mock_get_password.call_count == 2
+
+    credential_providers[0].invalidate()
+    mock_delete_password.assert_not_called()
+    assert fallback.credentials is not None
+
+
+def test_credential_provider_platform_no_credentials(mocker):
+    mocker.patch("keyring.get_password", return_value=None)
+    mocker.patch("keyring.get_keyring")
+    credential_provider = CredentialProvider(environ={}, platform="myarlo")
+
+    assert not credential_provider.has_credentials()
+
+
 @pytest.fixture
 def loading_spinner():
     return LoadingSpinner(msg="Testing")
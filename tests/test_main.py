@@ -1,15 +1,39 @@
+import asyncio
+import httpx
 import pytest
+import sqlite3
+from collections import Counter
+from datetime import datetime
+from threading import Event
 from unittest.mock import AsyncMock
 
-from baa.main import baa
+from baa.main import (
+    baa,
+    baa_batch,
+    baa_platforms,
+    baa_watch,
+    create_attendance_summary,
+)
+from baa.arlo_api import ArloClient
 from baa.classes import ButterAttendee, ArloRegistration, AttendanceStatus
-from baa.exceptions import AttendeeFileProcessingError
+from baa.exceptions import (
+    AttendeeFileProcessingError,
+    AuthenticationFailed,
+    CircuitOpen,
+    SessionNotFound,
+)
+from baa.helpers import CredentialProvider
+from tests.fake_arlo import FakeArlo
 
 
 @pytest.fixture
 def mock_arlo_client(mocker):
-    mock_arlo_client = mocker.patch("baa.main.ArloClient")
+    mocker.patch("baa.api.MetadataCache")
+    mock_arlo_client = mocker.patch("baa.api.ArloClient")
     mock_arlo_client.return_value.close = AsyncMock()
+    mock_arlo_client.return_value.preconnect = AsyncMock()
+    mock_arlo_client.return_value.aget_event_name = AsyncMock(return_value="Event")
+    mock_arlo_client.return_value.aget_session_name = AsyncMock(return_value="Session")
     return mock_arlo_client
 
 
@@ -34,6 +58,14 @@ def mock_meeting(mocker):
     return mock_meeting
 
 
+def registration_pages(*pages):
+    async def aget_registration_pages(event_code, session_date):
+        for page in pages:
+            yield page
+
+    return aget_registration_pages
+
+
 def setup_registration(mock_arlo_client, name):
     reg = ArloRegistration(
         name=name, email=name.split(" ")[0].lower() + "@example.com", reg_href="href"
@@ -41,21 +73,30 @@ def setup_registration(mock_arlo_client, name):
 
     mock_update_attnd = AsyncMock(return_value=True)
     mock_arlo_client.return_value.update_attendance = mock_update_attnd
-    mock_arlo_client.return_value.get_registrations.return_value = [reg]
+    mock_arlo_client.return_value.aget_registration_pages = registration_pages([reg])
 
     return reg, mock_update_attnd
 
 
-async def run_baa(tmp_path, min_duration=0, skip_absent=False, dry_run=False):
+async def run_baa(
+    tmp_path,
+    min_duration=0,
+    skip_absent=False,
+    dry_run=False,
+    event_code=None,
+    date=None,
+    **kwargs,
+):
     await baa(
         attendee_file=tmp_path / "test.csv",
         format="dummy_format",
         platform="dummy_platform",
-        event_code=None,
-        date=None,
+        event_code=event_code,
+        date=date,
         min_duration=min_duration,
         skip_absent=skip_absent,
         dry_run=dry_run,
+        **kwargs,
     )
 
 
@@ -126,7 +167,9 @@ async def test_baa_update_failed(mocker, mock_arlo_client, tmp_path):
     # Update attendance for first registration but fail on second
     mock_update_attnd = AsyncMock(side_effect=[True, False])
     mock_arlo_client.return_value.update_attendance = mock_update_attnd
-    mock_arlo_client.return_value.get_registrations.return_value = [reg1, reg2]
+    mock_arlo_client.return_value.aget_registration_pages = registration_pages(
+        [reg1], [reg2]
+    )
 
     await run_baa(tmp_path)
 
@@ -146,10 +189,505 @@ async def test_baa_closes_client_on_exception(mocker, mock_arlo_client, tmp_path
     mock_arlo_client.return_value.close = mock_close
 
     mocker.patch(
-        "baa.main.butter.get_attendees", side_effect=AttendeeFileProcessingError()
+        "baa.api.butter.get_attendees", side_effect=AttendeeFileProcessingError()
     )
 
     with pytest.raises(AttendeeFileProcessingError):
         await run_baa(tmp_path)
 
     mock_close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_baa_cache_error_not_hidden(mocker, mock_arlo_client, tmp_path):
+    mocker.patch(
+        "baa.api.MetadataCache", side_effect=sqlite3.OperationalError("disk I/O")
+    )
+
+    with pytest.raises(sqlite3.OperationalError):
+        await run_baa(tmp_path)
+
+    mock_arlo_client.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_baa_closes_cache_on_client_error(mocker, mock_arlo_client, tmp_path):
+    mock_cache = mocker.patch("baa.api.MetadataCache")
+    mock_arlo_client.side_effect = ValueError()
+
+    with pytest.raises(ValueError):
+        await run_baa(tmp_path)
+
+    mock_cache.return_value.close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_baa_cache_disabled(mocker, mock_arlo_client, tmp_path):
+    mock_cache = mocker.patch("baa.api.MetadataCache")
+    setup_registration(mock_arlo_client, "Maya Angelou")
+
+    await run_baa(tmp_path, cache_ttl=0)
+
+    mock_cache.assert_not_called()
+    assert mock_arlo_client.call_args.kwargs["cache"] is None
+
+
+@pytest.mark.asyncio
+async def test_baa_updates_page_while_next_page_downloads(mock_arlo_client, tmp_path):
+    reg1 = ArloRegistration(
+        name="Maya Angelou", email="maya@example.com", reg_href="href1"
+    )
+    reg2 = ArloRegistration(
+        name="Amelia Earhart", email="amelia@example.com", reg_href="href2"
+    )
+    first_update_sent = asyncio.Event()
+
+    async def aget_registration_pages(event_code, session_date):
+        yield [reg1]
+        # Second page only arrives once the first page has been updated
+        await asyncio.wait_for(first_update_sent.wait(), timeout=5)
+        yield [reg2]
+
+    async def update_attendance(reg_href, attendance):
+        first_update_sent.set()
+        return True
+
+    mock_arlo_client.return_value.update_attendance = AsyncMock(
+        side_effect=update_attendance
+    )
+    mock_arlo_client.return_value.aget_registration_pages = aget_registration_pages
+
+    await run_baa(tmp_path)
+
+    assert reg1.attendance_registered and reg2.attendance_registered
+
+
+@pytest.mark.asyncio
+async def test_baa_fetches_registrations_while_names_are_looked_up(
+    mock_arlo_client, tmp_path
+):
+    reg = ArloRegistration(name="Maya Angelou", email="maya@example.com", reg_href="")
+    registrations_requested = asyncio.Event()
+
+    async def aget_event_name(event_code):
+        # Only resolves once registrations have been requested
+        await asyncio.wait_for(registrations_requested.wait(), timeout=5)
+        return "Event"
+
+    async def aget_registration_pages(event_code, session_date):
+        registrations_requested.set()
+        yield [reg]
+
+    mock_arlo_client.return_value.aget_event_name = aget_event_name
+    mock_arlo_client.return_value.aget_registration_pages = aget_registration_pages
+    mock_arlo_client.return_value.update_attendance = AsyncMock(return_value=True)
+
+    await run_baa(tmp_path)
+
+    assert reg.attendance_registered
+
+
+@pytest.mark.asyncio
+async def test_baa_resolves_session_while_file_is_parsed(
+    mocker, mock_arlo_client, mock_meeting, tmp_path
+):
+    session_lookup_started = Event()
+
+    def get_attendees(attendee_file, event_code):
+        # Parsing only finishes once the session lookup has started
+        assert session_lookup_started.wait(timeout=5)
+        return mock_meeting
+
+    async def aget_session_name(event_code, session_date):
+        session_lookup_started.set()
+        return "Session"
+
+    mocker.patch("baa.api.butter.get_attendees", side_effect=get_attendees)
+    mock_arlo_client.return_value.aget_session_name = aget_session_name
+    mock_arlo_client.return_value.aget_registration_pages = registration_pages()
+
+    await run_baa(tmp_path, event_code="CK24ABC", date=datetime(2024, 1, 1))
+
+
+@pytest.mark.asyncio
+async def test_baa_ambiguous_match(mocker, mock_arlo_client, mock_meeting, tmp_path):
+    mock_notify = mocker.patch("baa.main.notify_ambiguous_matches")
+    # Name matches the second attendee, but email matches the first
+    reg = ArloRegistration(
+        name="Amelia Earhart", email="maya@example.com", reg_href="href"
+    )
+    mock_arlo_client.return_value.update_attendance = AsyncMock(return_value=True)
+    mock_arlo_client.return_value.aget_registration_pages = registration_pages([reg])
+
+    await run_baa(tmp_path)
+
+    ambiguous_matches = mock_notify.call_args.args[0]
+    assert ambiguous_matches[0].registration is reg
+    assert ambiguous_matches[0].attendees == mock_meeting.attendees
+    assert mock_meeting.attendees[0].attendance_registered
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fuzzy", ["suggest", "apply"])
+async def test_baa_fuzzy_match(mocker, mock_arlo_client, mock_meeting, tmp_path, fuzzy):
+    mock_notify = mocker.patch("baa.main.notify_fuzzy_matches")
+    reg, mock_update_attnd = setup_registration(mock_arlo_client, "Angelou Maya")
+    reg.email = "maya.angelou@example.com"
+
+    await run_baa(tmp_path, fuzzy=fuzzy)
+
+    fuzzy_matches = mock_notify.call_args.args[0]
+    assert fuzzy_matches[0].registration is reg
+    assert fuzzy_matches[0].attendee is mock_meeting.attendees[0]
+    if fuzzy == "suggest":
+        # Suggested matches are left for review
+        assert not reg.attendance_registered
+        mock_update_attnd.assert_not_called()
+    else:
+        assert reg.attendance_registered
+        mock_update_attnd.assert_called_once_with(
+            reg.reg_href, AttendanceStatus.ATTENDED
+        )
+
+
+@pytest.mark.asyncio
+async def test_baa_reports_retries(mocker, mock_arlo_client, tmp_path):
+    mock_notify = mocker.patch("baa.main.notify_retries")
+    setup_registration(mock_arlo_client, "Maya Angelou")
+    mock_arlo_client.return_value.retry_policy.retries = Counter({"GET": 2})
+
+    await run_baa(tmp_path)
+
+    mock_notify.assert_called_once_with(Counter({"GET": 2}))
+
+
+@pytest.mark.asyncio
+async def test_baa_reports_updates_not_attempted(mocker, mock_arlo_client, tmp_path):
+    mock_notify_failed = mocker.patch("baa.main.notify_failed_update")
+    mock_notify_not_attempted = mocker.patch("baa.main.notify_not_attempted")
+    reg1 = ArloRegistration(
+        name="Maya Angelou", email="maya@example.com", reg_href="href1"
+    )
+    reg2 = ArloRegistration(
+        name="Amelia Earhart", email="amelia@example.com", reg_href="href2"
+    )
+    mock_arlo_client.return_value.update_attendance = AsyncMock(
+        side_effect=[False, CircuitOpen()]
+    )
+    mock_arlo_client.return_value.aget_registration_pages = registration_pages(
+        [reg1, reg2]
+    )
+
+    await run_baa(tmp_path, max_concurrency=1)
+
+    assert mock_notify_failed.call_args.args[0].registration is reg1
+    mock_notify_not_attempted.assert_called_once_with([reg2])
+    assert reg1.attendance_registered is None and reg2.attendance_registered is None
+
+
+@pytest.mark.asyncio
+async def test_baa_skips_unchanged_attendance(mock_arlo_client, tmp_path):
+    unchanged = ArloRegistration(
+        name="Maya Angelou",
+        email="maya@example.com",
+        reg_href="href1",
+        current_attendance=AttendanceStatus.ATTENDED,
+    )
+    changed = ArloRegistration(
+        name="Edith Clarke",
+        email="edith@example.com",
+        reg_href="href2",
+        current_attendance=AttendanceStatus.ATTENDED,
+    )
+    mock_update_attnd = AsyncMock(return_value=True)
+    mock_arlo_client.return_value.update_attendance = mock_update_attnd
+    mock_arlo_client.return_value.aget_registration_pages = registration_pages(
+        [unchanged, changed]
+    )
+
+    await run_baa(tmp_path)
+
+    mock_update_attnd.assert_called_once_with(
+        changed.reg_href, AttendanceStatus.DID_NOT_ATTEND
+    )
+    assert unchanged.attendance_registered
+
+
+@pytest.mark.asyncio
+async def test_baa_batch(mocker, mock_arlo_client, mock_meeting, tmp_path, capsys):
+    def get_attendees(attendee_file, event_code):
+        if attendee_file.name == "invalid.csv":
+            raise AttendeeFileProcessingError("🚨 Unable to process invalid.csv")
+        return mock_meeting
+
+    mocker.patch("baa.api.butter.get_attendees", side_effect=get_attendees)
+    reg, mock_update_attnd = setup_registration(mock_arlo_client, "Maya Angelou")
+    attendee_files = [tmp_path / "valid.csv", tmp_path / "invalid.csv"]
+
+    results = await baa_batch(
+        attendee_files, "butter", "dummy_platform", None, [], 0, False, False
+    )
+
+    # One client is shared by every file
+    mock_arlo_client.assert_called_once()
+    mock_arlo_client.return_value.close.assert_awaited_once()
+    assert [result.attendee_file for result in results] == attendee_files
+    assert results[0].registrations == [reg] and results[0].error is None
+    assert isinstance(results[1].error, AttendeeFileProcessingError)
+    mock_update_attnd.assert_called_once_with(reg.reg_href, AttendanceStatus.ATTENDED)
+    output = capsys.readouterr().out
+    assert "Unable to process invalid.csv" in output
+    assert "valid.csv" in output
+
+
+@pytest.mark.asyncio
+async def test_baa_batch_dates(mocker, mock_arlo_client, mock_meeting, tmp_path):
+    mock_meeting.start_date = datetime(2024, 1, 3)
+    mock_aget_sessions = AsyncMock()
+    mock_arlo_client.return_value.aget_sessions_on_dates = mock_aget_sessions
+    setup_registration(mock_arlo_client, "Maya Angelou")
+    dates = [datetime(2024, 1, 1), datetime(2024, 1, 2)]
+
+    results = await baa_batch(
+        [tmp_path / "day3.csv"], "butter", "platform", "CK24ABC", dates, 0, False, False
+    )
+
+    mock_aget_sessions.assert_awaited_once_with("CK24ABC", dates)
+    # The meeting date of the file is not one of the dates given
+    assert isinstance(results[0].error, SessionNotFound)
+
+    mock_meeting.start_date = datetime(2024, 1, 2)
+    results = await baa_batch(
+        [tmp_path / "day2.csv"], "butter", "platform", "CK24ABC", dates, 0, False, False
+    )
+
+    assert results[0].error is None
+    assert results[0].session_date == datetime(2024, 1, 2)
+
+
+@pytest.mark.asyncio
+async def test_baa_platforms(mocker, mock_arlo_client, tmp_path, capsys):
+    arlo_clients = {}
+
+    def create_client(platform, cache, max_concurrency, credential_provider):
+        arlo_client = mocker.MagicMock(platform=platform)
+        arlo_client.close = AsyncMock()
+        arlo_client.preconnect = AsyncMock()
+        arlo_client.aget_event_name = AsyncMock(return_value=f"{platform} event")
+        arlo_client.aget_session_name = AsyncMock(return_value="Session")
+        arlo_client.update_attendance = AsyncMock(return_value=True)
+        arlo_client.aget_registration_pages = registration_pages(
+            [ArloRegistration(name="Maya Angelou", email="", reg_href=platform)]
+        )
+        arlo_client.retry_policy.retries = Counter({"GET": 1})
+        arlo_clients[platform] = arlo_client
+        return arlo_client
+
+    mock_arlo_client.side_effect = create_client
+    credential_provider = mocker.Mock()
+
+    results = await baa_platforms(
+        {"first": [tmp_path / "a.csv"], "second": [tmp_path / "b.csv"]},
+        "butter",
+        None,
+        [],
+        0,
+        False,
+        False,
+        platform_concurrency={"second": 2},
+        credential_providers={"first": credential_provider},
+    )
+
+    # Each platform has its own client, with its own limits and credentials
+    assert mock_arlo_client.call_args_list == [
+        mocker.call(
+            "first",
+            cache=mocker.ANY,
+            max_concurrency=8,
+            credential_provider=credential_provider,
+        ),
+        mocker.call(
+            "second", cache=mocker.ANY, max_concurrency=2, credential_provider=None
+        ),
+    ]
+    for platform, arlo_client in arlo_clients.items():
+        arlo_client.update_attendance.assert_awaited_once_with(
+            platform, AttendanceStatus.ATTENDED
+        )
+        arlo_client.close.assert_awaited_once()
+        assert results[platform][0].platform == platform
+        assert results[platform][0].event_name == f"{platform} event"
+
+    output = capsys.readouterr().out
+    assert "Platform" in output
+    # Retries of every platform are reported together
+    assert "Retried 2 requests" in output
+
+
+@pytest.mark.asyncio
+async def test_baa_platforms_authentication_failed(mocker, tmp_path, capsys):
+    good_arlo = FakeArlo.with_catalogue(1)
+    good_arlo.add_registrations("100000", 4)
+    rejected = []
+
+    def create_client(platform, **kwargs):
+        arlo_client = ArloClient(platform, **kwargs)
+        if platform == "good":
+            transport = good_arlo.async_transport()
+        else:
+            transport = httpx.MockTransport(
+                lambda request: rejected.append(request) or httpx.Response(401)
+            )
+        arlo_client.async_client = httpx.AsyncClient(
+            auth=arlo_client.auth, transport=transport
+        )
+        return arlo_client
+
+    mocker.patch("baa.api.ArloClient", side_effect=create_client)
+    environ = {"BAA_ARLO_USERNAME": "user", "BAA_ARLO_PASSWORD": "pass"}
+
+    results = await baa_platforms(
+        {"good": [tmp_path / "a.csv"], "bad": [tmp_path / "b.csv"]},
+        "butter",
+        "CK00000",
+        [datetime(2024, 1, 1)],
+        0,
+        False,
+        False,
+        cache_ttl=0,
+        credential_providers={
+            platform: CredentialProvider(environ=environ)
+            for platform in ("good", "bad")
+        },
+    )
+
+    # The updates sent to the good platform are reported, and the bad platform's files fail
+    assert results["good"][0].error is None and len(results["good"][0].updated) == 4
+    assert sum(request.method == "PATCH" for request in good_arlo.requests) == 4
+    assert isinstance(results["bad"][0].error, AuthenticationFailed)
+    assert results["bad"][0].platform == "bad"
+    assert rejected
+    output = capsys.readouterr().out
+    assert "good" in output and "bad" in output
+
+
+async def run_baa_watch(directory, until, dry_run=False):
+    stop = asyncio.Event()
+    watch = asyncio.create_task(
+        baa_watch(
+            directory,
+            "butter",
+            "platform",
+            0,
+            False,
+            dry_run,
+            poll_interval=0.01,
+            settle_time=0,
+            stop=stop,
+        )
+    )
+    while not until() and not watch.done():
+        await asyncio.sleep(0.01)
+    stop.set()
+    await asyncio.wait_for(watch, 1)
+
+
+@pytest.mark.asyncio
+async def test_baa_watch(mocker, mock_arlo_client, mock_meeting, tmp_path, capsys):
+    def get_attendees(attendee_file, event_code):
+        if attendee_file.name == "invalid.csv":
+            raise AttendeeFileProcessingError("🚨 Unable to process invalid.csv")
+        return mock_meeting
+
+    mocker.patch("baa.api.butter.get_attendees", side_effect=get_attendees)
+    reg, mock_update_attnd = setup_registration(mock_arlo_client, "Maya Angelou")
+    (tmp_path / "valid.csv").write_text("temp", encoding="utf-8")
+    (tmp_path / "invalid.csv").write_text("temp", encoding="utf-8")
+    done, failed = tmp_path / "done" / "valid.csv", tmp_path / "failed" / "invalid.csv"
+
+    await run_baa_watch(tmp_path, lambda: done.exists() and failed.exists())
+
+    assert done.exists() and failed.exists()
+    # One client is kept for every file
+    mock_arlo_client.assert_called_once()
+    mock_arlo_client.return_value.close.assert_awaited_once()
+    mock_update_attnd.assert_called_once_with(reg.reg_href, AttendanceStatus.ATTENDED)
+    assert "Unable to process invalid.csv" in capsys.readouterr().out
+
+
+@pytest.mark.asyncio
+async def test_baa_watch_dry_run(mock_arlo_client, tmp_path, capsys):
+    setup_registration(mock_arlo_client, "Maya Angelou")
+    attendee_file = tmp_path / "valid.csv"
+    attendee_file.write_text("temp", encoding="utf-8")
+
+    await run_baa_watch(
+        tmp_path, lambda: "Attendance to be changed" in capsys.readouterr().out, True
+    )
+
+    # Files are left in the folder in a dry run
+    assert attendee_file.exists()
+    mock_arlo_client.return_value.update_attendance.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_baa_watch_authentication_failed(mock_arlo_client, tmp_path):
+    mock_arlo_client.return_value.aget_event_name = AsyncMock(
+        side_effect=AuthenticationFailed()
+    )
+    mock_arlo_client.return_value.aget_registration_pages = registration_pages()
+    attendee_file = tmp_path / "valid.csv"
+    attendee_file.write_text("temp", encoding="utf-8")
+
+    # Authentication failing would fail every file, so watching stops
+    with pytest.raises(AuthenticationFailed):
+        await run_baa_watch(tmp_path, lambda: False)
+
+    assert attendee_file.exists()
+    mock_arlo_client.return_value.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_baa_watch_unexpected_error(
+    mocker, mock_arlo_client, mock_meeting, tmp_path, capsys
+):
+    def get_attendees(attendee_file, event_code):
+        if attendee_file.name == "broken.csv":
+            raise RuntimeError("Unexpected")
+        return mock_meeting
+
+    mocker.patch("baa.api.butter.get_attendees", side_effect=get_attendees)
+    setup_registration(mock_arlo_client, "Maya Angelou")
+    (tmp_path / "broken.csv").write_text("temp", encoding="utf-8")
+    (tmp_path / "valid.csv").write_text("temp", encoding="utf-8")
+    done, failed = tmp_path / "done" / "valid.csv", tmp_path / "failed" / "broken.csv"
+
+    await run_baa_watch(tmp_path, lambda: done.exists() and failed.exists())
+
+    # Errors that would not fail every file only fail the file, and watching continues
+    assert done.exists() and failed.exists()
+    assert "Unexpected error processing broken.csv" in capsys.readouterr().out
+
+
+def test_create_attendance_summary():
+    registrations = [
+        ArloRegistration(
+            name="Unchanged",
+            email="",
+            reg_href="",
+            attendance_registered=True,
+            current_attendance=AttendanceStatus.ATTENDED,
+        ),
+        ArloRegistration(name="Changed", email="", reg_href=""),
+        ArloRegistration(
+            name="Failed", email="", reg_href="", attendance_registered=None
+        ),
+    ]
+
+    assert (
+        create_attendance_summary(registrations, dry_run=False)
+        == "Attendance changed: 1, unchanged: 1, failed: 1"
+    )
+    assert create_attendance_summary(registrations, dry_run=True).startswith(
+        "Attendance to be changed: 1"
+    )
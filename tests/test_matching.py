@@ -0,0 +1,129 @@
+import pytest
+import random
+
+from baa.classes import ArloRegistration, ButterAttendee
+from baa.matching import AttendeeIndex, FuzzyMatcher
+
+
+@pytest.fixture
+def meeting_attendees():
+    return [
+        ButterAttendee(name="Ada Lo", email="ada@example.com", session_duration=105.24),
+        ButterAttendee(
+            name="Mary Shelley", email="mry@example.com", session_duration=120.0
+        ),
+        ButterAttendee(
+            name="Grace Hopper", email="grace@example.com", session_duration=90.0
+        ),
+    ]
+
+
+def test_match_by_email(meeting_attendees):
+    reg = ArloRegistration(name="Ada Lovelace", email="ADA@example.com", reg_href="")
+    assert AttendeeIndex(meeting_attendees).match(reg) is meeting_attendees[0]
+
+
+def test_match_by_name(meeting_attendees):
+    reg = ArloRegistration(name="mary shelley", email="mary@example.com", reg_href="")
+    assert AttendeeIndex(meeting_attendees).match(reg) is meeting_attendees[1]
+
+
+def test_no_match(meeting_attendees):
+    reg = ArloRegistration(name="Edith Clarke", email="edith@example.com", reg_href="")
+    assert AttendeeIndex(meeting_attendees).match(reg) is None
+
+
+def test_ambiguous_match(meeting_attendees):
+    attendee_index = AttendeeIndex(meeting_attendees)
+    # Name matches the third attendee, but email matches the second
+    reg = ArloRegistration(name="Grace Hopper", email="mry@example.com", reg_href="")
+
+    assert attendee_index.match(reg) is meeting_attendees[1]
+    assert len(attendee_index.ambiguous_matches) == 1
+    assert attendee_index.ambiguous_matches[0].registration is reg
+    assert attendee_index.ambiguous_matches[0].attendees == [
+        meeting_attendees[1],
+        meeting_attendees[2],
+    ]
+
+
+def test_matches_registration_equality():
+    rng = random.Random(0)
+    names = ["Ada Lovelace", "ada lovelace", "Mary Shelley", "Grace Hopper", "Edith"]
+    emails = ["ada@example.com", "ADA@example.com", "mary@example.com", "g@x.com"]
+    attendees = [
+        ButterAttendee(
+            name=rng.choice(names), email=rng.choice(emails), session_duration=1
+        )
+        for _ in range(20)
+    ]
+    attendee_index = AttendeeIndex(attendees)
+
+    for _ in range(200):
+        reg = ArloRegistration(
+            name=rng.choice(names), email=rng.choice(emails), reg_href=""
+        )
+        # Previous behaviour, scanning the attendees with ArloRegistration.__eq__
+        expected = attendees[attendees.index(reg)] if reg in attendees else None
+        assert attendee_index.match(reg) is expected
+
+
+@pytest.mark.parametrize(
+    "name, email",
+    [
+        ("Lo Ada", "ada.lo@work.com"),
+        ("Máry Shélley", "shelley@work.com"),
+        ("Gracie Hopper", "gh@work.com"),
+        ("Someone Else", "grcae@example.com"),
+    ],
+    ids=["swapped names", "diacritics", "typo in name", "typo in email"],
+)
+def test_fuzzy_match(meeting_attendees, name, email):
+    reg = ArloRegistration(name=name, email=email, reg_href="")
+    matches = FuzzyMatcher(threshold=0.8).match([reg], meeting_attendees)
+
+    assert len(matches) == 1
+    assert matches[0].registration is reg
+    assert (
+        matches[0].attendee
+        is {
+            "Lo Ada": meeting_attendees[0],
+            "Máry Shélley": meeting_attendees[1],
+            "Gracie Hopper": meeting_attendees[2],
+            "Someone Else": meeting_attendees[2],
+        }[name]
+    )
+    assert 0.8 <= matches[0].score <= 1
+
+
+def test_fuzzy_match_nickname():
+    attendee = ButterAttendee(
+        name="Robert Smith", email="rs@example.com", session_duration=1
+    )
+    reg = ArloRegistration(name="Bob Smith", email="bob@work.com", reg_href="")
+
+    matches = FuzzyMatcher().match([reg], [attendee])
+
+    assert matches[0].attendee is attendee
+    assert matches[0].score == 1
+
+
+def test_fuzzy_match_below_threshold(meeting_attendees):
+    reg = ArloRegistration(name="Edith Clarke", email="edith@work.com", reg_href="")
+    matcher = FuzzyMatcher()
+
+    assert matcher.match([reg], meeting_attendees) == []
+    assert matcher.matches == []
+
+
+def test_fuzzy_match_one_to_one():
+    attendee = ButterAttendee(
+        name="Grace Hopper", email="grace@example.com", session_duration=1
+    )
+    closest = ArloRegistration(name="Grace Hoper", email="g@work.com", reg_href="")
+    other = ArloRegistration(name="Grace Hopp", email="gh@work.com", reg_href="")
+
+    matches = FuzzyMatcher(threshold=0.8).match([other, closest], [attendee])
+
+    # Highest scoring registration is matched first, the attendee is not reused
+    assert [match.registration for match in matches] == [closest]
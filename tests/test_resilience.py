@@ -0,0 +1,293 @@
+import asyncio
+import httpx
+import pytest
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from baa.exceptions import CircuitOpen
+from baa.resilience import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    RetryPolicy,
+    parse_retry_after,
+)
+
+
+def responses(*status_codes, headers=None):
+    responses = iter(status_codes)
+
+    async def send():
+        status_code = next(responses)
+        if isinstance(status_code, Exception):
+            raise status_code
+        return httpx.Response(status_code, headers=headers)
+
+    return send
+
+
+@pytest.fixture
+def mock_sleep(mocker):
+    return mocker.patch("baa.resilience.asyncio.sleep")
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_failures(mock_sleep):
+    retry_policy = RetryPolicy(base_delay=0.1)
+
+    res = await retry_policy.asend("GET", "url", responses(503, 429, 200))
+
+    assert res.status_code == 200
+    assert mock_sleep.call_count == 2
+    assert retry_policy.retries == {"GET": 2}
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_client_errors(mock_sleep):
+    retry_policy = RetryPolicy()
+
+    res = await retry_policy.asend("GET", "url", responses(404, 200))
+
+    assert res.status_code == 404
+    mock_sleep.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_retries_connection_errors(mock_sleep):
+    error = httpx.ConnectError("Connection refused")
+    retry_policy = RetryPolicy(max_attempts=2)
+
+    res = await retry_policy.asend("GET", "url", responses(error, 200))
+
+    assert res.status_code == 200
+    with pytest.raises(httpx.ConnectError):
+        await retry_policy.asend("GET", "url", responses(error, error))
+
+
+@pytest.mark.asyncio
+async def test_stops_after_max_attempts(mock_sleep):
+    retry_policy = RetryPolicy(max_attempts=3)
+
+    res = await retry_policy.asend("GET", "url", responses(500, 502, 503, 200))
+
+    assert res.status_code == 503
+    assert retry_policy.retries == {"GET": 2}
+
+
+def test_exponential_backoff_with_jitter(mocker):
+    mock_uniform = mocker.patch("baa.resilience.random.uniform", return_value=0)
+    retry_policy = RetryPolicy(base_delay=0.5, max_delay=3)
+
+    for attempt in range(1, 5):
+        retry_policy.backoff(attempt)
+
+    assert [call.args for call in mock_uniform.call_args_list] == [
+        (0, 0.5),
+        (0, 1.0),
+        (0, 2.0),
+        (0, 3),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_honours_retry_after(mock_sleep):
+    retry_policy = RetryPolicy(base_delay=0.1)
+
+    await retry_policy.asend(
+        "GET", "url", responses(429, 200, headers={"Retry-After": "7"})
+    )
+
+    mock_sleep.assert_called_once_with(7.0)
+
+
+def test_parse_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    res = httpx.Response(
+        503, headers={"Retry-After": format_datetime(retry_at, usegmt=True)}
+    )
+
+    assert 28 <= parse_retry_after(res) <= 30
+    assert parse_retry_after(httpx.Response(503)) is None
+    assert parse_retry_after(httpx.Response(503, headers={"Retry-After": "x"})) is None
+
+
+@pytest.mark.asyncio
+async def test_retry_budget_is_shared(mock_sleep):
+    retry_policy = RetryPolicy(budget=10)
+    headers = {"Retry-After": "6"}
+
+    first = await retry_policy.asend("GET", "url", responses(503, 200, headers=headers))
+    second = await retry_policy.asend(
+        "GET", "url", responses(503, 200, headers=headers)
+    )
+
+    # Second retry would exceed the remaining budget of 4 seconds
+    assert first.status_code == 200 and second.status_code == 503
+    assert retry_policy.retries == {"GET": 1}
+
+
+@pytest.mark.asyncio
+async def test_retry_budget_refills_after_window(mocker, mock_sleep):
+    mock_monotonic = mocker.patch("baa.resilience.time.monotonic", return_value=0)
+    retry_policy = RetryPolicy(budget=10, budget_window=60)
+    headers = {"Retry-After": "6"}
+
+    await retry_policy.asend("GET", "url", responses(503, 200, headers=headers))
+    mock_monotonic.return_value = 30
+    within_window = await retry_policy.asend(
+        "GET", "url", responses(503, 200, headers=headers)
+    )
+    mock_monotonic.return_value = 61
+    after_window = await retry_policy.asend(
+        "GET", "url", responses(503, 200, headers=headers)
+    )
+
+    # Waits before the window no longer count against the budget
+    assert within_window.status_code == 503 and after_window.status_code == 200
+    assert retry_policy.remaining_budget() == 4
+
+
+def test_limiter_increases_while_healthy():
+    limiter = AdaptiveLimiter("Test", max_limit=4, initial=2)
+
+    for _ in range(20):
+        limiter.record(time.monotonic(), 0.01, congested=False)
+
+    assert limiter.limit == 4
+    assert [limit for _, limit in limiter.history] == [2, 3, 4]
+
+
+def test_limiter_decreases_once_per_window():
+    limiter = AdaptiveLimiter("Test", max_limit=16, initial=16)
+    started = time.monotonic()
+
+    # Requests sent before the first decrease do not decrease the limit again
+    for _ in range(5):
+        limiter.record(started, 0.01, congested=True)
+    assert limiter.limit == 8
+
+    limiter.record(time.monotonic(), 0.01, congested=True)
+    assert limiter.limit == 4
+
+
+def test_limiter_decreases_on_latency_spike():
+    limiter = AdaptiveLimiter("Test", max_limit=16, initial=8)
+    for _ in range(5):
+        limiter.record(time.monotonic(), 0.05, congested=False)
+    limit = limiter.limit
+
+    limiter.record(time.monotonic(), 1.0, congested=False)
+
+    assert limiter.limit == limit // 2
+
+
+def test_limiter_respects_min_limit():
+    limiter = AdaptiveLimiter("Test", max_limit=8, initial=2, min_limit=2)
+
+    limiter.record(time.monotonic(), 0.01, congested=True)
+
+    assert limiter.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_limiter_limits_requests_in_flight():
+    limiter = AdaptiveLimiter("Test", max_limit=8, initial=8)
+    in_flight = []
+
+    async def send():
+        in_flight.append(limiter.in_flight)
+        await asyncio.sleep(0.01)
+        return httpx.Response(429)
+
+    await asyncio.gather(*(limiter.asend(send) for _ in range(16)))
+
+    # Throttled responses cut the limit for later requests
+    assert max(in_flight) == 8
+    assert in_flight[-1] < 8
+    assert limiter.limit < 8
+
+
+async def failing_breaker(mocker, **kwargs):
+    breaker = CircuitBreaker(min_requests=4, window=4, reset_timeout=30, **kwargs)
+    mock_time = mocker.patch("baa.resilience.time.monotonic", return_value=100.0)
+    for _ in range(4):
+        with pytest.raises(httpx.ConnectError):
+            await breaker.asend(responses(httpx.ConnectError("Connection refused")))
+    return breaker, mock_time
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_failure_ratio(mocker):
+    breaker, _ = await failing_breaker(mocker)
+    send = mocker.AsyncMock()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        await breaker.asend(send)
+    send.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_breaker_stays_closed_below_failure_ratio():
+    breaker = CircuitBreaker(failure_ratio=0.5, min_requests=4, window=4)
+
+    for status_code in (500, 200, 404, 200, 503):
+        await breaker.asend(responses(status_code))
+
+    # Client errors are counted as successes, as Arlo is responding
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_breaker_half_open_probe_closes_circuit(mocker):
+    breaker, mock_time = await failing_breaker(mocker)
+    mock_time.return_value = 131.0
+
+    assert (await breaker.asend(responses(200))).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_breaker_half_open_probe_failure_reopens_circuit(mocker):
+    breaker, mock_time = await failing_breaker(mocker)
+    mock_time.return_value = 131.0
+
+    await breaker.asend(responses(503))
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        await breaker.asend(responses(200))
+
+
+@pytest.mark.asyncio
+async def test_breaker_limits_half_open_probes(mocker):
+    breaker, mock_time = await failing_breaker(mocker, half_open_probes=1)
+    mock_time.return_value = 131.0
+    probe_sent = asyncio.Event()
+    probe_done = asyncio.Event()
+
+    async def probe():
+        probe_sent.set()
+        await probe_done.wait()
+        return httpx.Response(200)
+
+    probe_task = asyncio.create_task(breaker.asend(probe))
+    await probe_sent.wait()
+    # Only one probe is sent while half-open
+    with pytest.raises(CircuitOpen):
+        await breaker.asend(probe)
+
+    probe_done.set()
+    await probe_task
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_retry_not_sent_by_breaker_reports_previous_failure(mock_sleep):
+    retry_policy = RetryPolicy()
+
+    res = await retry_policy.asend("GET", "url", responses(503, CircuitOpen()))
+
+    assert res.status_code == 503
+    with pytest.raises(CircuitOpen):
+        await retry_policy.asend("GET", "url", responses(CircuitOpen()))
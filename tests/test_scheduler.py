@@ -0,0 +1,91 @@
+import asyncio
+import httpx
+import pytest
+
+from baa.classes import ArloRegistration, AttendanceStatus
+from baa.exceptions import CircuitOpen
+from baa.scheduler import WriteScheduler
+from tests.fake_arlo import BASE_URL
+
+
+pytestmark = pytest.mark.catalogue(registrations=40, write_latency=0.01)
+
+
+def registrations(fake_arlo):
+    return [
+        ArloRegistration(
+            name=f"{reg.first_name} {reg.last_name}",
+            email=reg.email,
+            reg_href=f"{BASE_URL}/registrations/{reg.reg_id}/sessionregistrations/{reg.reg_id}",
+            attendance_registered=i % 2 == 0,
+        )
+        for i, reg in enumerate(fake_arlo.registrations["100000"])
+    ]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_requests_in_flight(arlo_client, fake_arlo):
+    async with WriteScheduler(arlo_client, max_concurrency=4) as scheduler:
+        for reg in registrations(fake_arlo):
+            scheduler.submit(reg)
+
+    assert fake_arlo.max_in_flight == 4
+    assert len(scheduler.results) == 40
+    assert all(result.success for result in scheduler.results)
+    assert [reg.attendance for reg in fake_arlo.registrations["100000"]] == [
+        "Attended" if i % 2 == 0 else "DidNotAttend" for i in range(40)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_records_failures(mocker, arlo_client):
+    error = httpx.ConnectError("Connection refused")
+    arlo_client.update_attendance = mocker.AsyncMock(side_effect=[True, False, error])
+    regs = [
+        ArloRegistration(name=name, email="", reg_href=name, attendance_registered=True)
+        for name in ("success", "failure", "error")
+    ]
+
+    async with WriteScheduler(arlo_client, max_concurrency=1) as scheduler:
+        for reg in regs:
+            scheduler.submit(reg)
+
+    assert [(r.registration, r.success, r.error) for r in scheduler.results] == [
+        (regs[0], True, None),
+        (regs[1], False, None),
+        (regs[2], False, error),
+    ]
+    assert all(r.attempted for r in scheduler.results)
+    assert all(r.attendance == AttendanceStatus.ATTENDED for r in scheduler.results)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_cancels_updates_on_exception(arlo_client, fake_arlo):
+    with pytest.raises(RuntimeError):
+        async with WriteScheduler(arlo_client, max_concurrency=1) as scheduler:
+            for reg in registrations(fake_arlo):
+                scheduler.submit(reg)
+            await asyncio.sleep(0)
+            raise RuntimeError()
+
+    assert all(worker.done() for worker in scheduler.workers)
+    assert len(scheduler.results) < 40
+
+
+@pytest.mark.asyncio
+async def test_scheduler_records_updates_not_attempted(mocker, arlo_client):
+    error = CircuitOpen("Arlo is failing")
+    arlo_client.update_attendance = mocker.AsyncMock(side_effect=[False, error])
+    regs = [
+        ArloRegistration(name=name, email="", reg_href=name)
+        for name in ("failure", "not attempted")
+    ]
+
+    async with WriteScheduler(arlo_client, max_concurrency=1) as scheduler:
+        for reg in regs:
+            scheduler.submit(reg)
+
+    assert [(r.success, r.attempted, r.error) for r in scheduler.results] == [
+        (False, True, None),
+        (False, False, error),
+    ]
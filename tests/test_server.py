@@ -0,0 +1,221 @@
+import asyncio
+import httpx
+import pytest
+import pytest_asyncio
+from datetime import datetime
+
+from baa.server import AttendanceServer, JobOptions
+from tests.fake_arlo import write_attendee_file
+
+
+pytestmark = pytest.mark.catalogue(events=2, registrations=50)
+
+
+@pytest.fixture
+def report(tmp_path):
+    return write_attendee_file(
+        tmp_path / "report.csv", "CK00000", datetime(2024, 1, 1)
+    ).read_bytes()
+
+
+async def start_server(arlo_client, **kwargs):
+    server = AttendanceServer(arlo_client, **kwargs)
+    host, port = await server.start(port=0)
+    return server, httpx.AsyncClient(base_url=f"http://{host}:{port}")
+
+
+@pytest_asyncio.fixture
+async def server(arlo_client):
+    server, client = await start_server(arlo_client)
+    yield server, client
+    await client.aclose()
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_submit_and_wait(server, fake_arlo, report):
+    server, client = server
+
+    response = await client.post(
+        "/jobs", params={"filename": "report.csv", "wait": ""}, content=report
+    )
+
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "succeeded"
+    result = job["result"]
+    assert result["attendee_file"] == "report.csv"
+    assert result["event_code"] == "CK00000"
+    assert result["summary"] == {
+        "changed": 50,
+        "unchanged": 0,
+        "failed": 0,
+        "not_attempted": 0,
+        "matched": 25,
+        "unmatched_attendees": 0,
+        "unregistered_attendees": 0,
+    }
+    registrations = fake_arlo.registrations["100000"]
+    assert [reg.attendance for reg in registrations[:2]] == ["Attended", "DidNotAttend"]
+    # The uploaded report is removed once processed
+    assert list(server.upload_dir.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_submit_and_poll(server, fake_arlo, report):
+    server, client = server
+
+    response = await client.post("/jobs?dry-run&min-duration=90", content=report)
+
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ("queued", "running")
+    assert job["options"]["dry_run"] and job["options"]["min_duration"] == 90
+    assert response.headers["Location"] == f"/jobs/{job['id']}"
+
+    while job["status"] in ("queued", "running"):
+        await asyncio.sleep(0.01)
+        job = (await client.get(response.headers["Location"])).json()
+
+    assert job["status"] == "succeeded"
+    # Nobody attended for 90 minutes, and no records are updated in a dry run
+    assert {reg["attendance"] for reg in job["result"]["registrations"]} == {
+        "DidNotAttend"
+    }
+    assert all(reg.attendance == "Unknown" for reg in fake_arlo.registrations["100000"])
+
+    status = (await client.get("/status")).json()
+    assert status["succeeded"] == 1 and status["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_job(server, tmp_path):
+    server, client = server
+    report = write_attendee_file(
+        tmp_path / "report.csv", "CK99999", datetime(2024, 1, 1)
+    )
+
+    response = await client.post("/jobs?wait", content=report.read_bytes())
+
+    job = response.json()
+    assert job["status"] == "failed"
+    assert "CK99999" in job["error"]
+    assert (await client.get("/status")).json()["failed"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "method, url, content, status",
+    [
+        ("POST", "/jobs", b"", 400),
+        ("POST", "/jobs?unknown=1", b"report", 400),
+        ("POST", "/jobs?date=2024-13-01", b"report", 400),
+        ("POST", "/jobs?fuzzy-threshold=2", b"report", 400),
+        ("POST", "/jobs?filename=..", b"report", 400),
+        ("GET", "/jobs", None, 405),
+        ("GET", "/jobs/missing", None, 404),
+        ("GET", "/unknown", None, 404),
+    ],
+)
+async def test_invalid_requests(server, method, url, content, status):
+    server, client = server
+
+    response = await client.request(method, url, content=content)
+
+    assert response.status_code == status
+    assert response.json()["error"]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_and_queue_limits(arlo_client, fake_arlo, report):
+    fake_arlo.latency = 0.02
+    server, client = await start_server(arlo_client, max_jobs=1, max_queue=1)
+    try:
+        first = await client.post("/jobs", content=report)
+        while server.queue.qsize():
+            await asyncio.sleep(0.001)
+        # The first report is being processed, the second waits for it, and the third is rejected
+        second = await client.post("/jobs", content=report)
+        third = await client.post("/jobs", content=report)
+
+        assert [first.status_code, second.status_code, third.status_code] == [
+            202,
+            202,
+            503,
+        ]
+        status = (await client.get("/status")).json()
+        assert status["running"] == 1 and status["queued"] == 1
+
+        await server.queue.join()
+        assert (await client.get("/status")).json()["succeeded"] == 2
+    finally:
+        await client.aclose()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_submits_over_queue_limit(arlo_client, fake_arlo, report):
+    fake_arlo.latency = 0.02
+    server, client = await start_server(arlo_client, max_jobs=1, max_queue=1)
+    try:
+        # Reports uploaded together are all checked against the queue before any is written
+        responses = await asyncio.gather(
+            *(client.post("/jobs", content=report) for _ in range(4))
+        )
+
+        statuses = sorted(response.status_code for response in responses)
+        assert statuses[-1] == 503 and 202 in statuses
+        await server.queue.join()
+        # Rejected reports are not kept
+        assert len(server.jobs) == statuses.count(202)
+        assert list(server.upload_dir.iterdir()) == []
+    finally:
+        await client.aclose()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_expect_continue(server, report):
+    server, client = server
+    reader, writer = await asyncio.open_connection(
+        client.base_url.host, client.base_url.port
+    )
+
+    # Clients uploading large reports wait for the server to accept the headers before sending the body
+    writer.write(
+        f"POST /jobs?wait HTTP/1.1\r\nContent-Length: {len(report)}\r\nExpect: 100-continue\r\n\r\n".encode()
+    )
+    assert await reader.readuntil(b"\r\n\r\n") == b"HTTP/1.1 100 Continue\r\n\r\n"
+    writer.write(report)
+
+    assert (await reader.readline()).startswith(b"HTTP/1.1 200")
+    writer.close()
+    await writer.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_upload_too_large(server, mocker):
+    server, client = server
+    mocker.patch("baa.server.MAX_UPLOAD_SIZE", 10)
+
+    response = await client.post("/jobs", content=b"x" * 11)
+
+    assert response.status_code == 413
+    assert response.headers["Connection"] == "close"
+
+
+def test_job_options_with_query():
+    defaults = JobOptions(min_duration=30, dry_run=True)
+
+    options = defaults.with_query(
+        {"event_code": "CK24ABC", "date": "2024-01-02", "dry-run": "false"}
+    )
+
+    assert options == JobOptions(
+        event_code="CK24ABC",
+        date=datetime(2024, 1, 2),
+        min_duration=30,
+        dry_run=False,
+    )
+    with pytest.raises(ValueError):
+        defaults.with_query({"skip-absent": "maybe"})
@@ -0,0 +1,69 @@
+import os
+import time
+import pytest
+
+from baa.watcher import FolderWatcher
+
+
+def write_file(path, text="temp", age=60):
+    path.write_text(text, encoding="utf-8")
+    modified = time.time() - age
+    os.utime(path, (modified, modified))
+    return path
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    return FolderWatcher(tmp_path, settle_time=2.0)
+
+
+def test_poll_waits_for_files_to_settle(watcher, tmp_path):
+    attendee_file = write_file(tmp_path / "report.csv")
+    write_file(tmp_path / "notes.txt")
+    write_file(tmp_path / ".report.csv")
+
+    # Files are only ready once they are unchanged between polls
+    assert watcher.poll() == []
+    assert watcher.poll() == [attendee_file]
+    # Claimed files are only returned once
+    assert watcher.poll() == []
+
+
+def test_poll_debounces_partial_writes(watcher, tmp_path):
+    attendee_file = write_file(tmp_path / "report.CSV", "partial", age=0)
+
+    assert watcher.poll() == []
+    # Recently modified, so still being written
+    assert watcher.poll() == []
+
+    write_file(attendee_file, "partial report", age=60)
+    assert watcher.poll() == []
+    assert watcher.poll() == [attendee_file]
+
+
+def test_poll_forgets_removed_files(watcher, tmp_path):
+    attendee_file = write_file(tmp_path / "report.csv")
+
+    watcher.poll()
+    attendee_file.unlink()
+
+    assert watcher.poll() == []
+    assert watcher.pending == {}
+
+
+@pytest.mark.parametrize("failed, subfolder", [(False, "done"), (True, "failed")])
+def test_move(watcher, tmp_path, failed, subfolder):
+    for _ in range(2):
+        attendee_file = write_file(tmp_path / "report.csv")
+        watcher.poll()
+        watcher.poll()
+        moved = watcher.move(attendee_file, failed)
+
+    # A file of the same name processed before is not replaced
+    assert moved == tmp_path / subfolder / "report-1.csv"
+    assert sorted(path.name for path in (tmp_path / subfolder).iterdir()) == [
+        "report-1.csv",
+        "report.csv",
+    ]
+    assert not attendee_file.exists()
+    assert watcher.claimed == set()